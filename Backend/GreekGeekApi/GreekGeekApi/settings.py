@@ -70,6 +70,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'Study.middleware.ActivePeriodMemoMiddleware',
 ]
 
 AUTH_USER_MODEL = 'Study.User'
@@ -190,6 +191,35 @@ try:
 except FileNotFoundError:
     STATIC_ASSET_VERSION = os.getenv('STATIC_ASSET_VERSION', '1')
 
+# Cache
+# The dashboard caches org-wide payloads keyed by an org data version (Study/cache.py).
+# Set REDIS_URL in production so every gunicorn worker and host shares those versions;
+# without it each process keeps its own in-memory cache and may serve an org payload up
+# to ORG_CACHE_TIMEOUT old. CACHE_BACKEND/CACHE_LOCATION override either choice.
+REDIS_URL = os.getenv('REDIS_URL', '')
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.redis.RedisCache' if REDIS_URL else 'django.core.cache.backends.locmem.LocMemCache',
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', REDIS_URL or 'greekgeek'),
+    }
+}
+if CACHES['default']['BACKEND'].endswith(('LocMemCache', 'FileBasedCache')):
+    # These cull by scanning every entry once full; leave room for each org's payloads
+    # across a few data versions (Redis evicts on its own)
+    CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', '20000'))}
+ORG_CACHE_TIMEOUT = int(os.getenv('ORG_CACHE_TIMEOUT', '300'))
+# Seconds each worker process reuses an org's active period; 0 disables the process cache
+ACTIVE_PERIOD_CACHE_TIMEOUT = int(os.getenv('ACTIVE_PERIOD_CACHE_TIMEOUT', '30'))
+# Public marketing/support pages are cached rendered and pre-compressed, keyed on path and
+# STATIC_ASSET_VERSION. Template-only changes show up once PAGE_CACHE_TIMEOUT passes unless
+# STATIC_ASSET_VERSION is bumped at deploy.
+PAGE_CACHE_TIMEOUT = int(os.getenv('PAGE_CACHE_TIMEOUT', '3600'))
+# Browser/CDN freshness for those pages; after it they revalidate with If-None-Match
+PAGE_CACHE_MAX_AGE = int(os.getenv('PAGE_CACHE_MAX_AGE', '300'))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -208,6 +238,18 @@ CORS_ALLOW_ALL_ORIGINS = env_bool('CORS_ALLOW_ALL_ORIGINS', DEBUG)
 
 CSRF_TRUSTED_ORIGINS = env_list('CSRF_TRUSTED_ORIGINS')
 
+# Expo push API (Study/push_service.py). Sends are split into 100-message chunks and
+# up to EXPO_PUSH_MAX_WORKERS chunks go out at once; 429s and 5xxs are retried with
+# exponential backoff starting at EXPO_PUSH_RETRY_BACKOFF seconds.
+EXPO_API_URL = os.getenv('EXPO_API_URL', 'https://exp.host/--/api/v2')
+EXPO_PUSH_MAX_WORKERS = int(os.getenv('EXPO_PUSH_MAX_WORKERS', '4'))
+EXPO_PUSH_MAX_RETRIES = int(os.getenv('EXPO_PUSH_MAX_RETRIES', '3'))
+EXPO_PUSH_RETRY_BACKOFF = float(os.getenv('EXPO_PUSH_RETRY_BACKOFF', '0.5'))
+
+# "Someone started studying" pushes queued within this many seconds of the first one
+# go out as a single digest per org (Study/utils.py flush_coalesced_notifications)
+NOTIFICATION_COALESCE_SECONDS = int(os.getenv('NOTIFICATION_COALESCE_SECONDS', '90'))
+
 # Frontend URL for password reset emails
 FRONTEND_URL = os.getenv('FRONTEND_URL', 'http://localhost:8000')  # Default to Django dev server
 
@@ -218,11 +260,17 @@ ZEPTOMAIL_API_URL = os.getenv('ZEPTOMAIL_API_URL', 'https://api.zeptomail.com/v1
 ZEPTOMAIL_TOKEN = os.getenv('ZEPTOMAIL_TOKEN', '')
 DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'no-reply@greekgeek.app')
 CONTACT_TO_EMAIL = os.getenv('CONTACT_TO_EMAIL', 'support@greekgeek.app')
+# Concurrent ZeptoMail requests (and pooled connections) for EmailService.send_many
+EMAIL_MAX_WORKERS = int(os.getenv('EMAIL_MAX_WORKERS', '4'))
 APP_STORE_URL = os.getenv('APP_STORE_URL', 'https://apps.apple.com/us/search?term=GreekGeek')
+# Canonical origin of the public site, used for sitemap.xml (matches the templates' canonical links)
+PUBLIC_SITE_URL = os.getenv('PUBLIC_SITE_URL', 'https://greekgeek.app')
 
 STRIPE_API_KEY = os.getenv('STRIPE_API_KEY', '')
 STRIPE_PUBLISHABLE_KEY = os.getenv('STRIPE_PUBLISHABLE_KEY', '')
 STRIPE_WEBHOOK_SECRET = os.getenv('STRIPE_WEBHOOK_SECRET', '')
+# Point at stripe-mock or another local stand-in; empty means the real Stripe API
+STRIPE_API_BASE = os.getenv('STRIPE_API_BASE', '')
 STRIPE_ORG_PRICE_ID = os.getenv('STRIPE_ORG_PRICE_ID', '')
 STRIPE_BILLING_SUCCESS_URL = os.getenv(
     'STRIPE_BILLING_SUCCESS_URL',
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import User, Org, OrgSettings, Location, Session, PeriodInstance, PeriodSetting, Group, NotificationToken
+from .models import User, Org, OrgSettings, Location, Session, PeriodInstance, PeriodSetting, Group, NotificationToken, UserPeriodHours, QueuedNotification, PushTicket, SentReminder, BillingEvent, JobCheckpoint
 
 # Override the default admin site to only allow superusers
 def superuser_only_has_permission(request):
@@ -18,3 +18,9 @@ admin.site.register(PeriodInstance)
 admin.site.register(PeriodSetting)
 admin.site.register(Group)
 admin.site.register(NotificationToken)
+admin.site.register(UserPeriodHours)
+admin.site.register(QueuedNotification)
+admin.site.register(PushTicket)
+admin.site.register(SentReminder)
+admin.site.register(BillingEvent)
+admin.site.register(JobCheckpoint)
@@ -1,7 +1,9 @@
 from django.apps import AppConfig
 
-"""
+
 class StudyConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'Study'
-"""
\ No newline at end of file
+
+    def ready(self):
+        from . import signals  # noqa: F401
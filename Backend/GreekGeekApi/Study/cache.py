@@ -0,0 +1,138 @@
+from functools import wraps
+import gzip
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+
+try:
+    import brotli
+except ImportError:  # Optional; without it pages are served gzipped
+    brotli = None
+
+# Preferred first when the client accepts several
+PAGE_ENCODINGS = ('br', 'gzip')
+
+
+def _org_version_key(org_id):
+    return f"org:{org_id}:data-version"
+
+
+def org_data_version(org_id):
+    """Return the current data version token for an org, creating one if missing."""
+    key = _org_version_key(org_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def bump_org_data_version(org_id):
+    """
+    Invalidate every payload cached for an org by moving it to a new version.
+
+    Bumps immediately so the writing request never reads its own stale payload, and
+    again on commit so nothing cached from pre-commit data outlives the transaction.
+    """
+    if not org_id:
+        return
+    key = _org_version_key(org_id)
+    cache.set(key, uuid.uuid4().hex, None)
+    transaction.on_commit(lambda: cache.set(key, uuid.uuid4().hex, None))
+
+
+def cached_org_payload(org_id, name, builder, timeout=None):
+    """
+    Return `builder()` cached under the org's current data version.
+
+    Versions are random tokens rather than counters, so a key can never be reused
+    for different data after a cache flush or an id being recycled.
+    """
+    key = f"org:{org_id}:{name}:{org_data_version(org_id)}"
+    payload = cache.get(key)
+    if payload is None:
+        payload = builder()
+        cache.set(key, payload, timeout if timeout is not None else settings.ORG_CACHE_TIMEOUT)
+    return payload
+
+
+def _accepted_encodings(header):
+    accepted = set()
+    for part in header.split(','):
+        name, _, params = part.partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if quality > 0:
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+def build_cached_page(content, content_type):
+    """Pre-compress rendered page bytes once, keyed by content encoding ('' is identity)."""
+    bodies = {'': content, 'gzip': gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        bodies['br'] = brotli.compress(content)
+    return {
+        'content_type': content_type,
+        'digest': hashlib.sha256(content).hexdigest()[:32],
+        'bodies': bodies,
+    }
+
+
+def cached_page_response(request, page):
+    """Serve a cached page in the best encoding the client accepts, or a 304 if its ETag matches."""
+    accepted = _accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    encoding = next(
+        (name for name in PAGE_ENCODINGS if name in page['bodies'] and (name in accepted or '*' in accepted)),
+        '',
+    )
+    # Strong ETags name exact bytes, so each encoding gets its own
+    etag = f'"{page["digest"]}-{encoding}"' if encoding else f'"{page["digest"]}"'
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match and (if_none_match.strip() == '*' or etag in {
+        tag.removeprefix('W/') for tag in parse_etags(if_none_match)
+    }):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(page['bodies'][encoding], content_type=page['content_type'])
+        if encoding:
+            response['Content-Encoding'] = encoding
+    response['ETag'] = etag
+    patch_vary_headers(response, ['Accept-Encoding'])
+    response['Cache-Control'] = f'public, max-age={settings.PAGE_CACHE_MAX_AGE}'
+    return response
+
+
+def cached_page(view):
+    """
+    Cache a public page whose output depends only on its path and STATIC_ASSET_VERSION.
+
+    The first GET renders the view and stores its bytes pre-compressed; later requests
+    are answered from the cache without rendering, with ETag/If-None-Match support.
+    Non-200 responses and other methods always go through the view.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return view(request, *args, **kwargs)
+        key = f"page:{settings.STATIC_ASSET_VERSION}:{request.path}"
+        page = cache.get(key)
+        if page is None:
+            response = view(request, *args, **kwargs)
+            if response.status_code != 200 or response.streaming or response.cookies:
+                return response
+            page = build_cached_page(response.content, response['Content-Type'])
+            cache.set(key, page, settings.PAGE_CACHE_TIMEOUT)
+        return cached_page_response(request, page)
+    return wrapper
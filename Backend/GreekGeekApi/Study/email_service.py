@@ -1,10 +1,18 @@
+from concurrent.futures import ThreadPoolExecutor
 from django.conf import settings
-from django.utils.html import escape
+from django.template.loader import render_to_string
 import requests
+from requests.adapters import HTTPAdapter
 import logging
 
+from .utils import org_timezone
+
 logger = logging.getLogger(__name__)
 
+# One keep-alive connection pool shared by every ZeptoMail request, sized for send_many
+session = requests.Session()
+session.mount('https://', HTTPAdapter(pool_maxsize=max(settings.EMAIL_MAX_WORKERS, 1)))
+
 class EmailService:
     def __init__(self):
         # From-address is configured via DEFAULT_FROM_EMAIL (env: DEFAULT_FROM_EMAIL).
@@ -18,7 +26,7 @@ class EmailService:
         """
         token = settings.ZEPTOMAIL_TOKEN
         auth = token if token.startswith("Zoho-enczapikey") else f"Zoho-enczapikey {token}"
-        resp = requests.post(
+        resp = session.post(
             settings.ZEPTOMAIL_API_URL,
             headers={
                 "Authorization": auth,
@@ -39,137 +47,109 @@ class EmailService:
             logger.error("ZeptoMail API error %s: %s", resp.status_code, resp.text)
             resp.raise_for_status()
     
+    def send_each(self, messages):
+        """
+        Send a batch of emails concurrently over the shared session and return whether
+        each was accepted, in order. Each message is a dict of _send's arguments; failures are logged.
+        """
+        def send(message):
+            try:
+                self._send(**message)
+                return True
+            except Exception:
+                logger.exception("Failed to send %r to %s", message['subject'], message['to_email'])
+                return False
+
+        if not messages:
+            return []
+        with ThreadPoolExecutor(max_workers=min(settings.EMAIL_MAX_WORKERS, len(messages))) as pool:
+            return list(pool.map(send, messages))
+
+    def send_many(self, messages):
+        """Send a batch of emails with send_each and return how many were accepted."""
+        return sum(self.send_each(messages))
+
+    def _render(self, to_email, subject, template_name, context):
+        """
+        Message for _send/send_many from the emails/<template_name>.html and .txt templates.
+        Django's cached template loader compiles each template once per process.
+        """
+        return {
+            'to_email': to_email,
+            'subject': subject,
+            'html_content': render_to_string(f'emails/{template_name}.html', context),
+            'plain_text_content': render_to_string(f'emails/{template_name}.txt', context),
+        }
+
+    def _period_dates(self, org, period_instance):
+        tz = org_timezone(org.timezone)
+        return {
+            'period_start': period_instance.start_date.astimezone(tz),
+            'period_end': period_instance.end_date.astimezone(tz),
+        }
+
+    def progress_report_email(self, recipient_email, org, period_instance, standings):
+        """Admin digest of every member's hours in the org's current period, for send_many."""
+        required_hours = period_instance.period_setting.required_hours
+        context = {
+            'org': org,
+            'required_hours': required_hours,
+            'standings': standings,
+            'met_count': sum(1 for row in standings if row['met_requirement']),
+            'dashboard_url': f"{settings.FRONTEND_URL}/dashboard/",
+            'recipient_email': recipient_email,
+            **self._period_dates(org, period_instance),
+        }
+        return self._render(recipient_email, f"{org.name} study progress report", 'progress_report', context)
+
+    def member_progress_email(self, member, org, period_instance, member_count):
+        """A member's own hours and rank in the org's current period, for send_many."""
+        context = {
+            'member': member,
+            'org': org,
+            'required_hours': period_instance.period_setting.required_hours,
+            'hours_left': max(period_instance.period_setting.required_hours - member['hours'], 0),
+            'member_count': member_count,
+            **self._period_dates(org, period_instance),
+        }
+        return self._render(member['email'], f"Your {org.name} study progress", 'member_progress', context)
+
+    def password_reset_email(self, user_email, reset_token, user_name=None):
+        reset_link = f"{settings.FRONTEND_URL}/reset-password/{reset_token}/"
+        return self._render(user_email, "Reset Your GreekGeek Password", 'password_reset', {
+            'reset_link': reset_link,
+            'user_name': user_name,
+            'user_email': user_email,
+        })
+
+    def password_reset_confirmation_email(self, user_email, user_name=None):
+        return self._render(user_email, "Your GreekGeek Password Has Been Reset", 'password_reset_confirmation', {
+            'user_name': user_name,
+            'user_email': user_email,
+        })
+
+    def email_verification_email(self, user_email, verification_token, user_name=None):
+        verification_link = f"{settings.FRONTEND_URL}/verify-email/{verification_token}/"
+        return self._render(user_email, "Verify Your GreekGeek Email", 'email_verification', {
+            'verification_link': verification_link,
+            'user_name': user_name,
+        })
+
+    def contact_email(self, name, reply_to_email, topic, message, organization=''):
+        return self._render(settings.CONTACT_TO_EMAIL, f"GreekGeek contact form: {topic}", 'contact', {
+            'name': name,
+            'reply_to_email': reply_to_email,
+            'topic': topic,
+            'message': message,
+            'organization': organization,
+        })
+
     def send_password_reset_email(self, user_email, reset_token, user_name=None):
         """
         Send password reset email to user
         """
         try:
-            # Create the reset link
-            reset_link = f"{settings.FRONTEND_URL}/reset-password/{reset_token}/"
-            
-            # Prepare email content
-            subject = "Reset Your GreekGeek Password"
-            
-            # HTML content
-            html_content = f"""
-            <!DOCTYPE html>
-            <html>
-            <head>
-                <meta charset="UTF-8">
-                <meta name="viewport" content="width=device-width, initial-scale=1.0">
-                <title>Reset Your Password</title>
-                <style>
-                    body {{
-                        font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, Oxygen, Ubuntu, Cantarell, sans-serif;
-                        line-height: 1.6;
-                        color: #333;
-                        max-width: 600px;
-                        margin: 0 auto;
-                        padding: 20px;
-                    }}
-                    .header {{
-                        text-align: center;
-                        padding: 20px 0;
-                        border-bottom: 2px solid #0d6efd;
-                        margin-bottom: 30px;
-                    }}
-                    .logo {{
-                        font-size: 28px;
-                        font-weight: bold;
-                        color: #0d6efd;
-                    }}
-                    .content {{
-                        padding: 20px 0;
-                    }}
-                    .button {{
-                        display: inline-block;
-                        padding: 12px 30px;
-                        background-color: #0d6efd;
-                        color: white;
-                        text-decoration: none;
-                        border-radius: 5px;
-                        font-weight: bold;
-                        margin: 20px 0;
-                    }}
-                    .footer {{
-                        margin-top: 40px;
-                        padding-top: 20px;
-                        border-top: 1px solid #eee;
-                        font-size: 14px;
-                        color: #666;
-                        text-align: center;
-                    }}
-                    .warning {{
-                        background-color: #fff3cd;
-                        border: 1px solid #ffeaa7;
-                        border-radius: 5px;
-                        padding: 15px;
-                        margin: 20px 0;
-                    }}
-                    @media (max-width: 480px) {{
-                        body {{
-                            padding: 10px;
-                        }}
-                        .button {{
-                            display: block;
-                            text-align: center;
-                            width: 100%;
-                            box-sizing: border-box;
-                        }}
-                    }}
-                </style>
-            </head>
-            <body>
-                <div class="header">
-                    <div class="logo">📚 GreekGeek</div>
-                </div>
-                
-                <div class="content">
-                    <h2>Reset Your Password</h2>
-                    <p>Hello{f', {user_name}' if user_name else ''}!</p>
-                    
-                    <p>We received a request to reset your password for your GreekGeek account. If you made this request, click the button below to reset your password:</p>
-                    
-                    <p style="text-align: center;">
-                        <a href="{reset_link}" class="button">Reset Password</a>
-                    </p>
-                    
-                    <p>If the button doesn't work, you can copy and paste this link into your browser:</p>
-                    <p style="word-break: break-all; background-color: #f8f9fa; padding: 10px; border-radius: 5px; font-family: monospace;">
-                        {reset_link}
-                    </p>
-                    
-                    <div class="warning">
-                        <strong>⚠️ Important:</strong> This link will expire in 1 hour for security reasons. If you didn't request this password reset, you can safely ignore this email.
-                    </div>
-                </div>
-                
-                <div class="footer">
-                    <p>© 2024 GreekGeek. All rights reserved.</p>
-                    <p>This email was sent to {user_email}. If you have any questions, please contact our support team.</p>
-                </div>
-            </body>
-            </html>
-            """
-            
-            # Plain text version
-            plain_text_content = f"""
-            Reset Your GreekGeek Password
-            
-            Hello{f', {user_name}' if user_name else ''}!
-            
-            We received a request to reset your password for your GreekGeek account. 
-            If you made this request, click the link below to reset your password:
-            
-            {reset_link}
-            
-            Important: This link will expire in 1 hour for security reasons. 
-            If you didn't request this password reset, you can safely ignore this email.
-            
-            © 2024 GreekGeek. All rights reserved.
-            """
-            
-            self._send(user_email, subject, html_content, plain_text_content)
+            self._send(**self.password_reset_email(user_email, reset_token, user_name))
             logger.info(f"Password reset email sent to {user_email}.")
             return True
 
@@ -182,96 +162,7 @@ class EmailService:
         Send confirmation email after password has been successfully reset
         """
         try:
-            subject = "Your GreekGeek Password Has Been Reset"
-            
-            html_content = f"""
-            <!DOCTYPE html>
-            <html>
-            <head>
-                <meta charset="UTF-8">
-                <meta name="viewport" content="width=device-width, initial-scale=1.0">
-                <title>Password Reset Confirmation</title>
-                <style>
-                    body {{
-                        font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, Oxygen, Ubuntu, Cantarell, sans-serif;
-                        line-height: 1.6;
-                        color: #333;
-                        max-width: 600px;
-                        margin: 0 auto;
-                        padding: 20px;
-                    }}
-                    .header {{
-                        text-align: center;
-                        padding: 20px 0;
-                        border-bottom: 2px solid #198754;
-                        margin-bottom: 30px;
-                    }}
-                    .logo {{
-                        font-size: 28px;
-                        font-weight: bold;
-                        color: #198754;
-                    }}
-                    .content {{
-                        padding: 20px 0;
-                    }}
-                    .success {{
-                        background-color: #d1edff;
-                        border: 1px solid #74c0fc;
-                        border-radius: 5px;
-                        padding: 15px;
-                        margin: 20px 0;
-                        text-align: center;
-                    }}
-                    .footer {{
-                        margin-top: 40px;
-                        padding-top: 20px;
-                        border-top: 1px solid #eee;
-                        font-size: 14px;
-                        color: #666;
-                        text-align: center;
-                    }}
-                </style>
-            </head>
-            <body>
-                <div class="header">
-                    <div class="logo">📚 GreekGeek</div>
-                </div>
-                
-                <div class="content">
-                    <h2>Password Reset Successful</h2>
-                    <p>Hello{f', {user_name}' if user_name else ''}!</p>
-                    
-                    <div class="success">
-                        <strong>✅ Your password has been successfully reset!</strong>
-                    </div>
-                    
-                    <p>Your GreekGeek account password has been updated. You can now log in with your new password.</p>
-                    
-                    <p>If you did not make this change, please contact our support team immediately.</p>
-                </div>
-                
-                <div class="footer">
-                    <p>© 2024 GreekGeek. All rights reserved.</p>
-                    <p>This email was sent to {user_email}.</p>
-                </div>
-            </body>
-            </html>
-            """
-            
-            plain_text_content = f"""
-            Password Reset Successful
-            
-            Hello{f', {user_name}' if user_name else ''}!
-            
-            Your GreekGeek account password has been successfully reset. 
-            You can now log in with your new password.
-            
-            If you did not make this change, please contact our support team immediately.
-            
-            © 2024 GreekGeek. All rights reserved.
-            """
-            
-            self._send(user_email, subject, html_content, plain_text_content)
+            self._send(**self.password_reset_confirmation_email(user_email, user_name))
             logger.info(f"Password reset confirmation email sent to {user_email}.")
             return True
 
@@ -282,47 +173,7 @@ class EmailService:
     def send_email_verification_email(self, user_email, verification_token, user_name=None):
         """Send the organization admin email verification link."""
         try:
-            verification_link = f"{settings.FRONTEND_URL}/verify-email/{verification_token}/"
-            subject = "Verify Your GreekGeek Email"
-
-            html_content = f"""
-            <!DOCTYPE html>
-            <html>
-            <head>
-                <meta charset="UTF-8">
-                <meta name="viewport" content="width=device-width, initial-scale=1.0">
-                <title>Verify Your Email</title>
-            </head>
-            <body style="font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', sans-serif; line-height: 1.6; color: #333; max-width: 600px; margin: 0 auto; padding: 20px;">
-                <div style="text-align: center; padding: 20px 0; border-bottom: 2px solid #0d6efd; margin-bottom: 30px;">
-                    <div style="font-size: 28px; font-weight: bold; color: #0d6efd;">GreekGeek</div>
-                </div>
-                <h2>Verify your email</h2>
-                <p>Hello{f', {escape(user_name)}' if user_name else ''}!</p>
-                <p>Confirm this email address to finish setting up your GreekGeek admin account and start your organization trial.</p>
-                <p style="text-align: center;">
-                    <a href="{verification_link}" style="display: inline-block; padding: 12px 30px; background-color: #0d6efd; color: white; text-decoration: none; border-radius: 5px; font-weight: bold;">Verify Email</a>
-                </p>
-                <p>If the button does not work, copy and paste this link into your browser:</p>
-                <p style="word-break: break-all; background-color: #f8f9fa; padding: 10px; border-radius: 5px; font-family: monospace;">{verification_link}</p>
-                <p>This link expires in 24 hours. If you did not create a GreekGeek organization, you can ignore this email.</p>
-            </body>
-            </html>
-            """
-
-            plain_text_content = f"""
-            Verify your GreekGeek email
-
-            Hello{f', {user_name}' if user_name else ''}!
-
-            Confirm this email address to finish setting up your GreekGeek admin account and start your organization trial:
-
-            {verification_link}
-
-            This link expires in 24 hours. If you did not create a GreekGeek organization, you can ignore this email.
-            """
-
-            self._send(user_email, subject, html_content, plain_text_content)
+            self._send(**self.email_verification_email(user_email, verification_token, user_name))
             logger.info("Email verification sent to %s.", user_email)
             return True
 
@@ -333,46 +184,7 @@ class EmailService:
     def send_contact_email(self, name, reply_to_email, topic, message, organization=''):
         """Send a public contact form submission to GreekGeek support."""
         try:
-            safe_name = escape(name)
-            safe_reply_to_email = escape(reply_to_email)
-            safe_topic = escape(topic)
-            safe_organization = escape(organization or 'Not provided')
-            safe_message = escape(message).replace('\n', '<br>')
-            subject = f"GreekGeek contact form: {topic}"
-
-            html_content = f"""
-            <!DOCTYPE html>
-            <html>
-            <head>
-                <meta charset="UTF-8">
-                <meta name="viewport" content="width=device-width, initial-scale=1.0">
-                <title>GreekGeek Contact Form</title>
-            </head>
-            <body style="font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', sans-serif; line-height: 1.6; color: #0b0f0e;">
-                <h2>New GreekGeek contact form submission</h2>
-                <p><strong>Name:</strong> {safe_name}</p>
-                <p><strong>Email:</strong> {safe_reply_to_email}</p>
-                <p><strong>Organization:</strong> {safe_organization}</p>
-                <p><strong>Topic:</strong> {safe_topic}</p>
-                <h3>Message</h3>
-                <p>{safe_message}</p>
-            </body>
-            </html>
-            """
-
-            plain_text_content = f"""
-            New GreekGeek contact form submission
-
-            Name: {name}
-            Email: {reply_to_email}
-            Organization: {organization or 'Not provided'}
-            Topic: {topic}
-
-            Message:
-            {message}
-            """
-
-            self._send(settings.CONTACT_TO_EMAIL, subject, html_content, plain_text_content)
+            self._send(**self.contact_email(name, reply_to_email, topic, message, organization))
             logger.info("Contact form email sent for %s", reply_to_email)
             return True
 
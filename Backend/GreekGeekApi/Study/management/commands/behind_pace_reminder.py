@@ -0,0 +1,73 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from Study.models import NotificationToken, SentReminder
+from Study.push_service import send_reminders
+from Study.utils import members_behind_pace, org_timezone
+
+
+class Command(BaseCommand):
+    help = (
+        "Nudges members who are behind pace mid-period: fewer hours than --threshold times "
+        "required_hours scaled by how much of the period has passed. Each member is nudged "
+        "at most once per period, so this can run as often as hourly."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threshold', type=float, default=0.5, help='Fraction of the expected hours below which a member is behind')
+        parser.add_argument('--min-elapsed', type=float, default=0.25, help='Skip periods less than this fraction through')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        behind = {
+            user_id: (instance, hours, expected)
+            for user_id, instance, hours, expected in members_behind_pace(now, options['threshold'], options['min_elapsed'])
+        }
+        self.stdout.write(f"Found {len(behind)} members behind pace")
+        if not behind:
+            return
+
+        instances = {instance.id: instance for instance, _, _ in behind.values()}
+        already_reminded = SentReminder.objects.filter(
+            user_id=OuterRef('user_id'),
+            period_instance_id__in=instances,
+            kind=SentReminder.KIND_BEHIND_PACE,
+        )
+        # Tokens for the whole of each org, matched to the behind members here, keeps
+        # tens of thousands of user ids out of the query
+        tokens = NotificationToken.objects.filter(
+            is_active=True,
+            user__org_id__in={instance.period_setting.org_id for instance in instances.values()},
+            user__notify_study_deadline_approaching=True,
+        ).exclude(Exists(already_reminded)).values_list('user_id', 'token')
+
+        reminders = {}
+        for user_id, token in tokens:
+            if user_id not in behind:
+                continue
+            instance, hours, expected = behind[user_id]
+            setting = instance.period_setting
+            due_date = instance.end_date.astimezone(org_timezone(setting.org.timezone)).date()
+            reminders.setdefault(user_id, (instance.id, []))[1].append({
+                'to': token,
+                'title': "You're Falling Behind",
+                'body': (
+                    f"You've logged {hours:.1f} of {setting.required_hours:g} required hours, and the period "
+                    f"ends on {due_date.strftime('%B %d')}. A study session today will help you catch up!"
+                ),
+                'data': {
+                    "type": "behind_pace",
+                    "hours": round(hours, 2),
+                    "expected_hours": round(expected, 2),
+                    "required_hours": setting.required_hours,
+                    "end_date": due_date.isoformat(),
+                },
+                'sound': 'default',
+            })
+
+        reminded, sent, failed = send_reminders(SentReminder.KIND_BEHIND_PACE, reminders)
+        self.stdout.write(
+            self.style.SUCCESS(f"Sent {sent} reminders to {reminded} users")
+            if not failed
+            else self.style.ERROR(f"Sent {sent} reminders to {reminded} users; {failed} failed")
+        )
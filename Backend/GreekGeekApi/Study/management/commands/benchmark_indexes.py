@@ -0,0 +1,177 @@
+import time
+import uuid
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, models, transaction
+from django.utils import timezone
+
+from Study.models import NotificationToken, Org, PeriodInstance, PeriodSetting, Session, User
+
+
+class _Rollback(Exception):
+    pass
+
+
+# Indexes added for the hot queries below, by model
+BENCHMARKED_INDEXES = {
+    Session: ['session_user_start_idx', 'session_org_start_idx'],
+    PeriodInstance: ['periodinst_setting_start_idx'],
+    NotificationToken: ['notiftoken_user_active_idx'],
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Seeds a large dataset and prints EXPLAIN plans and timings for the hot Session, '
+        'PeriodInstance and NotificationToken queries without and with their indexes. '
+        'Everything, including dropping the indexes, is rolled back. Do not run against '
+        'production: dropping an index locks its table until the run finishes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orgs', type=int, default=20)
+        parser.add_argument('--members', type=int, default=50, help='Members per org')
+        parser.add_argument('--sessions-per-member', type=int, default=200)
+        parser.add_argument('--repeat', type=int, default=5, help='Runs timed per query')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def run(self, options):
+        org, user, period_setting = self.seed(options['orgs'], options['members'], options['sessions_per_member'])
+        queries = self.hot_queries(org, user, period_setting)
+
+        self.drop_indexes()
+        before = self.measure(queries, options['repeat'])
+        self.create_indexes()
+        after = self.measure(queries, options['repeat'])
+
+        for label in queries:
+            self.stdout.write(self.style.MIGRATE_HEADING(f"\n{label}"))
+            for phase, results in (('without indexes', before), ('with indexes', after)):
+                plan, best_ms = results[label]
+                self.stdout.write(f"  {phase}: {best_ms:.2f} ms")
+                for line in plan.splitlines():
+                    self.stdout.write(f"    {line}")
+
+    def benchmarked_indexes(self):
+        for model, names in BENCHMARKED_INDEXES.items():
+            for index in model._meta.indexes:
+                if index.name in names:
+                    yield model, index
+
+    def drop_indexes(self):
+        with connection.cursor() as cursor:
+            for _, index in self.benchmarked_indexes():
+                cursor.execute(f"DROP INDEX {connection.ops.quote_name(index.name)}")
+
+    def create_indexes(self):
+        # Plain DDL: the schema editor context can't be entered mid-transaction on SQLite
+        schema_editor = connection.SchemaEditorClass(connection)
+        with connection.cursor() as cursor:
+            for model, index in self.benchmarked_indexes():
+                cursor.execute(str(index.create_sql(model, schema_editor)))
+
+    def analyze(self):
+        # Give the planner statistics for the freshly seeded rows
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def measure(self, queries, repeat):
+        self.analyze()
+        results = {}
+        for label, queryset in queries.items():
+            plan = queryset.explain()
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                list(queryset.all())
+                timings.append(time.perf_counter() - started)
+            results[label] = (plan, min(timings) * 1000)
+        return results
+
+    def hot_queries(self, org, user, period_setting):
+        now = timezone.now()
+        return {
+            'Session(user, start_time): calculate_user_hours': Session.objects.filter(
+                user=user, hours__isnull=False,
+            ).values('user').annotate(total=models.Sum('hours')).order_by(),
+            'Session(user, start_time): user session history': Session.objects.filter(
+                user=user,
+            ).order_by('-start_time')[:50],
+            'Session(org, start_time): backfill_sessions_for_instance': Session.objects.filter(
+                org=org,
+                start_time__gte=now - timedelta(days=7),
+                start_time__lte=now,
+                period_instance__isnull=True,
+            ).order_by(),
+            'PeriodInstance(period_setting, start_date): org period list': PeriodInstance.objects.filter(
+                period_setting__org=org,
+            ).order_by('-start_date'),
+            'PeriodInstance(period_setting, is_active): active instance': PeriodInstance.objects.filter(
+                period_setting=period_setting, is_active=True,
+            ),
+            'NotificationToken(user, is_active): push audience': NotificationToken.objects.filter(
+                user=user, is_active=True,
+            ).values_list('token', flat=True),
+        }
+
+    def seed(self, org_count, member_count, sessions_per_member):
+        suffix = uuid.uuid4().hex[:8]
+        now = timezone.now()
+        self.stdout.write(
+            f"Seeding {org_count} orgs x {member_count} members x {sessions_per_member} sessions..."
+        )
+
+        orgs = Org.objects.bulk_create([
+            Org(name=f"Benchmark {index}", reg_code=f"BENCH-{suffix}-{index}", school="Benchmark")
+            for index in range(org_count)
+        ])
+        settings = PeriodSetting.objects.bulk_create([
+            PeriodSetting(org=org, period_type='weekly', due_day_of_week=6, required_hours=2,
+                          start_date=now - timedelta(weeks=104))
+            for org in orgs
+        ])
+        PeriodInstance.objects.bulk_create([
+            PeriodInstance(
+                period_setting=setting,
+                start_date=now - timedelta(weeks=104 - week),
+                end_date=now - timedelta(weeks=103 - week),
+                is_active=week == 103,
+            )
+            for setting in settings
+            for week in range(104)
+        ], batch_size=1000)
+        users = User.objects.bulk_create([
+            User(email=f"member{index}-{org.id}-{suffix}@example.com", org=org, password='!')
+            for org in orgs
+            for index in range(member_count)
+        ], batch_size=1000)
+        NotificationToken.objects.bulk_create([
+            NotificationToken(user=user, token=f"ExponentPushToken[{suffix}-{user.id}-{device}]",
+                              device_id=str(device), is_active=device == 0)
+            for user in users
+            for device in range(2)
+        ], batch_size=1000)
+
+        batch = []
+        for user in users:
+            for index in range(sessions_per_member):
+                batch.append(Session(
+                    user=user,
+                    org_id=user.org_id,
+                    start_time=now - timedelta(days=730) * index / sessions_per_member,
+                    hours=1.0,
+                ))
+            if len(batch) >= 10000:
+                Session.objects.bulk_create(batch, batch_size=1000)
+                batch = []
+        Session.objects.bulk_create(batch, batch_size=1000)
+
+        return orgs[0], users[0], settings[0]
@@ -0,0 +1,119 @@
+import time
+import uuid
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from Study.models import Group, Org, OrgSettings, PeriodInstance, PeriodSetting, Session, User
+from Study.utils import rebuild_period_hours
+from Study.views import OrgReportView
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Times /api/org-report/ against synthetic orgs of increasing size; all data is rolled back'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--members',
+            type=int,
+            nargs='+',
+            default=[25, 50, 100, 200],
+            help='Org sizes to benchmark',
+        )
+        parser.add_argument(
+            '--sessions-per-member',
+            type=int,
+            default=100,
+            help='Historical sessions created for each member',
+        )
+        parser.add_argument('--repeat', type=int, default=3, help='Requests timed per org size')
+        parser.add_argument('--stream', action='store_true', help='Benchmark the ?stream=1 mode')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'members':>8} {'sessions':>9} {'queries':>8} {'best ms':>9} {'ms/member':>10}")
+        for member_count in options['members']:
+            try:
+                with transaction.atomic():
+                    self.benchmark(member_count, options['sessions_per_member'], options['repeat'], options['stream'])
+                    raise _Rollback
+            except _Rollback:
+                pass
+
+    def benchmark(self, member_count, sessions_per_member, repeat, stream):
+        admin, session_count = self.seed_org(member_count, sessions_per_member)
+        view = OrgReportView.as_view()
+        factory = APIRequestFactory()
+
+        timings = []
+        query_count = None
+        for _ in range(repeat):
+            request = factory.get(reverse('org-report'), {'stream': '1'} if stream else {})
+            force_authenticate(request, user=admin)
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = view(request)
+                if stream:
+                    for _ in response.streaming_content:
+                        pass
+                else:
+                    response.render()
+                timings.append(time.perf_counter() - started)
+            query_count = len(queries)
+
+        best_ms = min(timings) * 1000
+        self.stdout.write(
+            f"{member_count:>8} {session_count:>9} {query_count:>8} {best_ms:>9.1f} {best_ms / member_count:>10.2f}"
+        )
+
+    def seed_org(self, member_count, sessions_per_member):
+        suffix = uuid.uuid4().hex[:8]
+        now = timezone.now()
+        org = Org.objects.create(name=f"Benchmark {suffix}", reg_code=f"BENCH-{suffix}", school="Benchmark")
+        OrgSettings.objects.create(org=org)
+        group = Group.objects.create(org=org, name="Members")
+        period_setting = PeriodSetting.objects.create(
+            org=org,
+            period_type='weekly',
+            due_day_of_week=6,
+            required_hours=2,
+            start_date=now - timedelta(days=3),
+        )
+        period_instance = PeriodInstance.objects.create(
+            period_setting=period_setting,
+            start_date=now - timedelta(days=3),
+            end_date=now + timedelta(days=4),
+            is_active=True,
+        )
+
+        admin = User(email=f"admin-{suffix}@example.com", org=org, is_staff=True)
+        admin.set_unusable_password()
+        admin.save()
+        members = User.objects.bulk_create([
+            User(email=f"member{index}-{suffix}@example.com", org=org, group=group, password='!')
+            for index in range(member_count)
+        ])
+
+        sessions = []
+        for member in members:
+            for index in range(sessions_per_member):
+                # Spread sessions back over two years, with the newest in the current period
+                start_time = now - timedelta(hours=1) - timedelta(days=730) * index / sessions_per_member
+                sessions.append(Session(
+                    user=member,
+                    org=org,
+                    start_time=start_time,
+                    hours=1.0,
+                    period_instance=period_instance if start_time >= period_instance.start_date else None,
+                ))
+        Session.objects.bulk_create(sessions, batch_size=1000)
+        rebuild_period_hours([period_instance.id])
+        return admin, len(sessions)
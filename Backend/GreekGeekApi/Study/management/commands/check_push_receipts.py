@@ -0,0 +1,19 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from Study.push_service import check_push_receipts
+
+
+class Command(BaseCommand):
+    help = (
+        'Fetches Expo push receipts in bulk and deactivates tokens for devices that are no '
+        'longer registered. Expo publishes receipts within about 15 minutes and keeps them '
+        'for a day, so schedule this every 15-30 minutes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-age', type=int, default=15, help='Only check tickets at least this many minutes old')
+
+    def handle(self, *args, **options):
+        checked, deactivated = check_push_receipts(min_age=timedelta(minutes=options['min_age']))
+        self.stdout.write(self.style.SUCCESS(f'Checked {checked} push receipts, deactivated {deactivated} tokens'))
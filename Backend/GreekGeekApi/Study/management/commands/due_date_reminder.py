@@ -1,63 +1,88 @@
+from datetime import timedelta
+
 from django.core.management.base import BaseCommand
+from django.db.models import Exists, OuterRef
 from django.utils import timezone
-from Study.models import PeriodInstance, User
-from Study.utils import send_notification_to_users
-from datetime import timedelta
+from Study.models import NotificationToken, PeriodInstance, SentReminder
+from Study.push_service import send_reminders
+from Study.utils import org_timezone
+
+
+def due_phrase(days_left):
+    if days_left == 0:
+        return "today"
+    if days_left == 1:
+        return "tomorrow"
+    return f"in {days_left} days"
+
 
 class Command(BaseCommand):
-    help = 'Sends notifications to users whose study period is ending in 3 days'
-
-    def handle(self, *args, **kwargs):
-        # Get current datetime and datetime in 3 days
-        today = timezone.now().replace(microsecond=0)
-        tomorrow = (today + timedelta(days=1)).replace(microsecond=0)
-        
-        self.stdout.write(f"Checking for periods ending on {tomorrow}")
-        
-        # Find all periods ending in 3 days
-        ending_periods = PeriodInstance.objects.filter(
-            end_date__contains=tomorrow.date()
+    help = (
+        "Reminds members whose study period is due within --days days, counted in each "
+        "org's timezone. Every reminder is recorded in SentReminder, so running this more "
+        "than once a day (or re-running after a failure) never notifies anyone twice."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=1, help='Remind members whose period is due within this many days')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        days = options['days']
+
+        # Every active period ending soon, across all orgs, with its org in one query.
+        # The window is padded a day so timezones ahead of UTC are covered; the exact
+        # cut is made below on each org's local calendar.
+        candidates = PeriodInstance.objects.filter(
+            is_active=True,
+            period_setting__is_active=True,
+            end_date__gt=now,
+            end_date__lte=now + timedelta(days=days + 1),
+        ).select_related('period_setting__org')
+
+        due_by_org = {}
+        for instance in candidates:
+            org = instance.period_setting.org
+            tz = org_timezone(org.timezone)
+            due_date = instance.end_date.astimezone(tz).date()
+            days_left = (due_date - now.astimezone(tz).date()).days
+            if 0 <= days_left <= days:
+                due_by_org[org.id] = (instance, due_date, days_left)
+
+        self.stdout.write(f"Found {len(due_by_org)} periods due within {days} days")
+        if not due_by_org:
+            return
+
+        # Recipients: active tokens of opted-in members not yet reminded about this period
+        instance_ids = [instance.id for instance, _, _ in due_by_org.values()]
+        already_reminded = SentReminder.objects.filter(
+            user_id=OuterRef('user_id'),
+            period_instance_id__in=instance_ids,
+            kind=SentReminder.KIND_DUE_SOON,
+        )
+        recipients = NotificationToken.objects.filter(
+            is_active=True,
+            user__org_id__in=due_by_org,
+            user__notify_study_deadline_approaching=True,
+        ).exclude(Exists(already_reminded)).values_list('user_id', 'user__org_id', 'token')
+
+        reminders = {}
+        for user_id, org_id, token in recipients:
+            instance, due_date, days_left = due_by_org[org_id]
+            reminders.setdefault(user_id, (instance.id, []))[1].append({
+                'to': token,
+                'title': "Study Period Ending Soon",
+                'body': (
+                    f"Your current study period ends {due_phrase(days_left)} on "
+                    f"{due_date.strftime('%B %d, %Y')}. Make sure to complete your study requirements!"
+                ),
+                'data': {"type": "period_ending", "end_date": due_date.isoformat()},
+                'sound': 'default',
+            })
+
+        reminded, sent, failed = send_reminders(SentReminder.KIND_DUE_SOON, reminders)
+        self.stdout.write(
+            self.style.SUCCESS(f"Sent {sent} reminders to {reminded} users")
+            if not failed
+            else self.style.ERROR(f"Sent {sent} reminders to {reminded} users; {failed} failed")
         )
-        
-        self.stdout.write(f"Found {ending_periods.count()} periods ending in 3 days")
-
-        # Group by organization to send notifications efficiently
-        for period in ending_periods:
-            org = period.period_setting.org
-            period = period.period_setting
-            self.stdout.write(f"\nProcessing period for organization: {org.name}")
-            
-            # Get all users in this organization
-            users = User.objects.filter(
-                org=org
-            )
-            
-            if not users.exists():
-                self.stdout.write(self.style.WARNING(f"No active users found for {org.name}"))
-                continue
-                
-            self.stdout.write(f"Found {users.count()} active users in {org.name}")
-
-            user_ids = list(users.values_list('id', flat=True))
-            
-            # Send notification to all users in this org
-            self.stdout.write(f"Attempting to send notifications to {len(user_ids)} users...")
-            
-            notification_result = send_notification_to_users(
-                user_ids=user_ids,
-                title="Study Period Ending Soon",
-                body=f"Your current study period ends in 3 days on {tomorrow.strftime('%B %d, %Y')}. Make sure to complete your study requirements!",
-                data={
-                    "type": "period_ending",
-                    "end_date": tomorrow.isoformat()
-                },
-                notification_type="study_deadline_approaching"
-            )
-            
-            self.stdout.write(f"Notification result: {notification_result}")
-
-            self.stdout.write(
-                self.style.SUCCESS(f'Successfully sent notifications to {len(user_ids)} users in {period.org.name}')
-                if "error" not in notification_result
-                else self.style.ERROR(f'Failed to send notifications to users in {period.org.name}: {notification_result["error"]}')
-            )
\ No newline at end of file
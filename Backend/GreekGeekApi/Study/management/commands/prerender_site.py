@@ -0,0 +1,54 @@
+from pathlib import Path
+import shutil
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.template.loader import render_to_string
+from django.test import RequestFactory
+from django.urls import resolve
+from Study.cache import build_cached_page
+from Study.web_views import prerendered_page_paths
+
+# Written next to each page so nginx gzip_static/brotli_static can serve them as-is
+ENCODING_SUFFIXES = {'': '', 'gzip': '.gz', 'br': '.br'}
+
+
+def write_page(path, content, content_type):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    for encoding, body in build_cached_page(content, content_type)['bodies'].items():
+        Path(f'{path}{ENCODING_SUFFIXES[encoding]}').write_bytes(body)
+
+
+class Command(BaseCommand):
+    help = (
+        'Renders the landing, legal, compare and support pages to <path>/index.html files '
+        '(with pre-compressed copies) plus sitemap.xml under STATIC_ROOT/site, so nginx can '
+        'serve them without Django. Run after collectstatic on every deploy.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help='Directory to write into (default: STATIC_ROOT/site)')
+
+    def handle(self, *args, **options):
+        output = Path(options['output'] or Path(settings.STATIC_ROOT) / 'site')
+        if output.exists() and any(output.iterdir()) and not (output / 'sitemap.xml').exists():
+            raise CommandError(f'{output} is not a prerender_site output directory; refusing to clear it')
+        # Start clean so removed articles and comparisons stop being served
+        shutil.rmtree(output, ignore_errors=True)
+
+        factory = RequestFactory()
+        paths = prerendered_page_paths()
+        for url_path in paths:
+            match = resolve(url_path)
+            # Render fresh rather than from the page cache, which may hold the previous release
+            view = getattr(match.func, '__wrapped__', match.func)
+            response = view(factory.get(url_path), *match.args, **match.kwargs)
+            if response.status_code != 200:
+                raise CommandError(f'{url_path} rendered with status {response.status_code}')
+            write_page(output / url_path.strip('/') / 'index.html', response.content, response['Content-Type'])
+
+        site_url = settings.PUBLIC_SITE_URL.rstrip('/')
+        sitemap = render_to_string('sitemap.xml', {'urls': [f'{site_url}{url_path}' for url_path in paths]})
+        write_page(output / 'sitemap.xml', sitemap.encode(), 'application/xml')
+
+        self.stdout.write(self.style.SUCCESS(f'Prerendered {len(paths)} pages and sitemap.xml to {output}'))
@@ -0,0 +1,35 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from Study.views import process_billing_events
+
+
+class Command(BaseCommand):
+    help = (
+        'Applies Stripe webhook events recorded by the webhook, in order per org. Runs until '
+        'nothing is pending, or with --loop keeps polling (run it that way as a service).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--max-attempts', type=int, default=5)
+        parser.add_argument('--loop', action='store_true', help='Keep polling instead of exiting when nothing is pending')
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds to sleep between polls with --loop')
+
+    def handle(self, *args, **options):
+        if not settings.STRIPE_API_KEY:
+            raise CommandError('STRIPE_API_KEY is not set')
+        total = 0
+        while True:
+            applied = process_billing_events(options['batch_size'], options['max_attempts'])
+            total += applied
+            if applied:
+                # An org's later events only become eligible once its earlier ones are applied;
+                # failed events wait for the next poll
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(f'Processed {total} billing events'))
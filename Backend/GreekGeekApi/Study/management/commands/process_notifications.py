@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+from Study.utils import process_queued_notifications
+
+
+class Command(BaseCommand):
+    help = (
+        'Sends queued push notifications. Runs until the queue is empty, or with --loop keeps '
+        'polling (run it that way as a service so notifications go out within seconds). '
+        '"Started studying" pushes are held for NOTIFICATION_COALESCE_SECONDS and sent as one '
+        'digest per org.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--max-attempts', type=int, default=5)
+        parser.add_argument('--loop', action='store_true', help='Keep polling instead of exiting when the queue is empty')
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds to sleep between polls with --loop')
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            handled = process_queued_notifications(options['batch_size'], options['max_attempts'])
+            total += handled
+            if handled == options['batch_size']:
+                # Probably more waiting; failed rows are retried on the next poll
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(f'Processed {total} queued notifications'))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+from Study.models import PeriodInstance
+from Study.utils import backfill_sessions_for_instance, period_hours_drift, rebuild_period_hours
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the per-user, per-period study hours rollup from sessions, or checks it for drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Only report rollup rows that differ from the sessions; exits non-zero on drift',
+        )
+
+    def handle(self, *args, **options):
+        if options['check']:
+            drift = period_hours_drift()
+            for user_id, period_instance_id, stored, actual in drift:
+                self.stdout.write(
+                    f"user={user_id} period_instance={period_instance_id} stored={stored} actual={actual}"
+                )
+            if drift:
+                raise CommandError(f"Found {len(drift)} drifted rollup rows")
+            self.stdout.write(self.style.SUCCESS('Hours rollup matches sessions'))
+            return
+
+        # Attach sessions that predate period tracking before aggregating
+        for instance in PeriodInstance.objects.select_related('period_setting__org').order_by('start_date'):
+            backfill_sessions_for_instance(instance)
+
+        rows = rebuild_period_hours()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rows} hours rollup rows'))
@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+import stripe
+from Study.views import configure_stripe, reconcile_stripe_subscriptions
+
+
+class Command(BaseCommand):
+    help = (
+        'Re-syncs every org\'s Stripe billing state from one paginated listing of all '
+        'subscriptions, catching anything the webhook missed. Safe to run nightly.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report what would change without saving')
+        parser.add_argument('--batch-size', type=int, default=500, help='Orgs per bulk_update query')
+
+    def handle(self, *args, **options):
+        if not settings.STRIPE_API_KEY:
+            raise CommandError('STRIPE_API_KEY is not set')
+        configure_stripe()
+        try:
+            subscriptions = stripe.Subscription.list(status='all', limit=100).auto_paging_iter()
+            listed, matched, updated = reconcile_stripe_subscriptions(
+                subscriptions, dry_run=options['dry_run'], batch_size=options['batch_size'],
+            )
+        except stripe.error.StripeError as e:
+            raise CommandError(f'Listing Stripe subscriptions failed: {e}')
+
+        verb = 'Would update' if options['dry_run'] else 'Updated'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {updated} of {matched} orgs matched to {listed} Stripe subscriptions'
+        ))
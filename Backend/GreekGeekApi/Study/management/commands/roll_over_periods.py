@@ -0,0 +1,55 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Max, Q
+from django.utils import timezone
+from Study.models import PeriodSetting
+from Study.utils import prepare_next_period_instance, roll_over_period_instance
+
+
+class Command(BaseCommand):
+    help = (
+        "Prepares the next study period for every org whose active period ends within "
+        "--lookahead minutes, and switches over every org whose active period has ended. "
+        "Periods end at midnight in the org's timezone, so schedule this every 15 minutes "
+        "(e.g. cron '*/15 * * * *'); requests after an org's local midnight then read the "
+        "prepared period instead of creating it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lookahead', type=int, default=60,
+            help='Prepare the next period this many minutes before the current one ends; keep it above the cron interval',
+        )
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+
+        # One query finds every active setting whose current period is ending soon, over or missing
+        due_settings = PeriodSetting.objects.filter(
+            is_active=True,
+            start_date__lte=now,
+        ).annotate(
+            active_end_date=Max('instances__end_date', filter=Q(instances__is_active=True)),
+        ).filter(
+            Q(active_end_date__lt=now + timedelta(minutes=options['lookahead'])) | Q(active_end_date__isnull=True),
+        ).select_related('org')
+
+        rolled_over = 0
+        prepared = 0
+        for period_setting in due_settings:
+            try:
+                if period_setting.active_end_date and period_setting.active_end_date >= now:
+                    instance = prepare_next_period_instance(period_setting, period_setting.active_end_date)
+                    if instance:
+                        prepared += 1
+                        self.stdout.write(f"{period_setting.org.name}: prepared next period {instance}")
+                    continue
+                instance = roll_over_period_instance(period_setting, now)
+            except ValueError as e:
+                self.stdout.write(self.style.ERROR(f"Could not roll over {period_setting}: {e}"))
+                continue
+            rolled_over += 1
+            self.stdout.write(f"{period_setting.org.name}: active period is now {instance}")
+
+        self.stdout.write(self.style.SUCCESS(f"Rolled over {rolled_over} period settings, prepared {prepared} next periods"))
@@ -0,0 +1,85 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from Study.email_service import EmailService
+from Study.models import OrgSettings, add_months
+from Study.utils import active_period_instances, org_period_standings
+
+# Cron drift allowance, so a daily 08:00 run doesn't skip a report sent at 08:00:05
+SCHEDULE_SLACK = timedelta(hours=1)
+
+
+def progress_report_due(org_settings, now):
+    last_sent = org_settings.progress_report_sent_at
+    if last_sent is None:
+        return True
+    frequency = org_settings.progress_report_frequency
+    if frequency == 'daily':
+        next_due = last_sent + timedelta(days=1)
+    elif frequency == 'weekly':
+        next_due = last_sent + timedelta(weeks=1)
+    elif frequency == 'monthly':
+        next_due = add_months(last_sent, 1)
+    else:
+        return False
+    return now >= next_due - SCHEDULE_SLACK
+
+
+class Command(BaseCommand):
+    help = (
+        "Emails period progress reports to the admins of every org with send_progress_reports "
+        "on, at each org's progress_report_frequency. Schedule daily; orgs that aren't due are "
+        "skipped. Standings for all orgs come from one grouped query."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--members', action='store_true', help='Also email each member their own progress')
+        parser.add_argument('--force', action='store_true', help='Ignore the schedule and report for every opted-in org')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        due_settings = {
+            org_settings.org_id: org_settings
+            for org_settings in OrgSettings.objects.filter(send_progress_reports=True).exclude(
+                progress_report_frequency='never',
+            ).select_related('org')
+            if options['force'] or progress_report_due(org_settings, now)
+        }
+        if not due_settings:
+            self.stdout.write(self.style.SUCCESS("No progress reports due"))
+            return
+
+        instances = active_period_instances(now, org_ids=due_settings)
+        standings = org_period_standings(instances)
+
+        email_service = EmailService()
+        messages = []
+        message_orgs = []
+        for org_id, instance in instances.items():
+            org = due_settings[org_id].org
+            rows = standings[org_id]
+            for row in rows:
+                if row['is_staff']:
+                    messages.append(email_service.progress_report_email(row['email'], org, instance, rows))
+                    message_orgs.append(org_id)
+                if options['members']:
+                    messages.append(email_service.member_progress_email(row, org, instance, len(rows)))
+                    message_orgs.append(org_id)
+
+        accepted = email_service.send_each(messages)
+        sent = sum(accepted)
+        # An org with any failed email stays due, so the next run retries its report
+        failed_orgs = {org_id for org_id, ok in zip(message_orgs, accepted) if not ok}
+        OrgSettings.objects.filter(org_id__in=set(instances) - failed_orgs).update(progress_report_sent_at=now)
+
+        skipped = len(due_settings) - len(instances)
+        if skipped:
+            self.stdout.write(self.style.WARNING(f"Skipped {skipped} orgs with no active period"))
+        if failed_orgs:
+            self.stdout.write(self.style.WARNING(f"{len(failed_orgs)} orgs had failed emails and stay due"))
+        self.stdout.write(
+            self.style.SUCCESS(f"Sent {sent} progress report emails for {len(instances)} orgs")
+            if sent == len(messages)
+            else self.style.ERROR(f"Sent {sent} of {len(messages)} progress report emails for {len(instances)} orgs")
+        )
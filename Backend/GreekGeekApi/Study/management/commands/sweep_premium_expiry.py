@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from Study.views import sweep_premium_expiry
+
+
+class Command(BaseCommand):
+    help = (
+        'Recomputes is_premium for orgs whose RevenueCat entitlement, Stripe period end or '
+        'trial has ended since the last sweep, so premium checks stay a column read. '
+        'Schedule every few minutes; each run only looks at expiries since the one before.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Orgs per bulk_update query')
+
+    def handle(self, *args, **options):
+        checked, changed = sweep_premium_expiry(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Checked {checked} orgs with passed expiries, updated {changed}'))
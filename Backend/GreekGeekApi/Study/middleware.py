@@ -0,0 +1,12 @@
+from .utils import active_period_scope
+
+
+class ActivePeriodMemoMiddleware:
+    """Share one active period lookup per org across everything a request does."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with active_period_scope():
+            return self.get_response(request)
@@ -0,0 +1,65 @@
+# Generated by Django 5.1.2 on 2026-10-18 04:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def populate_user_period_hours(apps, schema_editor):
+    PeriodInstance = apps.get_model('Study', 'PeriodInstance')
+    Session = apps.get_model('Study', 'Session')
+    UserPeriodHours = apps.get_model('Study', 'UserPeriodHours')
+
+    # Attach sessions that predate period tracking to the instance covering them
+    for instance in PeriodInstance.objects.select_related('period_setting').order_by('start_date'):
+        Session.objects.filter(
+            org_id=instance.period_setting.org_id,
+            start_time__gte=instance.start_date,
+            start_time__lte=instance.end_date,
+            period_instance__isnull=True,
+        ).update(period_instance=instance)
+
+    totals = Session.objects.filter(
+        period_instance__isnull=False,
+        hours__isnull=False,
+    ).values('user_id', 'period_instance_id').annotate(
+        total=models.Sum('hours'),
+        count=models.Count('id'),
+        last=models.Max('start_time'),
+    )
+    UserPeriodHours.objects.bulk_create([
+        UserPeriodHours(
+            user_id=row['user_id'],
+            period_instance_id=row['period_instance_id'],
+            total_hours=row['total'],
+            session_count=row['count'],
+            last_session_at=row['last'],
+        )
+        for row in totals.iterator()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Study', '0031_org_stripe_period_cancel_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserPeriodHours',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_hours', models.FloatField(default=0)),
+                ('session_count', models.PositiveIntegerField(default=0)),
+                ('last_session_at', models.DateTimeField(blank=True, null=True)),
+                ('period_instance', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='user_hours', to='Study.periodinstance')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='period_hours', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'user period hours',
+                'unique_together': {('user', 'period_instance')},
+            },
+        ),
+        migrations.RunPython(populate_user_period_hours, migrations.RunPython.noop),
+    ]
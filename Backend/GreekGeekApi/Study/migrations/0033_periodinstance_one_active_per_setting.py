@@ -0,0 +1,29 @@
+from django.db import migrations, models
+
+
+def deactivate_duplicate_active_instances(apps, schema_editor):
+    PeriodInstance = apps.get_model('Study', 'PeriodInstance')
+    # Keep only the most recent active instance of each setting
+    seen_settings = set()
+    stale_ids = []
+    for instance in PeriodInstance.objects.filter(is_active=True).order_by('period_setting_id', '-start_date', '-id'):
+        if instance.period_setting_id in seen_settings:
+            stale_ids.append(instance.id)
+        else:
+            seen_settings.add(instance.period_setting_id)
+    PeriodInstance.objects.filter(id__in=stale_ids).update(is_active=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Study', '0032_userperiodhours'),
+    ]
+
+    operations = [
+        migrations.RunPython(deactivate_duplicate_active_instances, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='periodinstance',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_active', True)), fields=('period_setting',), name='one_active_instance_per_period_setting'),
+        ),
+    ]
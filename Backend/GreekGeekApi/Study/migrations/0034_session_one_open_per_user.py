@@ -0,0 +1,56 @@
+from django.db import migrations, models
+
+
+def close_duplicate_open_sessions(apps, schema_editor):
+    Session = apps.get_model('Study', 'Session')
+    UserPeriodHours = apps.get_model('Study', 'UserPeriodHours')
+
+    # Keep each user's most recent open session; older ones were abandoned double clock-ins
+    seen_users = set()
+    stale = []
+    for session in Session.objects.filter(hours__isnull=True).order_by('user_id', '-start_time', '-id'):
+        if session.user_id in seen_users:
+            stale.append(session)
+        else:
+            seen_users.add(session.user_id)
+    if not stale:
+        return
+
+    # Close them with zero hours rather than deleting study history
+    Session.objects.filter(id__in=[session.id for session in stale]).update(hours=0.0)
+
+    # Their rollup rows now count one more zero-hour session each
+    for user_id, period_instance_id in {(s.user_id, s.period_instance_id) for s in stale if s.period_instance_id}:
+        totals = Session.objects.filter(
+            user_id=user_id,
+            period_instance_id=period_instance_id,
+            hours__isnull=False,
+        ).aggregate(
+            total=models.Sum('hours'),
+            count=models.Count('id'),
+            last=models.Max('start_time'),
+        )
+        UserPeriodHours.objects.update_or_create(
+            user_id=user_id,
+            period_instance_id=period_instance_id,
+            defaults={
+                'total_hours': totals['total'] or 0.0,
+                'session_count': totals['count'],
+                'last_session_at': totals['last'],
+            },
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Study', '0033_periodinstance_one_active_per_setting'),
+    ]
+
+    operations = [
+        migrations.RunPython(close_duplicate_open_sessions, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='session',
+            constraint=models.UniqueConstraint(condition=models.Q(('hours__isnull', True)), fields=('user',), name='one_open_session_per_user'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.2 on 2026-10-18 05:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Study', '0034_session_one_open_per_user'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notificationtoken',
+            index=models.Index(fields=['user', 'is_active'], include=('token',), name='notiftoken_user_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='periodinstance',
+            index=models.Index(fields=['period_setting', 'start_date'], name='periodinst_setting_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='session',
+            index=models.Index(fields=['user', 'start_time'], include=('hours',), name='session_user_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='session',
+            index=models.Index(fields=['org', 'start_time'], name='session_org_start_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.2 on 2026-10-18 05:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Study', '0035_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueuedNotification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_ids', models.JSONField(blank=True, default=list)),
+                ('title', models.CharField(max_length=255)),
+                ('body', models.TextField()),
+                ('data', models.JSONField(blank=True, null=True)),
+                ('notification_type', models.CharField(blank=True, max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('org', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='queued_notifications', to='Study.org')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('sent_at__isnull', True)), fields=['created_at'], name='queuednotif_pending_idx')],
+            },
+        ),
+    ]
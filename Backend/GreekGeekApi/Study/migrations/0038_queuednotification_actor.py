@@ -0,0 +1,20 @@
+# Generated by Django 5.1.2 on 2026-10-18 05:39
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Study', '0037_pushticket'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='queuednotification',
+            name='actor',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
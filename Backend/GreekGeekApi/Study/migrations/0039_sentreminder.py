@@ -0,0 +1,28 @@
+# Generated by Django 5.1.2 on 2026-10-18 05:45
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Study', '0038_queuednotification_actor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SentReminder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('due_soon', 'Period due soon')], max_length=32)),
+                ('sent_at', models.DateTimeField(auto_now_add=True)),
+                ('period_instance', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sent_reminders', to='Study.periodinstance')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sent_reminders', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'period_instance', 'kind'), name='one_reminder_per_user_period_kind')],
+            },
+        ),
+    ]
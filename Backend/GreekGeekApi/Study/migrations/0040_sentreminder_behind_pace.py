@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-18 05:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Study', '0039_sentreminder'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='sentreminder',
+            name='kind',
+            field=models.CharField(choices=[('due_soon', 'Period due soon'), ('behind_pace', 'Behind study pace')], max_length=32),
+        ),
+    ]
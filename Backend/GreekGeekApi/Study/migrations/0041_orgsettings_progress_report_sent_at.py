@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-18 05:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Study', '0040_sentreminder_behind_pace'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orgsettings',
+            name='progress_report_sent_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.2 on 2026-10-18 06:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Study', '0041_orgsettings_progress_report_sent_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BillingEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stripe_event_id', models.CharField(max_length=255, unique=True)),
+                ('event_type', models.CharField(max_length=128)),
+                ('stripe_created', models.DateTimeField()),
+                ('payload', models.JSONField()),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('org', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='billing_events', to='Study.org')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('processed_at__isnull', True)), fields=['stripe_created', 'id'], name='billingevent_pending_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.2 on 2026-10-18 06:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Study', '0042_billingevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64, unique=True)),
+                ('last_run_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='org',
+            index=models.Index(fields=['revenuecat_entitlement_expires_at'], name='org_rc_expires_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='org',
+            index=models.Index(fields=['stripe_current_period_end'], name='org_stripe_period_end_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='org',
+            index=models.Index(fields=['trial_ends_at'], name='org_trial_ends_idx'),
+        ),
+    ]
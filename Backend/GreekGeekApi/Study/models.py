@@ -29,6 +29,12 @@ class Org(models.Model):
 
     class Meta:
         ordering = ['id']
+        # Range-scanned by sweep_premium_expiry
+        indexes = [
+            models.Index(fields=["revenuecat_entitlement_expires_at"], name="org_rc_expires_idx"),
+            models.Index(fields=["stripe_current_period_end"], name="org_stripe_period_end_idx"),
+            models.Index(fields=["trial_ends_at"], name="org_trial_ends_idx"),
+        ]
 
     def __str__(self):
         return self.name
@@ -50,6 +56,7 @@ class OrgSettings(models.Model):
     reminder_frequency = models.CharField(max_length=10, choices=FREQUENCY_CHOICES, default='daily')
     send_progress_reports = models.BooleanField(default=True)
     progress_report_frequency = models.CharField(max_length=10, choices=FREQUENCY_CHOICES, default='weekly')
+    progress_report_sent_at = models.DateTimeField(blank=True, null=True)  # Set by send_progress_reports
     require_password_reset_days = models.PositiveIntegerField(default=90)
     session_timeout_minutes = models.PositiveIntegerField(default=30)
     allow_multiple_devices = models.BooleanField(default=True)
@@ -76,6 +83,17 @@ from django.utils.timezone import now
 from datetime import timedelta
 import uuid
 
+def days_until_weekday(from_date, weekday):
+    """Days from from_date to the next given weekday (0=Monday), always 1-7."""
+    return (weekday - from_date.weekday() - 1) % 7 + 1
+
+
+def add_months(value, months):
+    """Shift a date or datetime by whole calendar months, keeping the day of month."""
+    month_index = value.month - 1 + months
+    return value.replace(year=value.year + month_index // 12, month=month_index % 12 + 1)
+
+
 class PeriodSetting(models.Model):
     PERIOD_CHOICES = [
         ('weekly', 'Weekly'),
@@ -102,15 +120,9 @@ class PeriodSetting(models.Model):
         from_date = from_date or self.start_date
         from_date = from_date.replace(hour=0, minute=0, second=0, microsecond=0)
         if self.period_type == "weekly":
-            days_until_due = (self.due_day_of_week - from_date.weekday()) % 7
-            if days_until_due == 0:
-                days_until_due = 7
-            return from_date + timedelta(days=days_until_due)
+            return from_date + timedelta(days=days_until_weekday(from_date, self.due_day_of_week))
         elif self.period_type == "monthly":
-            if from_date.month == 12:
-                return from_date.replace(year=from_date.year + 1, month=1)
-            else:
-                return from_date.replace(month=from_date.month + 1)
+            return add_months(from_date, 1)
         elif self.period_type == "custom" and self.custom_days:
             return from_date + timedelta(days=self.custom_days)
         return None
@@ -125,6 +137,19 @@ class PeriodInstance(models.Model):
     end_date = models.DateTimeField()
     is_active = models.BooleanField(default=True)
 
+    class Meta:
+        constraints = [
+            # Also serves the (period_setting, is_active=True) lookup
+            models.UniqueConstraint(
+                fields=["period_setting"],
+                condition=models.Q(is_active=True),
+                name="one_active_instance_per_period_setting"
+            )
+        ]
+        indexes = [
+            models.Index(fields=["period_setting", "start_date"], name="periodinst_setting_start_idx"),
+        ]
+
     def __str__(self):
         return f"{self.period_setting.period_type} ({self.start_date.date()} - {self.end_date.date()})"
 
@@ -200,10 +225,41 @@ class Session(models.Model):
 
     class Meta:
         ordering = ['id']
+        constraints = [
+            # A user has at most one in-progress session; also indexes the open-session lookup
+            models.UniqueConstraint(
+                fields=["user"],
+                condition=models.Q(hours__isnull=True),
+                name="one_open_session_per_user"
+            )
+        ]
+        indexes = [
+            # Covers per-user hour totals without visiting the table on PostgreSQL
+            models.Index(fields=["user", "start_time"], include=["hours"], name="session_user_start_idx"),
+            models.Index(fields=["org", "start_time"], name="session_org_start_idx"),
+        ]
         
     def __str__(self):
         return f"Session {self.id} by {self.user.first_name} {self.user.last_name}"
 
+class UserPeriodHours(models.Model):
+    """
+    Rollup of a user's completed study hours per period instance, kept in step with
+    Session writes so read paths don't have to aggregate raw sessions.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="period_hours")
+    period_instance = models.ForeignKey(PeriodInstance, on_delete=models.CASCADE, related_name="user_hours")
+    total_hours = models.FloatField(default=0)
+    session_count = models.PositiveIntegerField(default=0)
+    last_session_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ('user', 'period_instance')
+        verbose_name_plural = "user period hours"
+
+    def __str__(self):
+        return f"{self.user} - {self.total_hours:.2f}h in {self.period_instance}"
+
 # Location Model
 class Location(models.Model):
     name = models.CharField(max_length=255)
@@ -243,10 +299,110 @@ class NotificationToken(models.Model):
 
     class Meta:
         unique_together = ('user', 'device_id')
+        indexes = [
+            models.Index(fields=["user", "is_active"], include=["token"], name="notiftoken_user_active_idx"),
+        ]
 
     def __str__(self):
         return f"{self.user.email} - {self.token[:10]}..."
 
+class QueuedNotification(models.Model):
+    """
+    Push notification outbox. Rows are written in the same transaction as the change
+    that triggers them and sent by the process_notifications worker, so requests never
+    wait on Expo.
+    """
+    # Recipients: the listed users, or every member of org when set
+    user_ids = models.JSONField(default=list, blank=True)
+    org = models.ForeignKey(Org, on_delete=models.CASCADE, related_name='queued_notifications', null=True, blank=True)
+    # Member whose action an org notification announces; they are left out of the audience
+    actor = models.ForeignKey(User, on_delete=models.SET_NULL, related_name='+', null=True, blank=True)
+    title = models.CharField(max_length=255)
+    body = models.TextField()
+    data = models.JSONField(blank=True, null=True)
+    notification_type = models.CharField(max_length=64, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["created_at"], condition=models.Q(sent_at__isnull=True), name="queuednotif_pending_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.title} ({'sent' if self.sent_at else 'pending'})"
+
+class PushTicket(models.Model):
+    """
+    An Expo push ticket waiting for its receipt. check_push_receipts reads the receipts
+    in bulk and deactivates tokens whose device is no longer registered.
+    """
+    receipt_id = models.CharField(max_length=64, unique=True)
+    token = models.CharField(max_length=255)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.receipt_id} - {self.token[:10]}..."
+
+class SentReminder(models.Model):
+    """
+    Ledger of scheduled reminders already sent, one row per user, period and kind,
+    so reminder jobs can be rerun without notifying anyone twice.
+    """
+    KIND_DUE_SOON = 'due_soon'
+    KIND_BEHIND_PACE = 'behind_pace'
+    KIND_CHOICES = [
+        (KIND_DUE_SOON, 'Period due soon'),
+        (KIND_BEHIND_PACE, 'Behind study pace'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_reminders')
+    period_instance = models.ForeignKey(PeriodInstance, on_delete=models.CASCADE, related_name='sent_reminders')
+    kind = models.CharField(max_length=32, choices=KIND_CHOICES)
+    sent_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "period_instance", "kind"], name="one_reminder_per_user_period_kind"),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} reminder for {self.user.email} ({self.period_instance})"
+
+class BillingEvent(models.Model):
+    """
+    Ledger of verified Stripe webhook events. The unique event id makes redeliveries
+    no-ops; process_billing_events applies pending events oldest first, one org at a time.
+    """
+    stripe_event_id = models.CharField(max_length=255, unique=True)
+    event_type = models.CharField(max_length=128)
+    # Resolved when the event arrives, to keep each org's events in order
+    org = models.ForeignKey(Org, on_delete=models.SET_NULL, related_name='billing_events', null=True, blank=True)
+    stripe_created = models.DateTimeField()
+    payload = models.JSONField()
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(blank=True, null=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["stripe_created", "id"], condition=models.Q(processed_at__isnull=True), name="billingevent_pending_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} {self.stripe_event_id} ({'processed' if self.processed_at else 'pending'})"
+
+class JobCheckpoint(models.Model):
+    """When a scheduled job last completed, so its next run only looks at what changed since."""
+    name = models.CharField(max_length=64, unique=True)
+    last_run_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.name} at {self.last_run_at}"
+
 class PasswordResetToken(models.Model):
     """
     Stores password reset tokens for users
@@ -0,0 +1,230 @@
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+import requests
+from requests.adapters import HTTPAdapter
+
+from .models import NotificationToken, PushTicket, SentReminder
+
+logger = logging.getLogger(__name__)
+
+# Expo rejects push requests with more than 100 messages and receipt
+# requests with more than 1000 ids.
+PUSH_CHUNK_SIZE = 100
+RECEIPT_CHUNK_SIZE = 1000
+# Four parameters a row keeps each claim insert well under the database's parameter limit
+CLAIM_CHUNK_SIZE = 500
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+# Expo only keeps receipts for a day; tickets older than this can never be checked.
+RECEIPT_RETENTION = timedelta(days=1)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Keep-alive session shared by every push request, sized for the sender pool."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                pool_size = max(settings.EXPO_PUSH_MAX_WORKERS, 1)
+                session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+                session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+                session.headers.update({
+                    'Accept': 'application/json',
+                    'Accept-Encoding': 'gzip, deflate',
+                })
+                _session = session
+    return _session
+
+
+def chunked(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _retry_delay(response, attempt):
+    retry_after = response.headers.get('Retry-After') if response is not None else None
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    return settings.EXPO_PUSH_RETRY_BACKOFF * (2 ** attempt)
+
+
+def _post(path, payload):
+    """POST to the Expo API, retrying connection errors, 429s and 5xxs with backoff."""
+    url = f"{settings.EXPO_API_URL.rstrip('/')}/{path}"
+    max_retries = settings.EXPO_PUSH_MAX_RETRIES
+    for attempt in range(max_retries + 1):
+        response = None
+        try:
+            response = get_session().post(url, json=payload, timeout=15)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == max_retries:
+                raise
+        else:
+            if response.status_code not in RETRY_STATUS_CODES:
+                response.raise_for_status()
+                return response.json()
+            if attempt == max_retries:
+                response.raise_for_status()
+        time.sleep(_retry_delay(response, attempt))
+
+
+def _map_chunks(fn, chunks):
+    if len(chunks) <= 1:
+        return [fn(chunk) for chunk in chunks]
+    with ThreadPoolExecutor(max_workers=min(settings.EXPO_PUSH_MAX_WORKERS, len(chunks))) as pool:
+        return list(pool.map(fn, chunks))
+
+
+def _send_chunk(messages):
+    try:
+        tickets = _post('push/send', messages).get('data', [])
+    except (requests.RequestException, ValueError) as e:
+        logger.error("Expo push request for %d messages failed: %s", len(messages), e)
+        return [
+            {'status': 'error', 'message': str(e), 'details': {'error': 'RequestFailed'}}
+            for _ in messages
+        ]
+    if len(tickets) != len(messages):
+        logger.error("Expo returned %d tickets for %d messages", len(tickets), len(messages))
+    return tickets
+
+
+def transport_failed(ticket):
+    """
+    Whether a ticket stands for a message that never reached Expo because its chunk
+    failed after retries. Unlike Expo's own error tickets, these are worth sending again.
+    """
+    return (ticket.get('details') or {}).get('error') == 'RequestFailed'
+
+
+def send_push_messages(messages):
+    """
+    Send Expo push messages, each addressed to a single token, and return one ticket per message.
+
+    Messages go out in chunks of 100 over the shared session, several chunks at a time.
+    Accepted tickets are stored so check_push_receipts can read their receipts later;
+    tokens Expo already reports as DeviceNotRegistered are deactivated straight away.
+    A chunk that still fails after retries gets RequestFailed error tickets; see transport_failed.
+    """
+    messages = list(messages)
+    tickets = []
+    for chunk_tickets in _map_chunks(_send_chunk, list(chunked(messages, PUSH_CHUNK_SIZE))):
+        tickets.extend(chunk_tickets)
+
+    pending = []
+    unregistered = set()
+    for message, ticket in zip(messages, tickets):
+        if ticket.get('status') == 'ok' and ticket.get('id'):
+            pending.append(PushTicket(receipt_id=ticket['id'], token=message['to']))
+        elif (ticket.get('details') or {}).get('error') == 'DeviceNotRegistered':
+            unregistered.add(message['to'])
+    PushTicket.objects.bulk_create(pending, ignore_conflicts=True)
+    deactivate_tokens(unregistered)
+    return tickets
+
+
+def claim_reminders(kind, instance_by_user):
+    """
+    Insert a SentReminder row of the given kind for each user_id -> period_instance_id
+    and return the user ids whose row this call created. Rows another run already
+    holds are skipped by ON CONFLICT DO NOTHING, so two overlapping runs never both
+    claim the same reminder.
+    """
+    meta = SentReminder._meta
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(meta.get_field(name).column) for name in ('user', 'period_instance', 'kind', 'sent_at'))
+    sent_at = meta.get_field('sent_at').get_db_prep_value(timezone.now(), connection)
+    claimed = set()
+    with connection.cursor() as cursor:
+        for chunk in chunked(list(instance_by_user.items()), CLAIM_CHUNK_SIZE):
+            cursor.execute(
+                f"INSERT INTO {quote(meta.db_table)} ({columns}) "
+                f"VALUES {', '.join(['(%s, %s, %s, %s)'] * len(chunk))} "
+                f"ON CONFLICT DO NOTHING RETURNING {quote(meta.get_field('user').column)}",
+                [value for user_id, instance_id in chunk for value in (user_id, instance_id, kind, sent_at)],
+            )
+            claimed.update(user_id for user_id, in cursor.fetchall())
+    return claimed
+
+
+def send_reminders(kind, reminders):
+    """
+    Send scheduled reminders at most once per user, period and kind.
+
+    reminders maps user_id -> (period_instance_id, messages). Ledger rows are claimed
+    before anything is sent and only users whose row this run created are notified,
+    so a crash mid-send skips a reminder rather than repeating it. Users none of whose
+    messages reached Expo have their claim released, so the next run retries them.
+    Returns (users reminded, messages sent, messages failed).
+    """
+    claimed = claim_reminders(kind, {user_id: instance_id for user_id, (instance_id, _) in reminders.items()})
+    recipients = [user_id for user_id in claimed for _ in reminders[user_id][1]]
+    messages = [message for user_id in claimed for message in reminders[user_id][1]]
+    tickets = send_push_messages(messages) if messages else []
+    failed = sum(1 for ticket in tickets if ticket.get('status') != 'ok')
+
+    undelivered = Counter(user_id for user_id, ticket in zip(recipients, tickets) if transport_failed(ticket))
+    released = {user_id for user_id, count in undelivered.items() if count == len(reminders[user_id][1])}
+    if released:
+        released_rows = Q()
+        for user_id in released:
+            released_rows |= Q(user_id=user_id, period_instance_id=reminders[user_id][0])
+        SentReminder.objects.filter(released_rows, kind=kind).delete()
+    return len(claimed) - len(released), len(messages) - failed, failed
+
+
+def deactivate_tokens(tokens):
+    if not tokens:
+        return 0
+    return NotificationToken.objects.filter(token__in=tokens, is_active=True).update(is_active=False)
+
+
+def _fetch_receipts(ids):
+    return _post('push/getReceipts', {'ids': ids}).get('data', {})
+
+
+def check_push_receipts(min_age=timedelta(minutes=15)):
+    """
+    Fetch receipts for stored push tickets older than min_age and deactivate every token
+    whose receipt is DeviceNotRegistered. Returns (receipts checked, tokens deactivated).
+
+    Checked tickets are deleted; tickets Expo has no receipt for yet are kept until
+    RECEIPT_RETENTION has passed.
+    """
+    now = timezone.now()
+    tickets = dict(
+        PushTicket.objects.filter(created_at__lte=now - min_age).values_list('receipt_id', 'token')
+    )
+    if not tickets:
+        return 0, 0
+
+    receipts = {}
+    for chunk_receipts in _map_chunks(_fetch_receipts, list(chunked(list(tickets), RECEIPT_CHUNK_SIZE))):
+        receipts.update(chunk_receipts)
+
+    unregistered = {
+        tickets[receipt_id]
+        for receipt_id, receipt in receipts.items()
+        if receipt_id in tickets and (receipt.get('details') or {}).get('error') == 'DeviceNotRegistered'
+    }
+    deactivated = deactivate_tokens(unregistered)
+
+    for receipt_ids in chunked(list(receipts), RECEIPT_CHUNK_SIZE):
+        PushTicket.objects.filter(receipt_id__in=receipt_ids).delete()
+    PushTicket.objects.filter(created_at__lt=now - RECEIPT_RETENTION).delete()
+    return len(receipts), deactivated
@@ -4,6 +4,7 @@ from .models import User, Org, OrgSettings, Location, Session, PeriodSetting, Pe
 from django.conf import settings
 from django.utils import timezone
 from .utils import get_or_create_period_instance
+from .cache import bump_org_data_version
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 import boto3
 from botocore.config import Config
@@ -148,6 +149,8 @@ class CreateGroupSerializer(serializers.ModelSerializer):
             
             # Assign users to this group
             users.update(group=group)
+            # Queryset updates skip the post_save signals that invalidate cached org data
+            bump_org_data_version(current_user.org_id)
         
         return group
 
@@ -195,6 +198,9 @@ class UpdateGroupSerializer(serializers.ModelSerializer):
                 
                 # Assign users to this group
                 users.update(group=instance)
+
+            # Queryset updates skip the post_save signals that invalidate cached org data
+            bump_org_data_version(current_user.org_id)
         
         return instance
 
@@ -225,14 +231,18 @@ class UserSerializer(serializers.ModelSerializer):
         region_name = getattr(settings, 'AWS_S3_REGION_NAME', None)
         if not bucket_name or not region_name:
             return None
-        client = boto3.client(
-            's3',
-            region_name=region_name,
-            endpoint_url=getattr(settings, 'AWS_S3_ENDPOINT_URL', None),
-            aws_access_key_id=getattr(settings, 'AWS_ACCESS_KEY_ID', None),
-            aws_secret_access_key=getattr(settings, 'AWS_SECRET_ACCESS_KEY', None),
-            config=Config(signature_version=getattr(settings, 'AWS_S3_SIGNATURE_VERSION', 's3v4')),
-        )
+        # Share one client across a many=True serialization instead of building one per user
+        client = self.context.get('s3_client')
+        if client is None:
+            client = boto3.client(
+                's3',
+                region_name=region_name,
+                endpoint_url=getattr(settings, 'AWS_S3_ENDPOINT_URL', None),
+                aws_access_key_id=getattr(settings, 'AWS_ACCESS_KEY_ID', None),
+                aws_secret_access_key=getattr(settings, 'AWS_SECRET_ACCESS_KEY', None),
+                config=Config(signature_version=getattr(settings, 'AWS_S3_SIGNATURE_VERSION', 's3v4')),
+            )
+            self.context['s3_client'] = client
         return client.generate_presigned_url(
             'get_object',
             Params={'Bucket': bucket_name, 'Key': obj.profile_picture_key},
@@ -278,6 +288,14 @@ class UpdateUserSerializer(UserSerializer):
     password = serializers.CharField(min_length=8, write_only=True, required=False)
     registration_code = serializers.CharField(write_only=True, required=False)
 
+class OrgMemberSerializer(UserSerializer):
+    """Read-only member row for leaderboards; expects users from org_members_with_hours()."""
+    group = GroupSerializer(read_only=True)
+    total_hours = serializers.FloatField(read_only=True)
+
+    class Meta(UserSerializer.Meta):
+        fields = UserSerializer.Meta.fields + ('group', 'total_hours')
+
 class SessionSerializer(serializers.ModelSerializer):
     period_instance = PeriodInstanceSerializer(read_only=True)
     
@@ -330,111 +348,119 @@ class NotificationTokenSerializer(serializers.ModelSerializer):
         # Create new token
         return NotificationToken.objects.create(user=user, **validated_data)
 
-class UserDashboardSerializer(serializers.ModelSerializer):
-    org = OrgSerializer(read_only=True)
-    org_locations = LocationSerializer(source='org.locations', many=True, read_only=True)
+class OrgDashboardSerializer(serializers.ModelSerializer):
+    """
+    Org-wide part of the dashboard, identical for every member of the org.
+    Expects the current period instance in context['period_instance'].
+    """
+    org = OrgSerializer(source='*', read_only=True)
+    org_locations = LocationSerializer(source='locations', many=True, read_only=True)
     org_users = serializers.SerializerMethodField()
-    user_sessions = SessionSerializer(source='sessions', many=True, read_only=True)
     org_period_instances = serializers.SerializerMethodField()
     active_period_setting = serializers.SerializerMethodField()
+    org_groups = serializers.SerializerMethodField()
+    org_settings = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Org
+        fields = ('org', 'org_locations', 'org_users', 'org_period_instances',
+                  'active_period_setting', 'org_groups', 'org_settings')
+
+    # Shape of the org part for users that don't belong to an org
+    EMPTY = {
+        'org': None,
+        'org_locations': [],
+        'org_users': [],
+        'org_period_instances': None,
+        'active_period_setting': None,
+        'org_groups': [],
+        'org_settings': None,
+    }
+
+    def get_org_settings(self, obj):
+        settings, _ = OrgSettings.objects.get_or_create(org=obj)
+        return OrgSettingsSerializer(settings).data
+
+    def get_org_groups(self, obj):
+        groups = Group.objects.filter(org=obj)
+        return GroupSerializer(groups, many=True).data
+
+    def get_org_users(self, obj):
+        from .utils import org_members_with_hours
+
+        # Members, groups and period hours come from one grouped query
+        users = org_members_with_hours(obj, self.context.get('period_instance'))
+        return OrgMemberSerializer(users, many=True, context=self.context).data
+
+    def get_org_period_instances(self, obj):
+        instances = PeriodInstance.objects.filter(
+            period_setting__org=obj
+        ).order_by('-start_date')
+        return PeriodInstanceSerializer(instances, many=True).data
+
+    def get_active_period_setting(self, obj):
+        from .utils import resolve_active_period
+
+        setting, _ = resolve_active_period(obj.id)
+        if setting is None:
+            return None
+        return PeriodSettingSerializer(setting).data
+
+class UserDashboardSerializer(serializers.ModelSerializer):
+    """
+    Dashboard payload for one user. The per-user fields are computed live; the org-wide
+    fields come from OrgDashboardSerializer, cached per org data version.
+    """
+    user_sessions = SessionSerializer(source='sessions', many=True, read_only=True)
     last_location = LocationSerializer(read_only=True)
     profile_picture_url = serializers.SerializerMethodField()
     group = GroupSerializer(read_only=True)
-    org_groups = serializers.SerializerMethodField()
     total_hours = serializers.SerializerMethodField()
-    org_settings = serializers.SerializerMethodField()
 
     class Meta:
         model = User
         fields = ('id', 'email', 'first_name', 'last_name', 'phone_number', 'group',
-                 'is_staff', 'live', 'org', 'org_locations', 'org_users', 
-                 'user_sessions', 'org_period_instances', 'active_period_setting',
+                 'is_staff', 'live', 'user_sessions',
                  'last_location', 'profile_picture_key', 'profile_picture_url', 'total_hours',
-                 'notify_org_starts_studying', 'notify_user_leaves_zone', 'notify_study_deadline_approaching',
-                 'org_groups', 'org_settings')
+                 'notify_org_starts_studying', 'notify_user_leaves_zone', 'notify_study_deadline_approaching')
 
-    def get_profile_picture_url(self, obj):
-        return UserSerializer().get_profile_picture_url(obj)
+    def get_period_instance(self, obj):
+        # Resolved once per serialization and shared by the per-user and org parts
+        if not hasattr(self, '_period_instance'):
+            self._period_instance = get_or_create_period_instance(obj, timezone.now())
+        return self._period_instance
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        data.update(self.get_org_dashboard(instance))
+        return data
+
+    def get_org_dashboard(self, obj):
+        from .cache import cached_org_payload
 
-    def get_org_settings(self, obj):
         if not obj.org:
-            return None
-        settings, _ = OrgSettings.objects.get_or_create(org=obj.org)
-        return OrgSettingsSerializer(settings).data
+            return dict(OrgDashboardSerializer.EMPTY)
 
-    def get_org_groups(self, obj):
-        if obj.org:
-            groups = Group.objects.filter(org=obj.org)
-            return GroupSerializer(groups, many=True).data
-        return []
+        period_instance = self.get_period_instance(obj)
+        return cached_org_payload(
+            obj.org_id,
+            f"dashboard:{period_instance.id if period_instance else 'none'}",
+            lambda: dict(OrgDashboardSerializer(obj.org, context={'period_instance': period_instance}).data),
+        )
 
-    def get_org_users(self, obj):
-        from .utils import calculate_user_hours, get_or_create_period_instance
-        
-        if obj.org:
-            users = User.objects.filter(org=obj.org).select_related('group')
-            user_data = []
-            
-            # Get current period instance if available
-            current_time = timezone.now()
-            period_instance = get_or_create_period_instance(obj, current_time)
-            
-            for user in users:
-                # Get base user data
-                serialized_user = UserSerializer(user).data
-                
-                # Add group information
-                if user.group:
-                    serialized_user['group'] = GroupSerializer(user.group).data
-                else:
-                    serialized_user['group'] = None
-                
-                # Add total hours
-                if period_instance:
-                    serialized_user['total_hours'] = calculate_user_hours(user, period_instance)
-                else:
-                    serialized_user['total_hours'] = calculate_user_hours(user)
-                
-                user_data.append(serialized_user)
-                
-            return user_data
-        return []
+    def get_profile_picture_url(self, obj):
+        return UserSerializer().get_profile_picture_url(obj)
 
     def get_total_hours(self, obj):
-        from .utils import calculate_user_hours, get_or_create_period_instance
-        
-        # Get current period instance if available
-        current_time = timezone.now()
-        period_instance = get_or_create_period_instance(obj, current_time)
+        from .utils import calculate_user_hours
         
         # Calculate hours based on period instance or total if no active period
+        period_instance = self.get_period_instance(obj)
         if period_instance:
             return calculate_user_hours(obj, period_instance)
         else:
             return calculate_user_hours(obj)
 
-    def get_org_period_instances(self, obj):
-        if obj.org:
-            # First ensure the current period instance exists
-            current_time = timezone.now()
-            get_or_create_period_instance(obj, current_time)
-            
-            # Then get all instances
-            instances = PeriodInstance.objects.filter(
-                period_setting__org=obj.org
-            ).order_by('-start_date')
-            return PeriodInstanceSerializer(instances, many=True).data
-        return None
-
-    def get_active_period_setting(self, obj):
-        if obj.org:
-            try:
-                setting = PeriodSetting.objects.get(org=obj.org, is_active=True)
-                return PeriodSettingSerializer(setting).data
-            except PeriodSetting.DoesNotExist:
-                return None
-        return None
-
 class StaffStatusSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
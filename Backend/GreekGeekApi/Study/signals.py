@@ -0,0 +1,61 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .cache import bump_org_data_version
+from .utils import invalidate_active_period, realign_sessions_for_instance
+from .models import Group, Location, Org, OrgSettings, PeriodInstance, PeriodSetting, Session, User
+
+
+@receiver(post_save, sender=Org)
+@receiver(post_delete, sender=Org)
+def org_changed(sender, instance, **kwargs):
+    bump_org_data_version(instance.id)
+    invalidate_active_period(instance.id)
+
+
+@receiver(post_save, sender=Session)
+@receiver(post_delete, sender=Session)
+@receiver(post_save, sender=Location)
+@receiver(post_delete, sender=Location)
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+@receiver(post_save, sender=OrgSettings)
+@receiver(post_delete, sender=OrgSettings)
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def org_data_changed(sender, instance, **kwargs):
+    bump_org_data_version(instance.org_id)
+
+
+@receiver(post_save, sender=PeriodSetting)
+@receiver(post_delete, sender=PeriodSetting)
+def period_setting_changed(sender, instance, **kwargs):
+    bump_org_data_version(instance.org_id)
+    invalidate_active_period(instance.org_id)
+
+
+@receiver(pre_save, sender=PeriodInstance)
+def remember_period_instance_dates(sender, instance, update_fields=None, **kwargs):
+    if instance.pk and (update_fields is None or {'start_date', 'end_date'} & set(update_fields)):
+        instance._saved_dates = PeriodInstance.objects.filter(pk=instance.pk).values_list('start_date', 'end_date').first()
+
+
+@receiver(post_save, sender=PeriodInstance)
+def period_instance_dates_changed(sender, instance, created, **kwargs):
+    # Sessions belong to the instance covering them, so moving its dates moves sessions
+    saved_dates = getattr(instance, '_saved_dates', None)
+    if not created and saved_dates and saved_dates != (instance.start_date, instance.end_date):
+        realign_sessions_for_instance(instance)
+    instance._saved_dates = None
+
+
+@receiver(post_save, sender=PeriodInstance)
+@receiver(post_delete, sender=PeriodInstance)
+def period_instance_changed(sender, instance, **kwargs):
+    try:
+        org_id = instance.period_setting.org_id
+    except PeriodSetting.DoesNotExist:
+        # Cascading from a deleted setting, whose own signal already bumped the org
+        return
+    bump_org_data_version(org_id)
+    invalidate_active_period(org_id)
@@ -1,14 +1,29 @@
 from unittest.mock import patch
 from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
 import json
+import threading
+from urllib.parse import parse_qs, urlparse
 
+from django.core.management import CommandError, call_command
 from django.test import TestCase, override_settings
 from django.utils import timezone
 from django.urls import reverse
 from rest_framework.test import APIClient
 import stripe
 
-from .models import Org, User
+from .cache import org_data_version
+from .models import BillingEvent, JobCheckpoint, Org, User
+from .views import PREMIUM_SWEEP_JOB, process_billing_events, reconcile_stripe_subscriptions, sweep_premium_expiry
+
+# Stripe fixture timestamps, relative to now so trials and billing periods are still running
+DAY = 24 * 60 * 60
+TRIAL_START = int(timezone.now().timestamp()) - 2 * DAY
+TRIAL_END = TRIAL_START + 30 * DAY
+ITEM_TRIAL_START = TRIAL_START + DAY
+ITEM_TRIAL_END = ITEM_TRIAL_START + 30 * DAY
+PERIOD_END = ITEM_TRIAL_END + 31 * DAY
 
 
 class BillingCheckoutSessionTests(TestCase):
@@ -57,8 +72,8 @@ class BillingCheckoutSessionTests(TestCase):
     @override_settings(STRIPE_API_KEY='rk_test_123')
     @patch('Study.views.stripe.checkout.Session.retrieve')
     def test_admin_can_sync_completed_checkout_session(self, mock_retrieve):
-        trial_start = 1780189000
-        trial_end = 1782781000
+        trial_start = TRIAL_START
+        trial_end = TRIAL_END
         mock_retrieve.return_value = {
             'id': 'cs_test_123',
             'client_reference_id': str(self.org.id),
@@ -108,7 +123,7 @@ class BillingCheckoutSessionTests(TestCase):
             'status': 'canceled',
             'trial_start': None,
             'trial_end': None,
-            'current_period_end': 1782781000,
+            'current_period_end': TRIAL_END,
             'cancel_at_period_end': True,
         }
 
@@ -162,9 +177,9 @@ class BillingCheckoutSessionTests(TestCase):
                     'id': 'sub_123',
                     'customer': 'cus_123',
                     'status': 'trialing',
-                    'trial_start': 1780189000,
-                    'trial_end': 1782781000,
-                    'current_period_end': 1782781000,
+                    'trial_start': TRIAL_START,
+                    'trial_end': TRIAL_END,
+                    'current_period_end': TRIAL_END,
                     'cancel_at_period_end': False,
                 }
             ]
@@ -177,7 +192,7 @@ class BillingCheckoutSessionTests(TestCase):
         self.assertTrue(self.org.is_premium)
         self.assertEqual(self.org.stripe_subscription_id, 'sub_123')
         self.assertEqual(self.org.stripe_subscription_status, 'trialing')
-        self.assertEqual(self.org.stripe_current_period_end, timezone.datetime.fromtimestamp(1782781000, tz=timezone.get_current_timezone()))
+        self.assertEqual(self.org.stripe_current_period_end, timezone.datetime.fromtimestamp(TRIAL_END, tz=timezone.get_current_timezone()))
         mock_list.assert_called_once_with(customer='cus_123', status='all', limit=1)
 
     def test_admin_subscription_sync_without_billing_ids_returns_current_state(self):
@@ -190,7 +205,7 @@ class BillingCheckoutSessionTests(TestCase):
     @override_settings(STRIPE_API_KEY='rk_test_123')
     @patch('Study.views.stripe.Subscription.modify')
     def test_admin_can_cancel_subscription_at_period_end(self, mock_modify):
-        period_end = 1782781000
+        period_end = TRIAL_END
         self.org.stripe_customer_id = 'cus_123'
         self.org.stripe_subscription_id = 'sub_123'
         self.org.stripe_subscription_status = 'active'
@@ -240,8 +255,8 @@ class StripeWebhookTests(TestCase):
             reg_code='SIGN123',
             school='Test University',
         )
-        trial_start = 1780189000
-        trial_end = 1782781000
+        trial_start = TRIAL_START
+        trial_end = TRIAL_END
         payload = json.dumps({
             'id': 'evt_123',
             'object': 'event',
@@ -269,6 +284,7 @@ class StripeWebhookTests(TestCase):
         )
 
         self.assertEqual(response.status_code, 200)
+        process_billing_events()
         org.refresh_from_db()
         self.assertTrue(org.is_premium)
         self.assertEqual(org.stripe_customer_id, 'cus_123')
@@ -286,8 +302,8 @@ class StripeWebhookTests(TestCase):
             reg_code='SIGUPD123',
             school='Test University',
         )
-        trial_start = 1780791032
-        trial_end = 1783383032
+        trial_start = ITEM_TRIAL_START
+        trial_end = ITEM_TRIAL_END
         payload = json.dumps({
             'id': 'evt_123',
             'object': 'event',
@@ -325,6 +341,7 @@ class StripeWebhookTests(TestCase):
         )
 
         self.assertEqual(response.status_code, 200)
+        process_billing_events()
         org.refresh_from_db()
         self.assertTrue(org.is_premium)
         self.assertEqual(org.stripe_customer_id, 'cus_123')
@@ -366,14 +383,22 @@ class StripeWebhookTests(TestCase):
         STRIPE_API_KEY='rk_test_123',
         STRIPE_WEBHOOK_SECRET='whsec_123',
     )
+    @patch('Study.views.stripe.Subscription.retrieve')
     @patch('Study.views.construct_stripe_webhook_event')
-    def test_checkout_completed_marks_org_premium(self, mock_construct_event):
+    def test_checkout_completed_marks_org_premium(self, mock_construct_event, mock_retrieve):
         org = Org.objects.create(
             name='Paid Chapter',
             reg_code='PAID123',
             school='Test University',
         )
+        mock_retrieve.return_value = {
+            'id': 'sub_123',
+            'customer': 'cus_123',
+            'status': 'trialing',
+            'cancel_at_period_end': False,
+        }
         mock_construct_event.return_value = {
+            'id': 'evt_mock_1',
             'type': 'checkout.session.completed',
             'data': {
                 'object': {
@@ -393,6 +418,7 @@ class StripeWebhookTests(TestCase):
         )
 
         self.assertEqual(response.status_code, 200)
+        process_billing_events()
         org.refresh_from_db()
         self.assertTrue(org.is_premium)
         self.assertEqual(org.stripe_customer_id, 'cus_123')
@@ -410,10 +436,11 @@ class StripeWebhookTests(TestCase):
             reg_code='TRIAL123',
             school='Test University',
         )
-        trial_start = 1780189000
-        trial_end = 1782781000
-        current_period_end = 1782781000
+        trial_start = TRIAL_START
+        trial_end = TRIAL_END
+        current_period_end = TRIAL_END
         mock_construct_event.return_value = {
+            'id': 'evt_mock_2',
             'type': 'customer.subscription.created',
             'data': {
                 'object': {
@@ -437,6 +464,7 @@ class StripeWebhookTests(TestCase):
         )
 
         self.assertEqual(response.status_code, 200)
+        process_billing_events()
         org.refresh_from_db()
         self.assertTrue(org.is_premium)
         self.assertEqual(org.stripe_subscription_status, 'trialing')
@@ -456,9 +484,10 @@ class StripeWebhookTests(TestCase):
             reg_code='UPDATED123',
             school='Test University',
         )
-        trial_start = 1780791032
-        trial_end = 1783383032
+        trial_start = ITEM_TRIAL_START
+        trial_end = ITEM_TRIAL_END
         mock_construct_event.return_value = {
+            'id': 'evt_mock_3',
             'type': 'customer.subscription.updated',
             'data': {
                 'object': {
@@ -490,6 +519,7 @@ class StripeWebhookTests(TestCase):
         )
 
         self.assertEqual(response.status_code, 200)
+        process_billing_events()
         org.refresh_from_db()
         self.assertTrue(org.is_premium)
         self.assertEqual(org.stripe_customer_id, 'cus_123')
@@ -516,6 +546,7 @@ class StripeWebhookTests(TestCase):
             stripe_subscription_status='active',
         )
         mock_construct_event.return_value = {
+            'id': 'evt_mock_4',
             'type': 'customer.subscription.paused',
             'data': {
                 'object': {
@@ -535,6 +566,7 @@ class StripeWebhookTests(TestCase):
         )
 
         self.assertEqual(response.status_code, 200)
+        process_billing_events()
         org.refresh_from_db()
         self.assertFalse(org.is_premium)
         self.assertEqual(org.stripe_subscription_status, 'paused')
@@ -555,8 +587,9 @@ class StripeWebhookTests(TestCase):
             stripe_subscription_id='sub_123',
             stripe_subscription_status='trialing',
         )
-        current_period_end = 1786061432
+        current_period_end = PERIOD_END
         mock_construct_event.return_value = {
+            'id': 'evt_mock_5',
             'type': 'invoice.paid',
             'data': {
                 'object': {
@@ -597,6 +630,7 @@ class StripeWebhookTests(TestCase):
         )
 
         self.assertEqual(response.status_code, 200)
+        process_billing_events()
         org.refresh_from_db()
         self.assertTrue(org.is_premium)
         self.assertEqual(org.stripe_subscription_status, 'active')
@@ -619,8 +653,9 @@ class StripeWebhookTests(TestCase):
             stripe_subscription_id='sub_123',
             stripe_subscription_status='active',
         )
-        current_period_end = 1786061432
+        current_period_end = PERIOD_END
         mock_construct_event.return_value = {
+            'id': 'evt_mock_6',
             'type': 'invoice.payment_failed',
             'data': {
                 'object': {
@@ -648,6 +683,7 @@ class StripeWebhookTests(TestCase):
         )
 
         self.assertEqual(response.status_code, 200)
+        process_billing_events()
         org.refresh_from_db()
         self.assertFalse(org.is_premium)
         self.assertEqual(org.stripe_subscription_status, 'past_due')
@@ -670,6 +706,7 @@ class StripeWebhookTests(TestCase):
             stripe_subscription_status='active',
         )
         mock_construct_event.return_value = {
+            'id': 'evt_mock_7',
             'type': 'customer.subscription.deleted',
             'data': {
                 'object': {
@@ -688,11 +725,403 @@ class StripeWebhookTests(TestCase):
         )
 
         self.assertEqual(response.status_code, 200)
+        process_billing_events()
         org.refresh_from_db()
         self.assertFalse(org.is_premium)
         self.assertEqual(org.stripe_subscription_status, 'canceled')
 
 
+@override_settings(
+    STRIPE_API_KEY='rk_test_123',
+    STRIPE_WEBHOOK_SECRET='whsec_123',
+)
+class StripeBillingEventLedgerTests(TestCase):
+    def setUp(self):
+        self.org = Org.objects.create(name='Ledger Chapter', reg_code='LEDGER123', school='Test University')
+
+    def subscription_event(self, event_id, created, status_value, org=None):
+        return {
+            'id': event_id,
+            'type': 'customer.subscription.updated',
+            'created': created,
+            'data': {
+                'object': {
+                    'id': f'sub_{(org or self.org).id}',
+                    'customer': f'cus_{(org or self.org).id}',
+                    'status': status_value,
+                    'cancel_at_period_end': False,
+                    'metadata': {'org_id': str((org or self.org).id)},
+                }
+            },
+        }
+
+    def post_event(self, event):
+        with patch('Study.views.construct_stripe_webhook_event', return_value=event):
+            return APIClient().post(
+                reverse('stripe-webhook'),
+                data=b'{}',
+                content_type='application/json',
+                HTTP_STRIPE_SIGNATURE='test-signature',
+            )
+
+    @patch('Study.views.stripe.Subscription.retrieve')
+    def test_webhook_records_event_without_calling_stripe(self, mock_retrieve):
+        response = self.post_event({
+            'id': 'evt_checkout',
+            'type': 'checkout.session.completed',
+            'data': {'object': {'client_reference_id': str(self.org.id), 'customer': 'cus_1', 'subscription': 'sub_1'}},
+        })
+
+        self.assertEqual(response.status_code, 200)
+        mock_retrieve.assert_not_called()
+        event = BillingEvent.objects.get()
+        self.assertEqual(event.org, self.org)
+        self.assertIsNone(event.processed_at)
+        self.org.refresh_from_db()
+        self.assertFalse(self.org.is_premium)
+
+    def test_redelivered_event_is_recorded_once(self):
+        event = self.subscription_event('evt_dup', 1780000000, 'active')
+
+        self.assertEqual(self.post_event(event).data, {'received': True})
+        self.assertEqual(self.post_event(event).data, {'received': True, 'duplicate': True})
+
+        self.assertEqual(BillingEvent.objects.count(), 1)
+        self.assertEqual(process_billing_events(), 1)
+        self.assertEqual(process_billing_events(), 0)
+
+    def test_unhandled_event_types_are_not_recorded(self):
+        response = self.post_event({'id': 'evt_other', 'type': 'customer.created', 'data': {'object': {}}})
+
+        self.assertEqual(response.data, {'received': True, 'ignored': True})
+        self.assertFalse(BillingEvent.objects.exists())
+
+    def test_events_apply_in_stripe_order_per_org(self):
+        # Delivered out of order: the cancellation was created after the activation
+        self.post_event(self.subscription_event('evt_2', 1780000200, 'canceled'))
+        self.post_event(self.subscription_event('evt_1', 1780000100, 'active'))
+
+        self.assertEqual(process_billing_events(), 1)
+        self.org.refresh_from_db()
+        self.assertEqual(self.org.stripe_subscription_status, 'active')
+
+        call_command('process_billing_events', stdout=StringIO())
+        self.org.refresh_from_db()
+        self.assertEqual(self.org.stripe_subscription_status, 'canceled')
+        self.assertFalse(self.org.is_premium)
+
+    @patch('Study.views.stripe.Subscription.retrieve')
+    def test_worker_configures_stripe_and_retries_api_errors(self, mock_retrieve):
+        mock_retrieve.side_effect = stripe.error.AuthenticationError('No API key provided')
+        self.post_event({
+            'id': 'evt_invoice',
+            'type': 'invoice.paid',
+            'created': 1780000100,
+            'data': {'object': {'customer': 'cus_1', 'subscription': 'sub_1', 'metadata': {'org_id': str(self.org.id)}}},
+        })
+        stripe.api_key = None
+
+        self.assertEqual(process_billing_events(), 0)
+
+        self.assertEqual(stripe.api_key, 'rk_test_123')
+        event = BillingEvent.objects.get()
+        self.assertIsNone(event.processed_at)
+        self.assertEqual((event.attempts, event.last_error), (1, 'No API key provided'))
+
+        mock_retrieve.side_effect = None
+        mock_retrieve.return_value = {'id': 'sub_1', 'customer': 'cus_1', 'status': 'active', 'cancel_at_period_end': False}
+        self.assertEqual(process_billing_events(), 1)
+        self.org.refresh_from_db()
+        self.assertEqual(self.org.stripe_subscription_status, 'active')
+        self.assertTrue(self.org.is_premium)
+
+    def test_failing_event_holds_back_only_its_own_org(self):
+        other_org = Org.objects.create(name='Other Chapter', reg_code='OTHER123', school='Test University')
+        self.post_event(self.subscription_event('evt_1', 1780000100, 'active'))
+        self.post_event(self.subscription_event('evt_2', 1780000200, 'canceled'))
+        self.post_event(self.subscription_event('evt_3', 1780000300, 'active', org=other_org))
+
+        with patch('Study.views.sync_org_from_stripe_subscription', side_effect=[RuntimeError('db hiccup'), None]) as mock_sync:
+            self.assertEqual(process_billing_events(), 1)
+
+        self.assertEqual(mock_sync.call_args.args[0], other_org)
+        failed = BillingEvent.objects.get(stripe_event_id='evt_1')
+        self.assertEqual((failed.attempts, failed.last_error), (1, 'db hiccup'))
+        # Held back behind evt_1 rather than applied out of order
+        self.assertEqual(BillingEvent.objects.get(stripe_event_id='evt_2').attempts, 0)
+
+        out = StringIO()
+        call_command('process_billing_events', stdout=out)
+        self.assertIn('Processed 2 billing events', out.getvalue())
+        self.org.refresh_from_db()
+        self.assertEqual(self.org.stripe_subscription_status, 'canceled')
+
+
+class FakeStripeServer:
+    """
+    Minimal local stand-in for Stripe's subscription listing: serves self.subscriptions
+    newest first, page_size at a time, honouring starting_after. Set error_status to
+    answer every request with a Stripe error instead.
+    """
+
+    def __init__(self, subscriptions=(), page_size=2):
+        self.subscriptions = list(subscriptions)
+        self.page_size = page_size
+        self.error_status = None
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = {key: values[0] for key, values in parse_qs(url.query).items()}
+                server.requests.append((url.path, query))
+                status, body = server.handle(url.path, query)
+                content = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def handle(self, path, query):
+        if self.error_status:
+            return self.error_status, {'error': {'type': 'invalid_request_error', 'message': 'Listing failed'}}
+        if path != '/v1/subscriptions':
+            return 404, {'error': {'type': 'invalid_request_error', 'message': f'Unknown path {path}'}}
+        start = 0
+        if 'starting_after' in query:
+            start = [sub['id'] for sub in self.subscriptions].index(query['starting_after']) + 1
+        limit = min(int(query.get('limit', 10)), self.page_size)
+        page = self.subscriptions[start:start + limit]
+        return 200, {
+            'object': 'list',
+            'url': '/v1/subscriptions',
+            'data': page,
+            'has_more': start + limit < len(self.subscriptions),
+        }
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class ReconcileBillingCommandTests(TestCase):
+    def subscription(self, sub_id, customer_id, status_value, org_id=None, period_end=PERIOD_END, cancel=False):
+        return {
+            'id': sub_id,
+            'object': 'subscription',
+            'customer': customer_id,
+            'status': status_value,
+            'cancel_at_period_end': cancel,
+            'trial_start': None,
+            'trial_end': None,
+            'items': {'object': 'list', 'data': [{'id': f'si_{sub_id}', 'current_period_end': period_end}]},
+            'metadata': {'org_id': str(org_id)} if org_id else {},
+        }
+
+    def reconcile(self, server, *args):
+        out = StringIO()
+        with override_settings(STRIPE_API_KEY='rk_test_123', STRIPE_API_BASE=server.url):
+            try:
+                call_command('reconcile_billing', *args, stdout=out)
+            finally:
+                stripe.api_base = stripe.DEFAULT_API_BASE
+        return out.getvalue()
+
+    def test_reconcile_applies_paginated_listing_to_drifted_orgs(self):
+        stale = Org.objects.create(
+            name='Stale', reg_code='STALE1', school='U', is_premium=True,
+            stripe_customer_id='cus_stale', stripe_subscription_id='sub_stale', stripe_subscription_status='active',
+        )
+        customer_only = Org.objects.create(name='Customer', reg_code='CUST1', school='U', stripe_customer_id='cus_only')
+        metadata_only = Org.objects.create(name='Metadata', reg_code='META1', school='U')
+        in_sync = Org.objects.create(
+            name='In Sync', reg_code='SYNC1', school='U', is_premium=True,
+            stripe_customer_id='cus_sync', stripe_subscription_id='sub_sync', stripe_subscription_status='active',
+            stripe_current_period_end=timezone.datetime.fromtimestamp(PERIOD_END, tz=timezone.get_current_timezone()),
+        )
+        no_subscription = Org.objects.create(name='Lapsed', reg_code='LAPSE1', school='U', stripe_customer_id='cus_none')
+        in_sync_row = Org.objects.filter(pk=in_sync.pk).values().get()
+        stale_version, in_sync_version = org_data_version(stale.id), org_data_version(in_sync.id)
+
+        server = FakeStripeServer([
+            self.subscription('sub_new', 'cus_only', 'trialing'),
+            self.subscription('sub_stale', 'cus_stale', 'canceled'),
+            self.subscription('sub_sync', 'cus_sync', 'active'),
+            self.subscription('sub_meta', 'cus_meta', 'active', org_id=metadata_only.id, cancel=True),
+            # Older subscription of the same customer; the newest one wins
+            self.subscription('sub_old', 'cus_only', 'canceled'),
+        ])
+        with server:
+            out = self.reconcile(server)
+
+        self.assertIn('Updated 3 of 4 orgs matched to 5 Stripe subscriptions', out)
+        self.assertEqual(len(server.requests), 3)
+        self.assertEqual(server.requests[0][1]['status'], 'all')
+        self.assertEqual(server.requests[1][1]['starting_after'], 'sub_stale')
+
+        stale.refresh_from_db()
+        self.assertEqual(stale.stripe_subscription_status, 'canceled')
+        self.assertFalse(stale.is_premium)
+        customer_only.refresh_from_db()
+        self.assertEqual(customer_only.stripe_subscription_id, 'sub_new')
+        self.assertEqual(customer_only.stripe_subscription_status, 'trialing')
+        self.assertTrue(customer_only.is_premium)
+        metadata_only.refresh_from_db()
+        self.assertEqual(metadata_only.stripe_customer_id, 'cus_meta')
+        self.assertTrue(metadata_only.stripe_cancel_at_period_end)
+        self.assertTrue(metadata_only.is_premium)
+        self.assertEqual(
+            metadata_only.stripe_current_period_end,
+            timezone.datetime.fromtimestamp(PERIOD_END, tz=timezone.get_current_timezone()),
+        )
+        no_subscription.refresh_from_db()
+        self.assertEqual(no_subscription.stripe_subscription_status, '')
+        # Already matching Stripe: neither written nor invalidated
+        self.assertEqual(Org.objects.filter(pk=in_sync.pk).values().get(), in_sync_row)
+        self.assertEqual(org_data_version(in_sync.id), in_sync_version)
+        self.assertNotEqual(org_data_version(stale.id), stale_version)
+
+    @patch('Study.views.bump_org_data_version')
+    def test_reconcile_query_count_does_not_grow_with_orgs(self, mock_bump):
+        Org.objects.bulk_create([
+            Org(name=f'Org {i}', reg_code=f'BULK{i}', school='U', stripe_subscription_id=f'sub_{i}')
+            for i in range(60)
+        ])
+        subscriptions = [self.subscription(f'sub_{i}', f'cus_{i}', 'active') for i in range(60)]
+
+        # Org select, then savepoint, one bulk UPDATE and release
+        with self.assertNumQueries(4):
+            listed, matched, updated = reconcile_stripe_subscriptions(subscriptions)
+
+        self.assertEqual((listed, matched, updated), (60, 60, 60))
+        self.assertEqual(mock_bump.call_count, 60)
+        self.assertEqual(Org.objects.filter(is_premium=True, stripe_customer_id__startswith='cus_').count(), 60)
+
+    def test_dry_run_reports_without_saving(self):
+        org = Org.objects.create(name='Stale', reg_code='STALE1', school='U', stripe_subscription_id='sub_1')
+
+        with FakeStripeServer([self.subscription('sub_1', 'cus_1', 'active')]) as server:
+            out = self.reconcile(server, '--dry-run')
+
+        self.assertIn('Would update 1 of 1 orgs', out)
+        org.refresh_from_db()
+        self.assertEqual(org.stripe_subscription_status, '')
+        self.assertFalse(org.is_premium)
+
+    def test_subscription_owned_by_another_org_is_not_reassigned(self):
+        owner = Org.objects.create(name='Owner', reg_code='OWN1', school='U', stripe_subscription_id='sub_1')
+        claimant = Org.objects.create(name='Claimant', reg_code='CLAIM1', school='U')
+
+        subscription = self.subscription('sub_1', 'cus_1', 'active', org_id=claimant.id)
+        with FakeStripeServer([subscription]) as server:
+            self.reconcile(server)
+
+        owner.refresh_from_db()
+        claimant.refresh_from_db()
+        self.assertEqual(owner.stripe_subscription_status, 'active')
+        self.assertIsNone(claimant.stripe_subscription_id)
+
+    def test_stripe_error_fails_the_command(self):
+        Org.objects.create(name='Stale', reg_code='STALE1', school='U', stripe_subscription_id='sub_1')
+
+        with FakeStripeServer([self.subscription('sub_1', 'cus_1', 'active')]) as server:
+            server.error_status = 400
+            with self.assertRaisesMessage(CommandError, 'Listing Stripe subscriptions failed'):
+                self.reconcile(server)
+
+
+class PremiumExpirySweepTests(TestCase):
+    def org(self, code, **fields):
+        return Org.objects.create(name=code, reg_code=code, school='U', **fields)
+
+    def test_sweep_revokes_lapsed_entitlements_and_records_checkpoint(self):
+        now = timezone.now()
+        lapsed = self.org(
+            'LAPSED', is_premium=True, revenuecat_subscription_status='canceled',
+            revenuecat_entitlement_expires_at=now - timedelta(minutes=5),
+        )
+        current = self.org(
+            'CURRENT', is_premium=True, revenuecat_subscription_status='canceled',
+            revenuecat_entitlement_expires_at=now + timedelta(days=3),
+        )
+        # Trial over but paying through Stripe: checked, stays premium
+        paying = self.org(
+            'PAYING', is_premium=True, stripe_subscription_status='active',
+            trial_ends_at=now - timedelta(days=1),
+        )
+        # Missed webhooks: still 'trialing' after the trial, or cancelling after the period
+        trial_over = self.org(
+            'TRIALOVER', is_premium=True, stripe_subscription_status='trialing',
+            trial_ends_at=now - timedelta(hours=1),
+        )
+        cancelled = self.org(
+            'CANCELLED', is_premium=True, stripe_subscription_status='active',
+            stripe_cancel_at_period_end=True, stripe_current_period_end=now - timedelta(hours=1),
+        )
+
+        out = StringIO()
+        call_command('sweep_premium_expiry', stdout=out)
+
+        self.assertIn('Checked 4 orgs with passed expiries, updated 3', out.getvalue())
+        for org in (lapsed, current, paying, trial_over, cancelled):
+            org.refresh_from_db()
+        self.assertFalse(lapsed.is_premium)
+        self.assertTrue(current.is_premium)
+        self.assertTrue(paying.is_premium)
+        self.assertFalse(trial_over.is_premium)
+        self.assertFalse(cancelled.is_premium)
+        self.assertGreaterEqual(JobCheckpoint.objects.get(name=PREMIUM_SWEEP_JOB).last_run_at, now)
+
+    def test_sweep_only_checks_expiries_since_last_run(self):
+        now = timezone.now()
+        JobCheckpoint.objects.create(name=PREMIUM_SWEEP_JOB, last_run_at=now - timedelta(hours=1))
+        self.org(
+            'EARLIER', is_premium=True, stripe_subscription_status='active',
+            stripe_current_period_end=now - timedelta(hours=2),
+        )
+        just_lapsed = self.org(
+            'JUST', is_premium=True, revenuecat_subscription_status='billing_issue',
+            revenuecat_entitlement_expires_at=now - timedelta(minutes=30),
+        )
+
+        self.assertEqual(sweep_premium_expiry(), (1, 1))
+        just_lapsed.refresh_from_db()
+        self.assertFalse(just_lapsed.is_premium)
+        # Nothing has expired since this run
+        self.assertEqual(sweep_premium_expiry(), (0, 0))
+
+    @patch('Study.views.bump_org_data_version')
+    def test_sweep_query_count_does_not_grow_with_orgs(self, mock_bump):
+        expired = timezone.now() - timedelta(minutes=1)
+        Org.objects.bulk_create([
+            Org(
+                name=f'Org {i}', reg_code=f'SWEEP{i}', school='U', is_premium=True,
+                revenuecat_subscription_status='canceled', revenuecat_entitlement_expires_at=expired,
+            )
+            for i in range(50)
+        ])
+
+        # Savepoint, checkpoint, orgs, one bulk UPDATE, checkpoint insert, release
+        with self.assertNumQueries(6):
+            self.assertEqual(sweep_premium_expiry(), (50, 50))
+
+        self.assertFalse(Org.objects.filter(is_premium=True).exists())
+        self.assertEqual(mock_bump.call_count, 50)
+
+
 class RevenueCatWebhookTests(TestCase):
     def revenuecat_payload(self, org, event_type='INITIAL_PURCHASE', expires_at=None, **event_fields):
         expires_at = expires_at or timezone.now() + timedelta(days=365)
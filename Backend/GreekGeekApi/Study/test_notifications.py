@@ -0,0 +1,644 @@
+from datetime import datetime, time, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+import json
+import threading
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from .models import (
+    NotificationToken, Org, OrgSettings, PeriodInstance, PeriodSetting, PushTicket, QueuedNotification,
+    SentReminder, User, UserPeriodHours,
+)
+from .push_service import check_push_receipts, claim_reminders
+from .utils import (
+    format_studying_digest, members_behind_pace, notification_audience_tokens, org_timezone, process_queued_notifications, queue_notification_to_users,
+    queue_notification_to_org, send_notification_to_org, send_push_notification,
+)
+
+
+class NotificationOutboxTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.org = Org.objects.create(
+            name='Test Chapter',
+            reg_code='TEST123',
+            school='Test University',
+        )
+        OrgSettings.objects.create(org=self.org, require_location_verification=False)
+        self.user = User.objects.create_user(
+            email='member@example.com',
+            password='password123',
+            first_name='Alex',
+            last_name='Member',
+            org=self.org,
+        )
+        self.other = User.objects.create_user(
+            email='other@example.com',
+            password='password123',
+            org=self.org,
+        )
+        NotificationToken.objects.create(user=self.other, token='ExponentPushToken[other]', device_id='other')
+        self.client.force_authenticate(user=self.user)
+
+    @patch('Study.push_service.get_session')
+    def test_clock_in_and_out_queue_notifications_without_http(self, mock_session):
+        response = self.client.post(reverse('clock-in'), {})
+        self.assertEqual(response.status_code, 200)
+        response = self.client.post(reverse('clock-out'), {})
+        self.assertEqual(response.status_code, 200)
+
+        mock_session.assert_not_called()
+        clock_in, clock_out = QueuedNotification.objects.order_by('id')
+        self.assertEqual(clock_in.org, self.org)
+        self.assertEqual(clock_in.notification_type, 'org_starts_studying')
+        self.assertEqual(clock_in.data['user_id'], self.user.id)
+        self.assertEqual(clock_out.user_ids, [self.user.id])
+        self.assertEqual(clock_out.notification_type, 'user_leaves_zone')
+        self.assertIsNone(clock_in.sent_at)
+
+    @override_settings(NOTIFICATION_COALESCE_SECONDS=0)
+    @patch('Study.utils.send_push_notification', return_value={'data': []})
+    def test_worker_sends_queued_notifications_once(self, mock_send):
+        self.client.post(reverse('clock-in'), {})
+
+        out = StringIO()
+        call_command('process_notifications', stdout=out)
+        call_command('process_notifications', stdout=StringIO())
+
+        mock_send.assert_called_once()
+        self.assertEqual(mock_send.call_args.args[0], ['ExponentPushToken[other]'])
+        self.assertIn('Processed 1 queued notifications', out.getvalue())
+        notification = QueuedNotification.objects.get()
+        self.assertIsNotNone(notification.sent_at)
+        self.assertEqual(notification.attempts, 1)
+
+    @override_settings(EXPO_PUSH_MAX_RETRIES=0, EXPO_PUSH_RETRY_BACKOFF=0)
+    def test_failed_delivery_is_retried_until_max_attempts(self):
+        queue_notification_to_users([self.other.id], 'Title', 'Body')
+
+        with FakeExpoServer() as expo, override_settings(EXPO_API_URL=expo.url):
+            expo.queued_statuses = [503, 503]
+            self.assertEqual(process_queued_notifications(max_attempts=2), 1)
+            self.assertEqual(process_queued_notifications(max_attempts=2), 1)
+            self.assertEqual(process_queued_notifications(max_attempts=2), 0)
+
+        self.assertEqual(expo.send_batches, [])
+        notification = QueuedNotification.objects.get()
+        self.assertIsNone(notification.sent_at)
+        self.assertEqual(notification.attempts, 2)
+        self.assertIn('1 of 1 messages could not be sent', notification.last_error)
+
+    def test_rejected_clock_in_queues_nothing(self):
+        self.client.post(reverse('clock-in'), {})
+        response = self.client.post(reverse('clock-in'), {})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(QueuedNotification.objects.count(), 1)
+
+
+class NotificationAudienceTests(TestCase):
+    def setUp(self):
+        self.org = Org.objects.create(name='Audience Chapter', reg_code='AUD123', school='Test University')
+        self.other_org = Org.objects.create(name='Other Chapter', reg_code='AUD456', school='Test University')
+
+    def create_member(self, name, org=None, devices=1, **preferences):
+        user = User.objects.create(email=f'{name}@example.com', org=org or self.org, password='!', **preferences)
+        for device in range(devices):
+            NotificationToken.objects.create(user=user, token=f'ExponentPushToken[{name}-{device}]', device_id=str(device))
+        return user
+
+    def test_org_audience_filters_preferences_and_actor_in_one_query(self):
+        actor = self.create_member('actor')
+        self.create_member('fan', devices=2)
+        self.create_member('muted', notify_org_starts_studying=False)
+        self.create_member('outsider', org=self.other_org)
+        retired = self.create_member('retired')
+        retired.notification_tokens.update(is_active=False)
+
+        with self.assertNumQueries(1):
+            tokens = notification_audience_tokens('org_starts_studying', org_id=self.org.id, exclude_user_ids=[actor.id])
+
+        self.assertCountEqual(tokens, ['ExponentPushToken[fan-0]', 'ExponentPushToken[fan-1]'])
+
+    def test_org_query_count_does_not_grow_with_org_size(self):
+        for index in range(30):
+            self.create_member(f'member{index}')
+
+        with patch('Study.utils.send_push_notification', return_value={'data': []}) as mock_send:
+            with self.assertNumQueries(1):
+                send_notification_to_org(self.org.id, 'Title', 'Body', notification_type='org_starts_studying')
+
+        self.assertEqual(len(mock_send.call_args.args[0]), 30)
+
+    def test_user_audience_respects_preference(self):
+        wants = self.create_member('wants')
+        muted = self.create_member('muted', notify_user_leaves_zone=False)
+
+        tokens = notification_audience_tokens('user_leaves_zone', user_ids=[wants.id, muted.id])
+
+        self.assertEqual(tokens, ['ExponentPushToken[wants-0]'])
+
+    @override_settings(NOTIFICATION_COALESCE_SECONDS=0)
+    @patch('Study.utils.send_push_notification', return_value={'data': []})
+    def test_clock_in_notification_skips_the_member_who_clocked_in(self, mock_send):
+        OrgSettings.objects.create(org=self.org, require_location_verification=False)
+        actor = self.create_member('actor')
+        self.create_member('teammate')
+        client = APIClient()
+        client.force_authenticate(user=actor)
+
+        client.post(reverse('clock-in'), {})
+        process_queued_notifications()
+
+        self.assertEqual(mock_send.call_args.args[0], ['ExponentPushToken[teammate-0]'])
+
+
+@override_settings(NOTIFICATION_COALESCE_SECONDS=60)
+class CoalescedNotificationTests(TestCase):
+    def setUp(self):
+        self.org = Org.objects.create(name='Burst Chapter', reg_code='BURST1', school='Test University')
+        self.members = [
+            User.objects.create(email=f'member{index}@example.com', first_name=f'Member{index}', org=self.org, password='!')
+            for index in range(16)
+        ]
+        for member in self.members:
+            NotificationToken.objects.create(user=member, token=f'ExponentPushToken[{member.id}]', device_id='phone')
+
+    def clock_in(self, member, location='Library', org=None):
+        return queue_notification_to_org(
+            org_id=(org or self.org).id,
+            title='Someone Started Studying!',
+            body=f'{member.first_name} is now studying at {location}.',
+            data={'type': 'user_studying', 'user_id': member.id, 'user_name': member.first_name, 'location': location},
+            notification_type='org_starts_studying',
+            exclude_user_id=member.id,
+        )
+
+    def age_queue(self, seconds=61):
+        QueuedNotification.objects.update(created_at=timezone.now() - timedelta(seconds=seconds))
+
+    @patch('Study.utils.send_push_notification', return_value={'data': []})
+    def test_burst_of_clock_ins_is_sent_as_one_digest(self, mock_send):
+        for member in self.members[:14]:
+            self.clock_in(member)
+
+        self.assertEqual(process_queued_notifications(), 0)
+        mock_send.assert_not_called()
+
+        self.age_queue()
+        self.assertEqual(process_queued_notifications(), 14)
+
+        mock_send.assert_called_once()
+        tokens, title, body, data = mock_send.call_args.args
+        self.assertEqual(body, 'Member0, Member1 and 12 others are studying at Library.')
+        self.assertEqual(title, '14 Members Started Studying!')
+        self.assertEqual(data['user_ids'], [member.id for member in self.members[:14]])
+        # Only the members who didn't clock in hear about it
+        self.assertCountEqual(tokens, [f'ExponentPushToken[{member.id}]' for member in self.members[14:]])
+        self.assertFalse(QueuedNotification.objects.filter(sent_at__isnull=True).exists())
+
+    @patch('Study.utils.send_push_notification', return_value={'data': []})
+    def test_single_clock_in_keeps_its_own_message(self, mock_send):
+        self.clock_in(self.members[0])
+        self.age_queue()
+
+        process_queued_notifications()
+
+        self.assertEqual(mock_send.call_args.args[2], 'Member0 is now studying at Library.')
+        self.assertEqual(len(mock_send.call_args.args[0]), 15)
+
+    @patch('Study.utils.send_push_notification', return_value={'data': []})
+    def test_orgs_are_coalesced_separately(self, mock_send):
+        other_org = Org.objects.create(name='Other Chapter', reg_code='BURST2', school='Test University')
+        User.objects.filter(id__in=[self.members[2].id, self.members[3].id]).update(org=other_org)
+        self.clock_in(self.members[0])
+        self.clock_in(self.members[1])
+        self.clock_in(self.members[2], org=other_org)
+        self.age_queue()
+
+        self.assertEqual(process_queued_notifications(), 3)
+
+        self.assertEqual(mock_send.call_count, 2)
+        bodies = sorted(call.args[2] for call in mock_send.call_args_list)
+        self.assertEqual(bodies, ['Member0 and Member1 are studying at Library.', 'Member2 is now studying at Library.'])
+
+    @override_settings(EXPO_PUSH_MAX_RETRIES=0, EXPO_PUSH_RETRY_BACKOFF=0)
+    def test_failed_digest_is_retried_with_all_its_rows(self):
+        self.clock_in(self.members[0])
+        self.clock_in(self.members[1])
+        self.age_queue()
+
+        with FakeExpoServer() as expo, override_settings(EXPO_API_URL=expo.url):
+            expo.queued_statuses = [503]
+            self.assertEqual(process_queued_notifications(), 2)
+            self.assertEqual(QueuedNotification.objects.filter(sent_at__isnull=True).count(), 2)
+            self.assertEqual(process_queued_notifications(), 2)
+
+        self.assertEqual(len(expo.send_batches), 1)
+        self.assertEqual(list(QueuedNotification.objects.values_list('attempts', flat=True)), [2, 2])
+        self.assertFalse(QueuedNotification.objects.filter(sent_at__isnull=True).exists())
+
+    def test_digest_text(self):
+        self.assertEqual(format_studying_digest(['Alex'], 'Library'), 'Alex is studying at Library')
+        self.assertEqual(format_studying_digest(['Alex', 'Sam'], 'Library'), 'Alex and Sam are studying at Library')
+        self.assertEqual(format_studying_digest(['Alex', 'Sam', 'Jo']), 'Alex, Sam and Jo are studying')
+        self.assertEqual(
+            format_studying_digest(['Alex', 'Sam', 'Jo', 'Kim'], 'Library'),
+            'Alex, Sam and 2 others are studying at Library',
+        )
+
+
+def ok_tickets(messages):
+    return [{'status': 'ok', 'id': f'ticket-{index}'} for index, _ in enumerate(messages)]
+
+
+def request_failed_ticket():
+    return {'status': 'error', 'message': 'expo down', 'details': {'error': 'RequestFailed'}}
+
+
+@patch('Study.push_service.send_push_messages', side_effect=ok_tickets)
+class DueDateReminderCommandTests(TestCase):
+    def create_org_due_in(self, name, tz, days_left, members=2):
+        org = Org.objects.create(name=name, reg_code=name.upper(), school='Test University', timezone=tz)
+        local_today = timezone.now().astimezone(org_timezone(tz)).date()
+        due = local_today + timedelta(days=days_left)
+        end_date = datetime.combine(due, time(23, 59, 59), tzinfo=org_timezone(tz))
+        period_setting = PeriodSetting.objects.create(
+            org=org, period_type='weekly', due_day_of_week=due.weekday(), required_hours=2,
+            start_date=end_date - timedelta(days=7),
+        )
+        PeriodInstance.objects.create(
+            period_setting=period_setting, start_date=end_date - timedelta(days=7), end_date=end_date, is_active=True,
+        )
+        users = []
+        for index in range(members):
+            user = User.objects.create(email=f'{name}{index}@example.com', org=org, password='!')
+            NotificationToken.objects.create(user=user, token=f'ExponentPushToken[{name}-{index}]', device_id='phone')
+            users.append(user)
+        return org, users
+
+    def run_command(self, *args):
+        out = StringIO()
+        call_command('due_date_reminder', *args, stdout=out)
+        return out.getvalue()
+
+    def test_reminds_every_due_org_in_one_batch(self, mock_send):
+        self.create_org_due_in('west', 'America/Los_Angeles', 1)
+        self.create_org_due_in('east', 'Asia/Tokyo', 1)
+        self.create_org_due_in('later', 'America/New_York', 3)
+
+        with self.assertNumQueries(3):
+            output = self.run_command()
+
+        mock_send.assert_called_once()
+        messages = mock_send.call_args.args[0]
+        self.assertCountEqual(
+            [message['to'] for message in messages],
+            ['ExponentPushToken[west-0]', 'ExponentPushToken[west-1]', 'ExponentPushToken[east-0]', 'ExponentPushToken[east-1]'],
+        )
+        self.assertIn('ends tomorrow on', messages[0]['body'])
+        self.assertIn('Sent 4 reminders to 4 users', output)
+        self.assertEqual(SentReminder.objects.count(), 4)
+
+    def test_due_date_is_computed_in_org_timezone(self, mock_send):
+        _, users = self.create_org_due_in('tokyo', 'Asia/Tokyo', 0, members=1)
+
+        self.run_command('--days', '0')
+
+        message = mock_send.call_args.args[0][0]
+        local_today = timezone.now().astimezone(org_timezone('Asia/Tokyo')).date()
+        self.assertEqual(message['data']['end_date'], local_today.isoformat())
+        self.assertIn('ends today on', message['body'])
+
+    def test_rerun_is_a_no_op(self, mock_send):
+        self.create_org_due_in('west', 'America/Los_Angeles', 1)
+        self.run_command()
+
+        output = self.run_command()
+
+        mock_send.assert_called_once()
+        self.assertIn('Sent 0 reminders to 0 users', output)
+
+    def test_overlapping_run_only_sends_reminders_it_claimed(self, mock_send):
+        _, users = self.create_org_due_in('west', 'America/Los_Angeles', 1)
+        instance = PeriodInstance.objects.get(period_setting__org=users[0].org)
+
+        def claim_after_other_run(kind, instance_by_user):
+            # Another run claims users[0] after this one has read the ledger
+            self.assertEqual(claim_reminders(kind, {users[0].id: instance.id}), {users[0].id})
+            return claim_reminders(kind, instance_by_user)
+
+        with patch('Study.push_service.claim_reminders', side_effect=claim_after_other_run):
+            output = self.run_command()
+
+        self.assertEqual([message['to'] for message in mock_send.call_args.args[0]], ['ExponentPushToken[west-1]'])
+        self.assertIn('Sent 1 reminders to 1 users', output)
+        self.assertEqual(SentReminder.objects.count(), 2)
+
+    def test_transport_failure_releases_the_claim_for_a_rerun(self, mock_send):
+        _, users = self.create_org_due_in('west', 'America/Los_Angeles', 1)
+        NotificationToken.objects.create(user=users[0], token='ExponentPushToken[west-0-tablet]', device_id='tablet')
+        mock_send.side_effect = lambda messages: [
+            {'status': 'ok', 'id': 'ticket-0'} if message['to'] == 'ExponentPushToken[west-0]' else request_failed_ticket()
+            for message in messages
+        ]
+
+        output = self.run_command()
+
+        # users[0] reached one of its two devices; users[1] reached none
+        self.assertIn('Sent 1 reminders to 1 users; 2 failed', output)
+        self.assertEqual(list(SentReminder.objects.values_list('user_id', flat=True)), [users[0].id])
+
+        mock_send.side_effect = ok_tickets
+        output = self.run_command()
+
+        self.assertEqual([message['to'] for message in mock_send.call_args.args[0]], ['ExponentPushToken[west-1]'])
+        self.assertIn('Sent 1 reminders to 1 users', output)
+
+    def test_skips_members_who_opted_out(self, mock_send):
+        _, users = self.create_org_due_in('west', 'America/Los_Angeles', 1)
+        users[0].notify_study_deadline_approaching = False
+        users[0].save()
+
+        self.run_command()
+
+        self.assertEqual([message['to'] for message in mock_send.call_args.args[0]], ['ExponentPushToken[west-1]'])
+
+
+@patch('Study.push_service.send_push_messages', side_effect=ok_tickets)
+class BehindPaceReminderCommandTests(TestCase):
+    def create_org(self, name, days_elapsed, days_left, member_hours, required_hours=10):
+        now = timezone.now()
+        org = Org.objects.create(name=name, reg_code=name.upper(), school='Test University')
+        period_setting = PeriodSetting.objects.create(
+            org=org, period_type='custom', custom_days=days_elapsed + days_left,
+            required_hours=required_hours, start_date=now - timedelta(days=days_elapsed),
+        )
+        instance = PeriodInstance.objects.create(
+            period_setting=period_setting, start_date=now - timedelta(days=days_elapsed),
+            end_date=now + timedelta(days=days_left), is_active=True,
+        )
+        users = []
+        for index, hours in enumerate(member_hours):
+            user = User.objects.create(email=f'{name}{index}@example.com', org=org, password='!')
+            NotificationToken.objects.create(user=user, token=f'ExponentPushToken[{name}-{index}]', device_id='phone')
+            if hours:
+                UserPeriodHours.objects.create(user=user, period_instance=instance, total_hours=hours, session_count=1)
+            users.append(user)
+        return instance, users
+
+    def run_command(self, *args):
+        out = StringIO()
+        call_command('behind_pace_reminder', *args, stdout=out)
+        return out.getvalue()
+
+    def test_only_members_below_threshold_are_reminded(self, mock_send):
+        # Halfway through a 10 hour period: 5 hours expected, behind below 2.5
+        self.create_org('half', days_elapsed=5, days_left=5, member_hours=[0, 2, 3, 6])
+        # Too early in the period to nag anyone
+        self.create_org('early', days_elapsed=1, days_left=9, member_hours=[0])
+
+        output = self.run_command()
+
+        messages = mock_send.call_args.args[0]
+        self.assertCountEqual([message['to'] for message in messages], ['ExponentPushToken[half-0]', 'ExponentPushToken[half-1]'])
+        self.assertIn("You've logged 2.0 of 10 required hours", [m for m in messages if m['to'].endswith('half-1]')][0]['body'])
+        self.assertIn('Sent 2 reminders to 2 users', output)
+
+    def test_query_count_is_flat_across_orgs(self, mock_send):
+        self.create_org('one', days_elapsed=5, days_left=5, member_hours=[0, 1])
+        with self.assertNumQueries(4):
+            self.run_command()
+
+        SentReminder.objects.all().delete()
+        for index in range(5):
+            self.create_org(f'org{index}', days_elapsed=5, days_left=5, member_hours=[0, 1, 4, 8])
+        with self.assertNumQueries(4):
+            self.run_command()
+        self.assertEqual(len(mock_send.call_args.args[0]), 12)
+
+    def test_overlapping_run_only_sends_reminders_it_claimed(self, mock_send):
+        instance, users = self.create_org('half', days_elapsed=5, days_left=5, member_hours=[0, 0])
+
+        def claim_after_other_run(kind, instance_by_user):
+            # Another run claims users[1] after this one has read the ledger
+            self.assertEqual(claim_reminders(kind, {users[1].id: instance.id}), {users[1].id})
+            return claim_reminders(kind, instance_by_user)
+
+        with patch('Study.push_service.claim_reminders', side_effect=claim_after_other_run):
+            output = self.run_command()
+
+        self.assertEqual([message['to'] for message in mock_send.call_args.args[0]], ['ExponentPushToken[half-0]'])
+        self.assertIn('Sent 1 reminders to 1 users', output)
+
+    def test_transport_failure_releases_the_claim_for_a_rerun(self, mock_send):
+        _, users = self.create_org('half', days_elapsed=5, days_left=5, member_hours=[0, 0])
+        mock_send.side_effect = lambda messages: [
+            {'status': 'ok', 'id': 'ticket-0'} if message['to'] == 'ExponentPushToken[half-0]' else request_failed_ticket()
+            for message in messages
+        ]
+
+        output = self.run_command()
+
+        self.assertIn('Sent 1 reminders to 1 users; 1 failed', output)
+        self.assertEqual(list(SentReminder.objects.values_list('user_id', flat=True)), [users[0].id])
+
+        mock_send.side_effect = ok_tickets
+        self.run_command()
+
+        self.assertEqual([message['to'] for message in mock_send.call_args.args[0]], ['ExponentPushToken[half-1]'])
+        self.assertEqual(SentReminder.objects.count(), 2)
+
+    def test_rerun_and_opted_out_members_send_nothing(self, mock_send):
+        _, users = self.create_org('half', days_elapsed=5, days_left=5, member_hours=[0, 0])
+        users[1].notify_study_deadline_approaching = False
+        users[1].save()
+
+        self.run_command()
+        output = self.run_command()
+
+        mock_send.assert_called_once()
+        self.assertEqual([message['to'] for message in mock_send.call_args.args[0]], ['ExponentPushToken[half-0]'])
+        self.assertIn('Sent 0 reminders to 0 users', output)
+
+    def test_pace_uses_the_rollup(self, mock_send):
+        instance, users = self.create_org('pace', days_elapsed=6, days_left=4, member_hours=[1, 5])
+
+        behind = members_behind_pace(timezone.now())
+
+        self.assertEqual(len(behind), 1)
+        user_id, behind_instance, hours, expected = behind[0]
+        self.assertEqual((user_id, behind_instance, hours), (users[0].id, instance, 1))
+        self.assertAlmostEqual(expected, 6, places=2)
+
+
+class FakeExpoServer:
+    """
+    Minimal local stand-in for the Expo push API. Tokens containing 'unregistered' get a
+    DeviceNotRegistered ticket, tokens containing 'gone' a DeviceNotRegistered receipt, and
+    queued status codes are answered (with Retry-After: 0) before any real response.
+    """
+
+    def __init__(self):
+        self.send_batches = []
+        self.receipt_batches = []
+        self.queued_statuses = []
+        self.tokens_by_ticket = {}
+        self.lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                with server.lock:
+                    status = server.queued_statuses.pop(0) if server.queued_statuses else 200
+                    if status == 200:
+                        body = server.handle(self.path, payload)
+                if status != 200:
+                    self.send_response(status)
+                    self.send_header('Retry-After', '0')
+                    self.end_headers()
+                    return
+                content = json.dumps(body).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/--/api/v2"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def handle(self, path, payload):
+        if path.endswith('/push/send'):
+            self.send_batches.append(payload)
+            tickets = []
+            for message in payload:
+                if 'unregistered' in message['to']:
+                    tickets.append({'status': 'error', 'message': 'not registered',
+                                    'details': {'error': 'DeviceNotRegistered'}})
+                else:
+                    ticket_id = f"ticket-{len(self.tokens_by_ticket)}"
+                    self.tokens_by_ticket[ticket_id] = message['to']
+                    tickets.append({'status': 'ok', 'id': ticket_id})
+            return {'data': tickets}
+        self.receipt_batches.append(payload['ids'])
+        receipts = {}
+        for ticket_id in payload['ids']:
+            if 'gone' in self.tokens_by_ticket.get(ticket_id, ''):
+                receipts[ticket_id] = {'status': 'error', 'details': {'error': 'DeviceNotRegistered'}}
+            elif ticket_id in self.tokens_by_ticket:
+                receipts[ticket_id] = {'status': 'ok'}
+        return {'data': receipts}
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class ExpoPushSenderTests(TestCase):
+    def setUp(self):
+        self.org = Org.objects.create(name='Push Chapter', reg_code='PUSH123', school='Test University')
+        self.user = User.objects.create_user(email='push@example.com', password='password123', org=self.org)
+        self.expo = FakeExpoServer().__enter__()
+        self.addCleanup(self.expo.__exit__)
+        settings_override = override_settings(EXPO_API_URL=self.expo.url, EXPO_PUSH_RETRY_BACKOFF=0)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def create_tokens(self, tokens):
+        NotificationToken.objects.bulk_create([
+            NotificationToken(user=self.user, token=token, device_id=token) for token in tokens
+        ])
+
+    def test_tokens_are_sent_in_chunks_of_100(self):
+        tokens = [f"ExponentPushToken[{index}]" for index in range(250)]
+
+        result = send_push_notification(tokens, 'Title', 'Body', {'type': 'test'})
+
+        self.assertNotIn('error', result)
+        self.assertEqual(len(result['data']), 250)
+        self.assertEqual(sorted(len(batch) for batch in self.expo.send_batches), [50, 100, 100])
+        sent = [message['to'] for batch in self.expo.send_batches for message in batch]
+        self.assertCountEqual(sent, tokens)
+        self.assertEqual(self.expo.send_batches[0][0]['data'], {'type': 'test'})
+        self.assertEqual(PushTicket.objects.count(), 250)
+
+    def test_rate_limited_and_server_errors_are_retried(self):
+        self.expo.queued_statuses = [429, 503]
+
+        result = send_push_notification(['ExponentPushToken[a]'], 'Title', 'Body')
+
+        self.assertNotIn('error', result)
+        self.assertEqual(result['data'][0]['status'], 'ok')
+        self.assertEqual(len(self.expo.send_batches), 1)
+
+    @override_settings(EXPO_PUSH_MAX_RETRIES=1)
+    def test_chunk_failing_after_retries_is_reported(self):
+        self.expo.queued_statuses = [503, 503]
+
+        result = send_push_notification(['ExponentPushToken[a]'], 'Title', 'Body')
+
+        self.assertIn('1 of 1 messages could not be sent', result['error'])
+        self.assertTrue(result['transport_failed'])
+        self.assertEqual(PushTicket.objects.count(), 0)
+
+    def test_expo_error_tickets_are_not_transport_failures(self):
+        result = send_push_notification(['ExponentPushToken[unregistered]'], 'Title', 'Body')
+
+        self.assertEqual(result['data'][0]['details']['error'], 'DeviceNotRegistered')
+        self.assertNotIn('transport_failed', result)
+
+    @override_settings(EXPO_PUSH_MAX_RETRIES=0)
+    def test_admin_send_reports_transport_failure(self):
+        self.user.is_staff = True
+        self.user.save()
+        self.create_tokens(['ExponentPushToken[a]'])
+        self.expo.queued_statuses = [503]
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+
+        response = client.post(
+            reverse('send-notification'), {'user_ids': [self.user.id], 'title': 'Title', 'body': 'Body'}, format='json',
+        )
+
+        self.assertEqual(response.status_code, 502)
+        self.assertIn('1 of 1 messages could not be sent', response.data['error'])
+
+    def test_device_not_registered_ticket_deactivates_token(self):
+        self.create_tokens(['ExponentPushToken[ok]', 'ExponentPushToken[unregistered]'])
+
+        send_push_notification(['ExponentPushToken[ok]', 'ExponentPushToken[unregistered]'], 'Title', 'Body')
+
+        active = dict(NotificationToken.objects.values_list('token', 'is_active'))
+        self.assertEqual(active, {'ExponentPushToken[ok]': True, 'ExponentPushToken[unregistered]': False})
+
+    def test_receipts_are_fetched_in_bulk_and_deactivate_tokens(self):
+        tokens = [f"ExponentPushToken[{index}]" for index in range(1500)] + ['ExponentPushToken[gone]']
+        self.create_tokens(tokens)
+        send_push_notification(tokens, 'Title', 'Body')
+
+        self.assertEqual(check_push_receipts(), (0, 0))
+        PushTicket.objects.update(created_at=timezone.now() - timedelta(minutes=20))
+        out = StringIO()
+        call_command('check_push_receipts', stdout=out)
+
+        self.assertIn('Checked 1501 push receipts, deactivated 1 tokens', out.getvalue())
+        self.assertEqual(sorted(len(batch) for batch in self.expo.receipt_batches), [501, 1000])
+        self.assertFalse(NotificationToken.objects.get(token='ExponentPushToken[gone]').is_active)
+        self.assertEqual(NotificationToken.objects.filter(is_active=True).count(), 1500)
+        self.assertFalse(PushTicket.objects.exists())
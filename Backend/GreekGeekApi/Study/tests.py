@@ -1,12 +1,33 @@
-from django.test import TestCase, override_settings
-from .models import Org, OrgSettings, User, Group, Location, Session, EmailVerificationToken
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import IntegrityError, connection, transaction
+from django.db.transaction import TransactionManagementError
+from django.conf import settings
+from django.core.cache import cache
+from .models import Org, OrgSettings, User, Group, Location, Session, EmailVerificationToken, PeriodSetting, PeriodInstance, UserPeriodHours
+from django.core.management import call_command
+from django.core.management.base import CommandError
 from rest_framework import status
 from rest_framework.test import APIClient
 from django.urls import reverse
 from datetime import datetime, timedelta
 from django.utils import timezone
 from unittest.mock import patch
-
+from io import StringIO
+import gzip
+import json
+import math
+from pathlib import Path
+import random
+import tempfile
+import time
+from zoneinfo import ZoneInfo
+from .serializers import OrgDashboardSerializer
+from .utils import _active_period_cache, active_period_scope, calculate_period_start_date, calculate_user_hours, get_or_create_period_instance, open_session_for, org_advisory_lock, period_hours_drift, record_session_hours, resolve_active_period, roll_over_period_instance
+
+
+# Tests that clear the cache get their own, never whatever CACHE_BACKEND points at
+TEST_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'study-tests'}}
 
 class UserDashboardTestCase(TestCase):
     def setUp(self):
@@ -228,6 +249,801 @@ class UserDashboardTestCase(TestCase):
             self.assertIn('location', session)
 
 
+class OrgMembersQueryMixin:
+    """
+    An org with a current custom period, a Pledges group and a signed-in viewer, grown
+    with add_members for query-count tests. Subclasses give each member sessions.
+    """
+    viewer_email = "viewer@example.com"
+    viewer_is_staff = False
+
+    def setUp(self):
+        self.client = APIClient()
+        self.org = Org.objects.create(
+            name="Query Org",
+            reg_code="QUERY1",
+            school="Test School",
+        )
+        OrgSettings.objects.create(org=self.org)
+        self.group = Group.objects.create(org=self.org, name="Pledges")
+        self.user = User.objects.create_user(
+            email=self.viewer_email,
+            password="password123",
+            org=self.org,
+            is_staff=self.viewer_is_staff,
+        )
+        PeriodSetting.objects.create(
+            org=self.org,
+            period_type='custom',
+            custom_days=7,
+            required_hours=2,
+            start_date=timezone.now() - timedelta(days=1),
+        )
+        self.member_count = 0
+        self.client.force_authenticate(user=self.user)
+
+    def add_members(self, count):
+        for _ in range(count):
+            self.member_count += 1
+            member = User.objects.create_user(
+                email=f"member{self.member_count}@example.com",
+                password="password123",
+                org=self.org,
+                group=self.group,
+            )
+            self.add_sessions(member)
+
+    def add_sessions(self, member):
+        raise NotImplementedError
+
+    def query_count(self, url_name, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(url_name), params)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(queries), response
+
+
+@override_settings(CACHES=TEST_CACHES)
+class DashboardLeaderboardQueryTestCase(OrgMembersQueryMixin, TestCase):
+    def add_sessions(self, member):
+        Session.objects.create(start_time=timezone.now() - timedelta(hours=3), hours=1.5, user=member, org=self.org)
+        Session.objects.create(start_time=timezone.now() - timedelta(hours=1), hours=0.5, user=member, org=self.org)
+        # Outside the current period window
+        Session.objects.create(start_time=timezone.now() - timedelta(days=10), hours=4.0, user=member, org=self.org)
+
+    def dashboard_query_count(self):
+        # Measure a full build of the org payload, not a cache hit
+        cache.clear()
+        return self.query_count('dashboard')
+
+    def test_org_users_query_count_is_flat_as_org_grows(self):
+        self.add_members(2)
+        # First request creates the current period instance
+        self.client.get(reverse('dashboard'))
+
+        small_org_queries, _ = self.dashboard_query_count()
+        self.add_members(15)
+        large_org_queries, response = self.dashboard_query_count()
+
+        self.assertEqual(small_org_queries, large_org_queries)
+        self.assertEqual(len(response.data['org_users']), 18)
+
+    def test_org_users_include_group_and_period_hours(self):
+        self.add_members(1)
+
+        response = self.client.get(reverse('dashboard'))
+
+        members = {member['email']: member for member in response.data['org_users']}
+        self.assertEqual(members['member1@example.com']['total_hours'], 2.0)
+        self.assertEqual(members['member1@example.com']['group'], {'id': self.group.id, 'name': 'Pledges', 'org': self.org.id})
+        self.assertEqual(members['viewer@example.com']['total_hours'], 0.0)
+        self.assertIsNone(members['viewer@example.com']['group'])
+
+
+class OrgReportQueryTestCase(OrgMembersQueryMixin, TestCase):
+    viewer_email = "admin@example.com"
+    viewer_is_staff = True
+
+    def add_sessions(self, member):
+        Session.objects.create(start_time=timezone.now() - timedelta(days=30), hours=4.0, user=member, org=self.org)
+        start_time = timezone.now() - timedelta(hours=2)
+        session = Session.objects.create(
+            start_time=start_time,
+            hours=1.5,
+            user=member,
+            org=self.org,
+            period_instance=get_or_create_period_instance(member, start_time),
+        )
+        record_session_hours(session)
+
+    def test_query_count_is_flat_as_org_grows(self):
+        self.add_members(2)
+
+        small_org_queries, _ = self.query_count('org-report')
+        self.add_members(15)
+        large_org_queries, response = self.query_count('org-report')
+
+        self.assertEqual(small_org_queries, large_org_queries)
+        self.assertEqual(len(response.data['users']), 18)
+
+    def test_report_includes_group_sessions_and_current_period_hours(self):
+        self.add_members(1)
+
+        _, response = self.query_count('org-report')
+
+        users = {user['email']: user for user in response.data['users']}
+        member = users['member1@example.com']
+        self.assertEqual(member['group'], {'id': self.group.id, 'name': 'Pledges'})
+        self.assertEqual(member['current_period_hours'], 1.5)
+        self.assertEqual([session['hours'] for session in member['sessions']], [1.5, 4.0])
+        self.assertIsNotNone(member['sessions'][0]['period_instance'])
+        self.assertIsNone(users['admin@example.com']['group'])
+        self.assertEqual(users['admin@example.com']['sessions'], [])
+        self.assertEqual(users['admin@example.com']['current_period_hours'], 0)
+        self.assertEqual(len(response.data['period_instances']), 1)
+
+    def test_stream_mode_matches_buffered_report(self):
+        self.add_members(3)
+
+        buffered = self.client.get(reverse('org-report'))
+        streamed = self.client.get(reverse('org-report'), {'stream': '1'})
+
+        self.assertEqual(streamed.status_code, status.HTTP_200_OK)
+        self.assertTrue(streamed.streaming)
+        self.assertEqual(streamed['Content-Type'], 'application/json')
+        body = b''.join(streamed.streaming_content)
+        self.assertEqual(json.loads(body), buffered.json())
+
+    def test_stream_mode_query_count_is_flat_as_org_grows(self):
+        self.add_members(2)
+
+        small_org_queries, _ = self.query_count('org-report', {'stream': '1'})
+        self.add_members(15)
+        large_org_queries, _ = self.query_count('org-report', {'stream': '1'})
+
+        self.assertEqual(small_org_queries, large_org_queries)
+
+
+def legacy_period_start_date(period_setting, session_time):
+    """The original week-by-week loop, kept as the reference for calculate_period_start_date."""
+    start_date = period_setting.start_date
+    if session_time < start_date:
+        return start_date
+    if period_setting.period_type == "weekly":
+        first_due_date = period_setting.get_next_due_date()
+        if first_due_date.date() >= session_time.date():
+            return start_date
+        current_start = first_due_date + timedelta(days=1)
+        current_end = period_setting.get_next_due_date(from_date=current_start)
+        while current_end.date() < session_time.date():
+            current_start = current_end + timedelta(days=1)
+            current_end = period_setting.get_next_due_date(from_date=current_start)
+        return current_start
+    elif period_setting.period_type == "monthly":
+        months_passed = (session_time.year - start_date.year) * 12 + (session_time.month - start_date.month)
+        new_month = start_date.month + months_passed
+        new_year = start_date.year + (new_month - 1) // 12
+        new_month = ((new_month - 1) % 12) + 1
+        return start_date.replace(year=new_year, month=new_month)
+    elif period_setting.period_type == "custom" and period_setting.custom_days:
+        days_since_start = (session_time - start_date).days
+        periods_passed = math.floor(days_since_start / period_setting.custom_days)
+        return start_date + timedelta(days=periods_passed * period_setting.custom_days)
+    return start_date
+
+
+class PeriodStartDateTestCase(SimpleTestCase):
+    TIMEZONES = ['UTC', 'America/New_York', 'America/Los_Angeles', 'Europe/London', 'Asia/Kolkata', 'Pacific/Auckland']
+
+    def random_datetime(self, rng, earliest, span_days):
+        tz = ZoneInfo(rng.choice(self.TIMEZONES))
+        moment = earliest + timedelta(seconds=rng.randrange(span_days * 24 * 60 * 60))
+        return moment.astimezone(tz)
+
+    def outcome(self, func, period_setting, session_time):
+        try:
+            return func(period_setting, session_time)
+        except ValueError as exc:
+            # Monthly periods starting on the 29th-31st can land on a missing day
+            return type(exc)
+
+    def test_matches_legacy_loop_for_random_dates_and_timezones(self):
+        rng = random.Random(20241018)
+        earliest = datetime(2018, 1, 1, tzinfo=ZoneInfo('UTC'))
+        for _ in range(5000):
+            period_setting = PeriodSetting(
+                period_type=rng.choice(['weekly', 'monthly', 'custom']),
+                due_day_of_week=rng.randrange(7),
+                custom_days=rng.randint(1, 60),
+                required_hours=2,
+                start_date=self.random_datetime(rng, earliest, 5 * 365),
+            )
+            # Mostly after the start date, sometimes before it
+            session_time = self.random_datetime(rng, period_setting.start_date - timedelta(days=30), 3 * 365)
+            with self.subTest(
+                period_type=period_setting.period_type,
+                start_date=period_setting.start_date,
+                session_time=session_time,
+            ):
+                self.assertEqual(
+                    self.outcome(calculate_period_start_date, period_setting, session_time),
+                    self.outcome(legacy_period_start_date, period_setting, session_time),
+                )
+
+    def test_weekly_session_on_due_date_stays_in_that_period(self):
+        # Wednesday start, Sunday due dates
+        period_setting = PeriodSetting(
+            period_type='weekly',
+            due_day_of_week=6,
+            required_hours=2,
+            start_date=datetime(2025, 1, 1, tzinfo=ZoneInfo('UTC')),
+        )
+
+        self.assertEqual(
+            calculate_period_start_date(period_setting, datetime(2025, 1, 5, 20, tzinfo=ZoneInfo('UTC'))),
+            period_setting.start_date,
+        )
+        self.assertEqual(
+            calculate_period_start_date(period_setting, datetime(2025, 1, 19, 20, tzinfo=ZoneInfo('UTC'))),
+            datetime(2025, 1, 13, tzinfo=ZoneInfo('UTC')),
+        )
+        self.assertEqual(
+            calculate_period_start_date(period_setting, datetime(2025, 1, 20, 1, tzinfo=ZoneInfo('UTC'))),
+            datetime(2025, 1, 20, tzinfo=ZoneInfo('UTC')),
+        )
+
+
+class UserPeriodHoursRollupTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.org = Org.objects.create(
+            name="Rollup Org",
+            reg_code="ROLL1",
+            school="Test School",
+        )
+        OrgSettings.objects.create(
+            org=self.org,
+            allow_manual_entry=True,
+            require_location_verification=False,
+        )
+        self.user = User.objects.create_user(
+            email="member@example.com",
+            password="password123",
+            org=self.org,
+        )
+        self.admin = User.objects.create_user(
+            email="admin@example.com",
+            password="password123",
+            org=self.org,
+            is_staff=True,
+        )
+        PeriodSetting.objects.create(
+            org=self.org,
+            period_type='custom',
+            custom_days=7,
+            required_hours=2,
+            start_date=timezone.now() - timedelta(days=1),
+        )
+
+    def rollup(self):
+        return UserPeriodHours.objects.get(user=self.user)
+
+    def test_rollup_follows_session_writes(self):
+        self.client.force_authenticate(user=self.user)
+        self.client.post('/api/clockin/', {})
+        self.assertFalse(UserPeriodHours.objects.exists())
+
+        response = self.client.post('/api/clockout/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        clocked = Session.objects.get(user=self.user)
+        self.assertEqual(self.rollup().session_count, 1)
+        self.assertAlmostEqual(self.rollup().total_hours, clocked.hours)
+
+        response = self.client.post('/api/manual-session/', {"hours": 1.5})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        manual_id = response.data['id']
+        self.assertEqual(self.rollup().session_count, 2)
+        self.assertAlmostEqual(self.rollup().total_hours, clocked.hours + 1.5)
+
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.patch(f'/api/sessions/{manual_id}/', {"hours": 2.5}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertAlmostEqual(self.rollup().total_hours, clocked.hours + 2.5)
+
+        response = self.client.delete(f'/api/sessions/{clocked.id}/')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.rollup().session_count, 1)
+        self.assertAlmostEqual(self.rollup().total_hours, 2.5)
+
+        call_command('rebuild_hours_rollup', '--check', stdout=StringIO())
+
+    def test_backfill_attaches_legacy_sessions_to_rollup(self):
+        Session.objects.create(start_time=timezone.now() - timedelta(hours=2), hours=1.25, user=self.user, org=self.org)
+        self.client.force_authenticate(user=self.user)
+
+        response = self.client.get(reverse('dashboard'))
+
+        self.assertEqual(response.data['total_hours'], 1.25)
+        self.assertEqual(self.rollup().session_count, 1)
+
+    def test_backdated_manual_session_keeps_current_period_active(self):
+        PeriodSetting.objects.update(start_date=timezone.now() - timedelta(days=20))
+        self.client.force_authenticate(user=self.user)
+        self.client.post('/api/manual-session/', {"hours": 3.0})
+        current = PeriodInstance.objects.get(is_active=True)
+
+        response = self.client.post('/api/manual-session/', {
+            "hours": 0.5,
+            "start_time": (timezone.now() - timedelta(days=10)).isoformat(),
+        })
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        self.assertEqual(PeriodInstance.objects.get(is_active=True), current)
+        past = Session.objects.get(id=response.data['id']).period_instance
+        self.assertFalse(past.is_active)
+        self.assertLess(past.start_date, current.start_date)
+        self.assertEqual(self.client.get(reverse('dashboard')).data['total_hours'], 3.0)
+        self.assertEqual(PeriodInstance.objects.count(), 2)
+        call_command('rebuild_hours_rollup', '--check', stdout=StringIO())
+
+    def test_new_instance_reclaims_sessions_from_replaced_instance(self):
+        self.client.force_authenticate(user=self.user)
+        self.client.post('/api/manual-session/', {"hours": 3.0})
+        replaced = PeriodInstance.objects.get(is_active=True)
+        PeriodInstance.objects.filter(id=replaced.id).update(is_active=False)
+
+        instance = roll_over_period_instance(replaced.period_setting, timezone.now())
+
+        self.assertNotEqual(instance, replaced)
+        self.assertEqual(Session.objects.get().period_instance, instance)
+        self.assertEqual(calculate_user_hours(self.user, instance), 3.0)
+        self.assertFalse(UserPeriodHours.objects.filter(period_instance=replaced).exists())
+        call_command('rebuild_hours_rollup', '--check', stdout=StringIO())
+
+    def test_editing_instance_dates_moves_sessions_and_totals(self):
+        self.client.force_authenticate(user=self.user)
+        self.client.post('/api/manual-session/', {"hours": 1.0})
+        instance = PeriodInstance.objects.get(is_active=True)
+        manual = Session.objects.get()
+        earlier = Session.objects.create(
+            user=self.user, org=self.org, start_time=instance.start_date - timedelta(days=1), hours=2.0,
+        )
+
+        instance.start_date -= timedelta(days=2)
+        instance.save()
+
+        earlier.refresh_from_db()
+        self.assertEqual(earlier.period_instance, instance)
+        self.assertEqual(calculate_user_hours(self.user, instance), 3.0)
+
+        instance.end_date = earlier.start_time + timedelta(hours=1)
+        instance.save()
+
+        manual.refresh_from_db()
+        self.assertIsNone(manual.period_instance)
+        self.assertEqual(calculate_user_hours(self.user, instance), 2.0)
+        call_command('rebuild_hours_rollup', '--check', stdout=StringIO())
+
+    def test_rebuild_command_detects_and_repairs_drift(self):
+        self.client.force_authenticate(user=self.user)
+        self.client.post('/api/manual-session/', {"hours": 1.0})
+        UserPeriodHours.objects.update(total_hours=9.0)
+
+        with self.assertRaises(CommandError):
+            call_command('rebuild_hours_rollup', '--check', stdout=StringIO())
+
+        call_command('rebuild_hours_rollup', stdout=StringIO())
+
+        self.assertEqual(self.rollup().total_hours, 1.0)
+        call_command('rebuild_hours_rollup', '--check', stdout=StringIO())
+
+
+@override_settings(CACHES=TEST_CACHES)
+class PeriodSettingBackfillTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.org = Org.objects.create(
+            name="Backfill Org",
+            reg_code="BACKFILL1",
+            school="Test School",
+            timezone='America/New_York',
+        )
+        self.admin = User.objects.create_user(
+            email="admin@example.com",
+            password="password123",
+            org=self.org,
+            is_staff=True,
+        )
+        self.member = User.objects.create_user(
+            email="member@example.com",
+            password="password123",
+            org=self.org,
+        )
+        self.client.force_authenticate(user=self.admin)
+
+    def create_weekly_setting(self, weeks_back):
+        start_date = (timezone.now() - timedelta(weeks=weeks_back)).replace(hour=0, minute=0, second=0, microsecond=0)
+        # Measure creation alone, not the cascade delete of a previous setting
+        PeriodSetting.objects.filter(org=self.org).delete()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('period-settings'), {
+                'period_type': 'weekly',
+                'due_day_of_week': 6,
+                'required_hours': 2,
+                'start_date': start_date.isoformat(),
+            }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return len(queries)
+
+    def test_backdated_setting_query_count_does_not_grow_with_history(self):
+        short_history_queries = self.create_weekly_setting(weeks_back=4)
+        long_history_queries = self.create_weekly_setting(weeks_back=52)
+
+        self.assertEqual(short_history_queries, long_history_queries)
+        self.assertGreaterEqual(PeriodInstance.objects.filter(period_setting__org=self.org).count(), 52)
+
+    def test_backdated_setting_creates_contiguous_periods_and_attaches_sessions(self):
+        sessions = [
+            Session.objects.create(start_time=timezone.now() - timedelta(days=days_ago, hours=1), hours=1.0, user=self.member, org=self.org)
+            for days_ago in (0, 6, 13, 40, 90)
+        ]
+
+        self.create_weekly_setting(weeks_back=20)
+
+        instances = list(PeriodInstance.objects.filter(period_setting__org=self.org).order_by('start_date'))
+        self.assertEqual([instance.is_active for instance in instances].count(True), 1)
+        self.assertTrue(instances[-1].is_active)
+        for previous, following in zip(instances, instances[1:]):
+            # Each period starts the day after the previous due date, with no gaps
+            self.assertLess(previous.start_date, following.start_date)
+            self.assertLessEqual(following.start_date - previous.end_date, timedelta(days=1))
+        for session in sessions:
+            session.refresh_from_db()
+            containing = [instance for instance in instances if instance.start_date <= session.start_time <= instance.end_date]
+            self.assertEqual(session.period_instance_id, containing[0].id)
+        self.assertEqual(period_hours_drift(), [])
+        self.assertEqual(
+            UserPeriodHours.objects.get(user=self.member, period_instance=instances[-1]).total_hours,
+            sum(1.0 for session in sessions if session.period_instance_id == instances[-1].id),
+        )
+
+
+class RollOverPeriodsCommandTestCase(TestCase):
+    def setUp(self):
+        self.org = Org.objects.create(
+            name="Rollover Org",
+            reg_code="ROLL1",
+            school="Test School",
+        )
+        self.user = User.objects.create_user(
+            email="member@example.com",
+            password="password123",
+            org=self.org,
+        )
+        self.period_setting = PeriodSetting.objects.create(
+            org=self.org,
+            period_type='custom',
+            custom_days=7,
+            required_hours=2,
+            start_date=timezone.now() - timedelta(days=10),
+        )
+        self.expired = PeriodInstance.objects.create(
+            period_setting=self.period_setting,
+            start_date=self.period_setting.start_date,
+            end_date=self.period_setting.start_date + timedelta(days=7),
+            is_active=True,
+        )
+
+    def test_rolls_over_ended_period_once(self):
+        session = Session.objects.create(start_time=timezone.now() - timedelta(hours=2), hours=1.0, user=self.user, org=self.org)
+
+        call_command('roll_over_periods', stdout=StringIO())
+        call_command('roll_over_periods', stdout=StringIO())
+
+        self.expired.refresh_from_db()
+        self.assertFalse(self.expired.is_active)
+        active = PeriodInstance.objects.get(period_setting=self.period_setting, is_active=True)
+        self.assertLessEqual(active.start_date, timezone.now())
+        self.assertGreaterEqual(active.end_date, timezone.now())
+        self.assertEqual(PeriodInstance.objects.filter(period_setting=self.period_setting).count(), 2)
+        session.refresh_from_db()
+        self.assertEqual(session.period_instance, active)
+
+    def test_request_path_only_reads_after_rollover(self):
+        call_command('roll_over_periods', stdout=StringIO())
+
+        with CaptureQueriesContext(connection) as queries:
+            instance = get_or_create_period_instance(self.user, timezone.now())
+
+        self.assertTrue(instance.is_active)
+        self.assertTrue(all(query['sql'].startswith('SELECT') for query in queries))
+
+    def test_next_period_is_prepared_before_the_boundary(self):
+        self.expired.end_date = timezone.now() + timedelta(minutes=30)
+        self.expired.save()
+
+        out = StringIO()
+        call_command('roll_over_periods', stdout=out)
+        call_command('roll_over_periods', stdout=StringIO())
+
+        self.assertIn('Rolled over 0 period settings, prepared 1 next periods', out.getvalue())
+        prepared = PeriodInstance.objects.get(period_setting=self.period_setting, is_active=False)
+        self.assertLessEqual(prepared.start_date, self.expired.end_date)
+        self.assertGreater(prepared.end_date, self.expired.end_date)
+        self.assertTrue(PeriodInstance.objects.get(pk=self.expired.pk).is_active)
+
+    def test_request_path_does_not_write_at_the_boundary(self):
+        self.expired.end_date = timezone.now() + timedelta(minutes=30)
+        self.expired.save()
+        call_command('roll_over_periods', stdout=StringIO())
+        prepared = PeriodInstance.objects.get(period_setting=self.period_setting, is_active=False)
+        # The boundary passes before the next cron run
+        PeriodInstance.objects.filter(pk=self.expired.pk).update(end_date=timezone.now() - timedelta(minutes=1))
+
+        with CaptureQueriesContext(connection) as queries:
+            instance = get_or_create_period_instance(self.user, timezone.now())
+
+        self.assertEqual(instance, prepared)
+        self.assertTrue(all(query['sql'].startswith('SELECT') for query in queries))
+
+        call_command('roll_over_periods', stdout=StringIO())
+
+        self.assertEqual(PeriodInstance.objects.get(period_setting=self.period_setting, is_active=True), prepared)
+        self.assertEqual(PeriodInstance.objects.filter(period_setting=self.period_setting).count(), 2)
+
+    def test_current_period_is_left_alone(self):
+        self.expired.end_date = timezone.now() + timedelta(days=1)
+        self.expired.save()
+
+        out = StringIO()
+        call_command('roll_over_periods', stdout=out)
+
+        self.assertIn('Rolled over 0 period settings', out.getvalue())
+        self.assertEqual(PeriodInstance.objects.filter(period_setting=self.period_setting).count(), 1)
+
+
+class PeriodInstanceLockingTestCase(TestCase):
+    def setUp(self):
+        self.org = Org.objects.create(
+            name="Locking Org",
+            reg_code="LOCK1",
+            school="Test School",
+        )
+        self.user = User.objects.create_user(
+            email="member@example.com",
+            password="password123",
+            org=self.org,
+        )
+        self.period_setting = PeriodSetting.objects.create(
+            org=self.org,
+            period_type='custom',
+            custom_days=7,
+            required_hours=2,
+            start_date=timezone.now() - timedelta(days=10),
+        )
+
+    def test_only_one_active_instance_per_setting(self):
+        PeriodInstance.objects.create(
+            period_setting=self.period_setting,
+            start_date=self.period_setting.start_date,
+            end_date=self.period_setting.start_date + timedelta(days=7),
+        )
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            PeriodInstance.objects.create(
+                period_setting=self.period_setting,
+                start_date=self.period_setting.start_date + timedelta(days=7),
+                end_date=self.period_setting.start_date + timedelta(days=14),
+            )
+
+    def test_rollover_leaves_one_active_instance(self):
+        first = get_or_create_period_instance(self.user, timezone.now() - timedelta(days=9))
+        current = get_or_create_period_instance(self.user, timezone.now())
+
+        self.assertNotEqual(first.id, current.id)
+        self.assertEqual(
+            list(PeriodInstance.objects.filter(period_setting=self.period_setting, is_active=True)),
+            [current],
+        )
+
+    def test_org_lock_requires_a_transaction(self):
+        with transaction.atomic():
+            org_advisory_lock(self.org.id)
+
+        with patch.object(connection, 'in_atomic_block', False):
+            with self.assertRaises(TransactionManagementError):
+                org_advisory_lock(self.org.id)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ActivePeriodResolverTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.org = Org.objects.create(
+            name="Resolver Org",
+            reg_code="RESOLVE1",
+            school="Test School",
+        )
+        OrgSettings.objects.create(org=self.org)
+        self.user = User.objects.create_user(
+            email="member@example.com",
+            password="password123",
+            org=self.org,
+        )
+        self.period_setting = PeriodSetting.objects.create(
+            org=self.org,
+            period_type='custom',
+            custom_days=7,
+            required_hours=2,
+            start_date=timezone.now() - timedelta(days=1),
+        )
+        self.instance = get_or_create_period_instance(self.user, timezone.now())
+
+    def tearDown(self):
+        _active_period_cache.clear()
+
+    def period_queries(self, queries):
+        return [
+            query for query in queries
+            if 'FROM "Study_periodsetting"' in query['sql'] or 'FROM "Study_periodinstance"' in query['sql']
+        ]
+
+    def test_dashboard_resolves_active_period_once(self):
+        self.client.force_authenticate(user=self.user)
+        cache.clear()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('dashboard'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['active_period_setting']['id'], str(self.period_setting.id))
+        # One lookup each for the setting and its active instance, plus the period list
+        self.assertEqual(len(self.period_queries(queries)), 3)
+
+    def test_process_cache_reuses_committed_lookup_until_invalidated(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(resolve_active_period(self.org.id), (self.period_setting, self.instance))
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(resolve_active_period(self.org.id), (self.period_setting, self.instance))
+        self.assertEqual(len(queries), 0)
+
+        self.instance.is_active = False
+        self.instance.save()
+
+        self.assertEqual(resolve_active_period(self.org.id), (self.period_setting, None))
+
+    @override_settings(ACTIVE_PERIOD_CACHE_TIMEOUT=0)
+    def test_process_cache_can_be_disabled(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            resolve_active_period(self.org.id)
+
+        with CaptureQueriesContext(connection) as queries:
+            resolve_active_period(self.org.id)
+        self.assertEqual(len(queries), 2)
+
+    def replace_setting_in_another_process(self, stale_instance=None):
+        """Swap the org's period setting, leaving this process's cache on the old rows."""
+        stale = (self.period_setting, stale_instance or self.instance)
+        self.period_setting.delete()
+        new_setting = PeriodSetting.objects.create(
+            org=self.org,
+            period_type='custom',
+            custom_days=14,
+            required_hours=3,
+            start_date=timezone.now() - timedelta(days=2),
+        )
+        _active_period_cache[self.org.id] = (time.monotonic() + 30, stale)
+        return new_setting
+
+    def test_clock_in_bypasses_stale_process_cache(self):
+        OrgSettings.objects.filter(org=self.org).update(require_location_verification=False)
+        new_setting = self.replace_setting_in_another_process()
+        self.client.force_authenticate(user=self.user)
+
+        response = self.client.post('/api/clockin/', {})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Session.objects.get(user=self.user).period_instance.period_setting, new_setting)
+
+    def test_rollover_never_uses_cached_setting(self):
+        ended = PeriodInstance(
+            id=self.instance.id,
+            period_setting=self.period_setting,
+            start_date=timezone.now() - timedelta(days=8),
+            end_date=timezone.now() - timedelta(days=1),
+        )
+        new_setting = self.replace_setting_in_another_process(stale_instance=ended)
+        self.client.force_authenticate(user=self.user)
+
+        response = self.client.get('/api/latest-period/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(PeriodInstance.objects.get(is_active=True).period_setting, new_setting)
+
+    def test_clock_in_reraises_unrelated_integrity_errors(self):
+        OrgSettings.objects.filter(org=self.org).update(require_location_verification=False)
+        self.client.force_authenticate(user=self.user)
+
+        with patch('Study.views.Session.objects.create', side_effect=IntegrityError('FOREIGN KEY constraint failed')):
+            with self.assertRaises(IntegrityError):
+                self.client.post('/api/clockin/', {})
+
+    def test_request_scope_memoizes_without_process_cache(self):
+        with active_period_scope():
+            resolve_active_period(self.org.id)
+            with CaptureQueriesContext(connection) as queries:
+                resolve_active_period(self.org.id)
+        self.assertEqual(len(queries), 0)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class OrgDashboardCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.org = Org.objects.create(
+            name="Cached Org",
+            reg_code="CACHE1",
+            school="Test School",
+        )
+        OrgSettings.objects.create(org=self.org, require_location_verification=False)
+        self.alice = User.objects.create_user(email="alice@example.com", password="password123", org=self.org)
+        self.bob = User.objects.create_user(email="bob@example.com", password="password123", org=self.org)
+        Session.objects.create(start_time=timezone.now() - timedelta(hours=2), hours=1.0, user=self.alice, org=self.org)
+        Session.objects.create(start_time=timezone.now() - timedelta(hours=3), hours=2.0, user=self.bob, org=self.org)
+
+    def get_dashboard(self, user):
+        self.client.force_authenticate(user=user)
+        response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_org_payload_is_built_once_per_version(self):
+        with patch.object(
+            OrgDashboardSerializer, 'to_representation',
+            autospec=True, side_effect=OrgDashboardSerializer.to_representation,
+        ) as build:
+            alice_data = self.get_dashboard(self.alice)
+            bob_data = self.get_dashboard(self.bob)
+
+        self.assertEqual(build.call_count, 1)
+        self.assertEqual(alice_data['org_users'], bob_data['org_users'])
+        self.assertEqual(alice_data['email'], 'alice@example.com')
+        self.assertEqual(bob_data['email'], 'bob@example.com')
+        self.assertEqual([session['hours'] for session in alice_data['user_sessions']], [1.0])
+        self.assertEqual([session['hours'] for session in bob_data['user_sessions']], [2.0])
+        self.assertEqual(alice_data['total_hours'], 1.0)
+        self.assertEqual(bob_data['total_hours'], 2.0)
+
+    def test_org_writes_invalidate_cached_payload(self):
+        self.assertEqual(self.get_dashboard(self.alice)['org_locations'], [])
+
+        Location.objects.create(name="Library", org=self.org, gps_lat=40.0, gps_long=75.0, gps_radius=10.0)
+        data = self.get_dashboard(self.bob)
+        self.assertEqual([location['name'] for location in data['org_locations']], ['Library'])
+
+        self.client.force_authenticate(user=self.alice)
+        self.client.post('/api/clockin/', {})
+        members = {member['email']: member for member in self.get_dashboard(self.bob)['org_users']}
+        self.assertTrue(members['alice@example.com']['live'])
+
+    def test_other_org_writes_keep_cached_payload(self):
+        other_org = Org.objects.create(name="Other Org", reg_code="OTHER1", school="Test School")
+        self.get_dashboard(self.alice)
+
+        with patch.object(
+            OrgDashboardSerializer, 'to_representation',
+            autospec=True, side_effect=OrgDashboardSerializer.to_representation,
+        ) as build:
+            Location.objects.create(name="Elsewhere", org=other_org, gps_lat=1.0, gps_long=1.0, gps_radius=10.0)
+            self.get_dashboard(self.bob)
+
+        self.assertEqual(build.call_count, 0)
+
+
 class WebDashboardPageTestCase(TestCase):
     def test_dashboard_page_renders(self):
         response = self.client.get(reverse('dashboard-page'))
@@ -268,6 +1084,115 @@ class WebLegalPageTestCase(TestCase):
         self.assertContains(response, 'href="/cookies/"')
 
 
+@override_settings(CACHES=TEST_CACHES)
+class PublicPageCacheTestCase(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_cached_page_is_rendered_once(self):
+        from django.shortcuts import render as django_render
+
+        with patch('Study.web_views.render', side_effect=django_render) as render:
+            first = self.client.get(reverse('support-index'))
+            second = self.client.get(reverse('support-index'))
+
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(first['ETag'], second['ETag'])
+        self.assertIn('Accept-Encoding', second['Vary'])
+        self.assertTrue(second['Content-Type'].startswith('text/html'))
+
+    def test_gzip_is_served_when_accepted(self):
+        plain = self.client.get(reverse('landing-page'))
+        compressed = self.client.get(reverse('landing-page'), HTTP_ACCEPT_ENCODING='gzip, deflate')
+        refused = self.client.get(reverse('landing-page'), HTTP_ACCEPT_ENCODING='gzip;q=0')
+
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(compressed.content), plain.content)
+        self.assertNotEqual(compressed['ETag'], plain['ETag'])
+        self.assertNotIn('Content-Encoding', refused)
+
+    def test_matching_etag_gets_not_modified(self):
+        url = reverse('compare-page', args=['greekgeek-vs-campusstudy'])
+        etag = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')['ETag']
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+        weak = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=f'"stale", W/{etag}')
+        self.assertEqual(weak.status_code, status.HTTP_304_NOT_MODIFIED)
+        # The identity representation has a different strong ETag
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+
+    def test_new_asset_version_renders_again(self):
+        from django.shortcuts import render as django_render
+
+        with patch('Study.web_views.render', side_effect=django_render) as render:
+            self.client.get(reverse('terms-page'))
+            with override_settings(STATIC_ASSET_VERSION='next-release'):
+                response = self.client.get(reverse('terms-page'))
+
+        self.assertEqual(render.call_count, 2)
+        self.assertContains(response, 'next-release')
+
+    def test_missing_pages_are_not_cached(self):
+        url = reverse('support-article', args=['no-such-article'])
+
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertIsNone(cache.get(f"page:{settings.STATIC_ASSET_VERSION}:{url}"))
+
+
+class PrerenderSiteCommandTestCase(SimpleTestCase):
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.output = Path(temp_dir.name) / 'site'
+
+    def prerender(self):
+        out = StringIO()
+        call_command('prerender_site', output=str(self.output), stdout=out)
+        return out.getvalue()
+
+    def test_writes_every_public_page_and_sitemap(self):
+        out = self.prerender()
+
+        self.assertIn('Prerendered 14 pages and sitemap.xml', out)
+        landing = (self.output / 'index.html').read_bytes()
+        self.assertEqual(landing, self.client.get(reverse('landing-page')).content)
+        self.assertEqual(gzip.decompress((self.output / 'index.html.gz').read_bytes()), landing)
+        article = (self.output / 'support' / 'gps-study-hour-tracking-for-sororities' / 'index.html').read_text()
+        self.assertIn('https://greekgeek.app/support/gps-study-hour-tracking-for-sororities/', article)
+        self.assertTrue((self.output / 'compare' / 'greekgeek-vs-campusstudy' / 'index.html').exists())
+        self.assertTrue((self.output / 'cookies' / 'index.html').exists())
+
+        sitemap = (self.output / 'sitemap.xml').read_text()
+        self.assertIn('<loc>https://greekgeek.app/</loc>', sitemap)
+        self.assertIn('<loc>https://greekgeek.app/compare/campusstudy-vs-mygreekstudy/</loc>', sitemap)
+        self.assertEqual(sitemap.count('<loc>'), 14)
+
+    def test_rerun_removes_stale_pages(self):
+        self.prerender()
+        stale = self.output / 'support' / 'retired-article' / 'index.html'
+        stale.parent.mkdir()
+        stale.write_text('old')
+
+        self.prerender()
+
+        self.assertFalse(stale.exists())
+        self.assertTrue((self.output / 'index.html').exists())
+
+    def test_refuses_to_clear_unrelated_directory(self):
+        self.output.mkdir()
+        (self.output / 'main.css').write_text('body {}')
+
+        with self.assertRaisesMessage(CommandError, 'refusing to clear it'):
+            self.prerender()
+        self.assertTrue((self.output / 'main.css').exists())
+
+
 class CurrentUserAccountTestCase(TestCase):
     def setUp(self):
         self.client = APIClient()
@@ -400,6 +1325,59 @@ class ClockInClockOutTestCase(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(Session.objects.count(), 2)
 
+    def test_database_allows_one_open_session_per_user(self):
+        Session.objects.create(start_time=timezone.now(), user=self.user, org=self.org)
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Session.objects.create(start_time=timezone.now(), user=self.user, org=self.org)
+
+    def test_concurrent_clock_in_reports_already_clocked_in(self):
+        self.client.force_authenticate(user=self.user)
+        clock_in_payload = {
+            "location_id": self.location.id,
+            "latitude": self.location.gps_lat,
+            "longitude": self.location.gps_long,
+        }
+
+        # Simulate a second tap that passed the open-session check before the first
+        # committed; the recheck after the constraint violation sees the real session
+        calls = []
+
+        def racing_open_session_for(user, for_update=False):
+            calls.append(user)
+            return None if len(calls) <= 2 else open_session_for(user, for_update)
+
+        with patch('Study.views.open_session_for', side_effect=racing_open_session_for):
+            self.client.post(self.inUrl, clock_in_payload)
+            response = self.client.post(self.inUrl, clock_in_payload)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("Already clocked in", str(response.data))
+        self.assertEqual(Session.objects.count(), 1)
+
+    def test_clock_in_out_query_count_does_not_grow_with_history(self):
+        self.client.force_authenticate(user=self.user)
+        clock_in_payload = {
+            "location_id": self.location.id,
+            "latitude": self.location.gps_lat,
+            "longitude": self.location.gps_long,
+        }
+
+        def clock_in_out_queries():
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.client.post(self.inUrl, clock_in_payload).status_code, status.HTTP_200_OK)
+                self.assertEqual(self.client.post(self.outUrl).status_code, status.HTTP_200_OK)
+            return len(queries)
+
+        # The first clock-in creates org settings and the period instance
+        clock_in_out_queries()
+        short_history_queries = clock_in_out_queries()
+        Session.objects.bulk_create([
+            Session(start_time=timezone.now() - timedelta(days=day), hours=1.0, user=self.user, org=self.org)
+            for day in range(1, 200)
+        ])
+        self.assertEqual(short_history_queries, clock_in_out_queries())
+
     def test_clock_in_without_location_when_verification_disabled(self):
         self.client.force_authenticate(user=self.user)
         OrgSettings.objects.create(
@@ -1124,6 +2102,167 @@ class OrganizationTestCase(TestCase):
         self.assertEqual(self.user1.last_location.name, "Test Location")
 
 
+@patch('Study.email_service.EmailService._send')
+class ProgressReportCommandTestCase(TestCase):
+    def create_org(self, name, member_hours, frequency='weekly', send_reports=True):
+        now = timezone.now()
+        org = Org.objects.create(name=name, reg_code=name.upper(), school='Test University')
+        OrgSettings.objects.create(org=org, send_progress_reports=send_reports, progress_report_frequency=frequency)
+        period_setting = PeriodSetting.objects.create(
+            org=org, period_type='weekly', due_day_of_week=6, required_hours=4, start_date=now - timedelta(days=3),
+        )
+        instance = PeriodInstance.objects.create(
+            period_setting=period_setting, start_date=now - timedelta(days=3), end_date=now + timedelta(days=4), is_active=True,
+        )
+        User.objects.create(email=f'admin@{name}.example.com', first_name='Admin', last_name=name, org=org, is_staff=True, password='!')
+        for index, hours in enumerate(member_hours):
+            member = User.objects.create(
+                email=f'member{index}@{name}.example.com', first_name=f'Member{index}', last_name=name, org=org, password='!',
+            )
+            UserPeriodHours.objects.create(user=member, period_instance=instance, total_hours=hours, session_count=1)
+        return org
+
+    def run_command(self, *args):
+        out = StringIO()
+        call_command('send_progress_reports', *args, stdout=out)
+        return out.getvalue()
+
+    def test_admins_get_standings_for_their_org(self, mock_send):
+        self.create_org('alpha', [5, 1])
+
+        output = self.run_command()
+
+        mock_send.assert_called_once()
+        kwargs = mock_send.call_args.kwargs
+        self.assertEqual(kwargs['to_email'], 'admin@alpha.example.com')
+        self.assertEqual(kwargs['subject'], 'alpha study progress report')
+        text = kwargs['plain_text_content']
+        self.assertIn('1 of 3 members have met the requirement', text)
+        self.assertLess(text.index('Member0 alpha - 5.0 hours'), text.index('Member1 alpha - 1.0 hours (behind)'))
+        self.assertIn('Member1 alpha', kwargs['html_content'])
+        self.assertIn('Sent 1 progress report emails for 1 orgs', output)
+        self.assertIsNotNone(OrgSettings.objects.get().progress_report_sent_at)
+
+    def test_members_option_emails_every_member(self, mock_send):
+        self.create_org('alpha', [5, 1])
+
+        self.run_command('--members')
+
+        recipients = sorted(call.kwargs['to_email'] for call in mock_send.call_args_list)
+        self.assertEqual(recipients, [
+            'admin@alpha.example.com', 'admin@alpha.example.com', 'member0@alpha.example.com', 'member1@alpha.example.com',
+        ])
+        member_email = next(call.kwargs for call in mock_send.call_args_list if call.kwargs['to_email'] == 'member1@alpha.example.com')
+        self.assertIn('ranking #2 of 3', member_email['plain_text_content'])
+        self.assertIn('3.0 hours to go', member_email['plain_text_content'])
+
+    def test_settings_and_schedule_are_honored(self, mock_send):
+        self.create_org('weekly', [1])
+        self.create_org('off', [1], send_reports=False)
+        self.create_org('never', [1], frequency='never')
+
+        self.run_command()
+        output = self.run_command()
+
+        self.assertEqual([call.kwargs['to_email'] for call in mock_send.call_args_list], ['admin@weekly.example.com'])
+        self.assertIn('No progress reports due', output)
+
+        OrgSettings.objects.filter(org__name='weekly').update(progress_report_sent_at=timezone.now() - timedelta(days=7))
+        self.run_command()
+        self.assertEqual(mock_send.call_count, 2)
+
+    def test_query_count_is_flat_across_orgs(self, mock_send):
+        self.create_org('alpha', [1, 2])
+        with self.assertNumQueries(4):
+            self.run_command()
+
+        OrgSettings.objects.update(progress_report_sent_at=None)
+        for index in range(4):
+            self.create_org(f'org{index}', [1, 2, 3, 4])
+        with self.assertNumQueries(4):
+            self.run_command()
+        self.assertEqual(mock_send.call_count, 6)
+
+    def test_failed_emails_are_reported(self, mock_send):
+        mock_send.side_effect = RuntimeError('zeptomail down')
+        self.create_org('alpha', [1])
+
+        with self.assertLogs('Study.email_service', level='ERROR'):
+            output = self.run_command()
+
+        self.assertIn('Sent 0 of 1 progress report emails', output)
+        self.assertIsNone(OrgSettings.objects.get().progress_report_sent_at)
+
+    def test_only_orgs_whose_emails_were_accepted_are_marked_sent(self, mock_send):
+        def send(to_email, **kwargs):
+            if to_email.endswith('@beta.example.com'):
+                raise RuntimeError('mailbox unavailable')
+
+        mock_send.side_effect = send
+        self.create_org('alpha', [1])
+        self.create_org('beta', [1])
+
+        with self.assertLogs('Study.email_service', level='ERROR'):
+            output = self.run_command()
+
+        self.assertIn('Sent 1 of 2 progress report emails', output)
+        sent_at = dict(OrgSettings.objects.values_list('org__name', 'progress_report_sent_at'))
+        self.assertIsNotNone(sent_at['alpha'])
+        self.assertIsNone(sent_at['beta'])
+
+        mock_send.side_effect = None
+        self.run_command()
+        self.assertEqual(mock_send.call_args.kwargs['to_email'], 'admin@beta.example.com')
+
+
+@override_settings(FRONTEND_URL='https://app.example.com', CONTACT_TO_EMAIL='support@example.com')
+class EmailServiceTemplateTestCase(SimpleTestCase):
+    def setUp(self):
+        from .email_service import EmailService
+        self.email_service = EmailService()
+
+    def test_password_reset_email_is_rendered_from_templates(self):
+        message = self.email_service.password_reset_email('ada@example.com', 'tok123', user_name='Ada <b>')
+
+        self.assertEqual(message['to_email'], 'ada@example.com')
+        self.assertEqual(message['subject'], 'Reset Your GreekGeek Password')
+        self.assertIn('https://app.example.com/reset-password/tok123/', message['html_content'])
+        self.assertIn('Hello, Ada &lt;b&gt;!', message['html_content'])
+        self.assertIn('Hello, Ada <b>!', message['plain_text_content'])
+        self.assertIn('https://app.example.com/reset-password/tok123/', message['plain_text_content'])
+
+    def test_contact_email_escapes_submission(self):
+        message = self.email_service.contact_email('Eve', 'eve@example.com', 'Billing', '<script>\nhi', organization='')
+
+        self.assertEqual(message['to_email'], 'support@example.com')
+        self.assertIn('&lt;script&gt;<br>hi', message['html_content'])
+        self.assertIn('Organization:</strong> Not provided', message['html_content'])
+        self.assertIn('<script>\nhi', message['plain_text_content'])
+
+    def test_templates_are_compiled_once(self):
+        from django.template import engines
+
+        self.email_service.email_verification_email('ada@example.com', 'tok')
+        loader = engines['django'].engine.template_loaders[0]
+        compiled = loader.get_template_cache['emails/email_verification.html']
+        self.email_service.email_verification_email('bob@example.com', 'tok')
+
+        self.assertIs(loader.get_template_cache['emails/email_verification.html'], compiled)
+
+    @patch('Study.email_service.session.post')
+    def test_send_many_reuses_the_shared_session(self, mock_post):
+        mock_post.return_value.status_code = 200
+        messages = [
+            self.email_service.password_reset_email(f'user{index}@example.com', f'tok{index}')
+            for index in range(5)
+        ]
+
+        self.assertEqual(self.email_service.send_many(messages), 5)
+
+        recipients = sorted(call.kwargs['json']['to'][0]['email_address']['address'] for call in mock_post.call_args_list)
+        self.assertEqual(recipients, [f'user{index}@example.com' for index in range(5)])
+
+
 class AdminEmailVerificationTestCase(TestCase):
     def setUp(self):
         self.client = APIClient()
@@ -1,26 +1,36 @@
-from .models import PeriodSetting, PeriodInstance, Session
+from .models import PeriodSetting, PeriodInstance, QueuedNotification, Session, User, UserPeriodHours, add_months
+from .push_service import send_push_messages, transport_failed
 from datetime import datetime, timedelta
 from django.db import transaction, models
+from django.db.models.functions import Coalesce
 import math
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
 from django.utils import timezone
 from zoneinfo import ZoneInfo
 
 
+def org_timezone(org_tz_str):
+    """ZoneInfo for an org's timezone setting, falling back to America/New_York if it is empty or invalid."""
+    try:
+        return ZoneInfo(org_tz_str or 'America/New_York')
+    except Exception:
+        return ZoneInfo('America/New_York')
+
+
 def period_end_of_day(due_midnight_utc, org_tz_str):
     """Return 23:59:59.999999 on the due calendar date expressed in the org's timezone, as UTC.
 
     This means the period ends at midnight local time for the org rather than midnight UTC.
     Falls back to UTC if org_tz_str is empty or invalid.
     """
-    try:
-        tz = ZoneInfo(org_tz_str or 'America/New_York')
-    except Exception:
-        tz = ZoneInfo('America/New_York')
+    tz = org_timezone(org_tz_str)
     d = due_midnight_utc.date()
     end_local = datetime(d.year, d.month, d.day, 23, 59, 59, 999999, tzinfo=tz)
     return end_local.astimezone(ZoneInfo('UTC'))
-import json
-import requests
+
 
 def calculate_period_start_date(period_setting, session_time):
     """Calculate the correct period start date for a given session time"""
@@ -34,29 +44,14 @@ def calculate_period_start_date(period_setting, session_time):
         if first_due_date.date() >= session_time.date():
             return start_date
 
-        # Advance in full-week steps; each period starts the day after the previous due date
-        current_start = first_due_date + timedelta(days=1)
-        current_end = period_setting.get_next_due_date(from_date=current_start)
-
-        while current_end.date() < session_time.date():
-            current_start = current_end + timedelta(days=1)
-            current_end = period_setting.get_next_due_date(from_date=current_start)
-
-        return current_start
+        # Later periods run from the day after one due date through the next,
+        # so due dates fall every 7 days; jump straight to the one on or after the session
+        weeks_after_first_due = -(-(session_time.date() - first_due_date.date()).days // 7)
+        return first_due_date + timedelta(days=7 * (weeks_after_first_due - 1) + 1)
 
-        
-        
-        
-        
-        
-        
     elif period_setting.period_type == "monthly":
         months_passed = (session_time.year - start_date.year) * 12 + (session_time.month - start_date.month)
-        new_month = start_date.month + months_passed
-        new_year = start_date.year + (new_month - 1) // 12
-        new_month = ((new_month - 1) % 12) + 1
-        
-        return start_date.replace(year=new_year, month=new_month)
+        return add_months(start_date, months_passed)
         
     elif period_setting.period_type == "custom" and period_setting.custom_days:
         days_since_start = (session_time - start_date).days
@@ -65,82 +60,468 @@ def calculate_period_start_date(period_setting, session_time):
         
     return start_date
 
-def get_or_create_period_instance(user, session_time):
-    """Helper function to get or create appropriate period instance"""
+# Active period per org: memoized for the current request (see ActivePeriodMemoMiddleware)
+# and cached in-process for ACTIVE_PERIOD_CACHE_TIMEOUT seconds. Both are invalidated by
+# PeriodSetting/PeriodInstance signals; other processes catch up when the TTL expires.
+_active_period_memo = ContextVar('active_period_memo', default=None)
+_active_period_cache = {}
+
+
+@contextmanager
+def active_period_scope():
+    """Memoize active period lookups until the block exits (one request or command run)."""
+    token = _active_period_memo.set({})
     try:
-        period_setting = PeriodSetting.objects.get(org=user.org, is_active=True)
-        
-        # Try to find an active period instance
+        yield
+    finally:
+        _active_period_memo.reset(token)
+
+
+def resolve_active_period(org_id, fresh=False):
+    """Return (active PeriodSetting, its active PeriodInstance) for an org.
+
+    Either may be None. The instance is whatever is marked active, or once that has ended
+    the next period if roll_over_periods created it ahead of time; otherwise it may have
+    ended and get_or_create_period_instance handles rolling over. Pass fresh=True on paths that
+    write rows pointing at the result: it skips the memo and process cache (which can
+    hold rows another process has since deleted) and refreshes both.
+    """
+    if not org_id:
+        return None, None
+    memo = _active_period_memo.get()
+    if not fresh and memo is not None and org_id in memo:
+        return memo[org_id]
+
+    cached = None if fresh else _active_period_cache.get(org_id)
+    if cached and cached[0] > time.monotonic():
+        resolved = cached[1]
+    else:
+        resolved = _load_active_period(org_id)
+        timeout = settings.ACTIVE_PERIOD_CACHE_TIMEOUT
+        if timeout:
+            # Only share committed rows with the rest of the process
+            transaction.on_commit(
+                lambda: _active_period_cache.__setitem__(org_id, (time.monotonic() + timeout, resolved))
+            )
+
+    if memo is not None:
+        memo[org_id] = resolved
+    return resolved
+
+
+def _load_active_period(org_id):
+    try:
+        period_setting = PeriodSetting.objects.select_related('org').get(org_id=org_id, is_active=True)
+    except PeriodSetting.DoesNotExist:
+        return None, None
+    active_instance = PeriodInstance.objects.filter(
+        period_setting=period_setting,
+        is_active=True
+    ).first()
+    now = timezone.now()
+    if active_instance and active_instance.end_date < now:
+        # Past the boundary before roll_over_periods has switched over: serve the
+        # period it prepared, so requests at the boundary don't have to write
         active_instance = PeriodInstance.objects.filter(
             period_setting=period_setting,
+            is_active=False,
+            start_date__gt=active_instance.start_date,
+            start_date__lte=now,
+            end_date__gte=now,
+        ).first() or active_instance
+    return period_setting, active_instance
+
+
+def invalidate_active_period(org_id):
+    """Drop an org's memoized and cached active period, now and again on commit."""
+    memo = _active_period_memo.get()
+    if memo is not None:
+        memo.pop(org_id, None)
+    _active_period_cache.pop(org_id, None)
+    transaction.on_commit(lambda: _active_period_cache.pop(org_id, None))
+
+
+def get_or_create_period_instance(user, session_time, fresh=False):
+    """Helper function to get or create appropriate period instance.
+
+    Pass fresh=True when the result is about to be saved on a new row (see
+    resolve_active_period).
+    """
+    period_setting, active_instance = resolve_active_period(user.org_id, fresh=fresh)
+    if not period_setting:
+        return None
+    
+    # Check if we need a new instance (no active instance or active instance is outdated)
+    needs_new_instance = (
+        not active_instance or 
+        active_instance.end_date < session_time or 
+        active_instance.start_date > session_time
+    )
+    
+    if needs_new_instance:
+        if not fresh:
+            # Never roll over from a cached setting; it may have been replaced since
+            return get_or_create_period_instance(user, session_time, fresh=True)
+        return roll_over_period_instance(period_setting, session_time)
+    return active_instance
+
+ORG_LOCK_PERIODS = 1
+
+
+def org_advisory_lock(org_id, scope=ORG_LOCK_PERIODS):
+    """Block until the current transaction holds the advisory lock for (scope, org_id).
+
+    The lock is released when the transaction ends. A no-op on databases other than
+    PostgreSQL; SQLite already serializes writers.
+    """
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        raise transaction.TransactionManagementError("org_advisory_lock must be called inside a transaction")
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock(%s, %s)", [scope, org_id])
+
+
+def roll_over_period_instance(period_setting, session_time):
+    """Make the period containing session_time the setting's active instance, creating it
+    (and deactivating the previous one) unless another process already has."""
+    org_id = period_setting.org_id
+    with transaction.atomic():
+        # Serialize period changes for this org, even before any instance rows exist
+        org_advisory_lock(org_id)
+        
+        # Double-check if appropriate instance was created while we were processing
+        instance = PeriodInstance.objects.filter(
+            period_setting=period_setting,
+            start_date__lte=session_time,
+            end_date__gte=session_time,
             is_active=True
         ).first()
         
-        # Check if we need a new instance (no active instance or active instance is outdated)
-        needs_new_instance = (
-            not active_instance or 
-            active_instance.end_date < session_time or 
-            active_instance.start_date > session_time
-        )
-        
-        if needs_new_instance:
-            with transaction.atomic():
-                # Lock only periods for this org's active period setting
-                PeriodInstance.objects.select_for_update().filter(
-                    period_setting__org=user.org,
-                    period_setting__is_active=True
-                ).exists()  # Execute the query to acquire the lock
-                
-                # Double-check if appropriate instance was created while we were processing
-                instance = PeriodInstance.objects.filter(
-                    period_setting=period_setting,
-                    start_date__lte=session_time,
-                    end_date__gte=session_time,
+        if not instance:
+            current = PeriodInstance.objects.filter(period_setting=period_setting, is_active=True).first()
+            if current and session_time < current.start_date:
+                # A session dated in an earlier period (a manual entry) belongs to that
+                # period; it never takes the active slot from the current one
+                return past_period_instance(period_setting, session_time)
+
+            # Activate the period if roll_over_periods already prepared it
+            instance = current and PeriodInstance.objects.filter(
+                period_setting=period_setting,
+                is_active=False,
+                start_date__gt=current.start_date,
+                start_date__lte=session_time,
+                end_date__gte=session_time,
+            ).first()
+            if instance:
+                PeriodInstance.objects.filter(
+                    period_setting__org_id=org_id,
+                    period_setting__is_active=True,
                     is_active=True
-                ).first()
-                
-                if not instance:
-                    # Calculate the correct start date for this session time
-                    start_date = calculate_period_start_date(period_setting, session_time)
-                    due = period_setting.get_next_due_date(from_date=start_date)
-
-                    if not due:
-                        raise ValueError("Could not calculate end date for period")
-
-                    org_tz = getattr(period_setting.org, 'timezone', 'UTC')
-                    end_date = period_end_of_day(due, org_tz)
-
-                    # Deactivate only this org's active periods
-                    PeriodInstance.objects.filter(
-                        period_setting__org=user.org,
-                        period_setting__is_active=True,
-                        is_active=True
-                    ).update(is_active=False)
-
-                    instance = PeriodInstance.objects.create(
-                        period_setting=period_setting,
-                        start_date=start_date,
-                        end_date=end_date,
-                        is_active=True
-                    )
-                    backfill_sessions_for_instance(instance)
-        else:
-            instance = active_instance
-        
+                ).update(is_active=False)
+                instance.is_active = True
+                instance.save(update_fields=['is_active'])
+                reattach_sessions_to_instance(instance)
+                return instance
+
+            # Calculate the correct start date for this session time
+            start_date = calculate_period_start_date(period_setting, session_time)
+            due = period_setting.get_next_due_date(from_date=start_date)
+
+            if not due:
+                raise ValueError("Could not calculate end date for period")
+
+            org_tz = getattr(period_setting.org, 'timezone', 'UTC')
+            end_date = period_end_of_day(due, org_tz)
+
+            # Deactivate only this org's active periods
+            PeriodInstance.objects.filter(
+                period_setting__org_id=org_id,
+                period_setting__is_active=True,
+                is_active=True
+            ).update(is_active=False)
+
+            instance = PeriodInstance.objects.create(
+                period_setting=period_setting,
+                start_date=start_date,
+                end_date=end_date,
+                is_active=True
+            )
+            reattach_sessions_to_instance(instance)
+    return instance
+
+def prepare_next_period_instance(period_setting, current_end):
+    """Create, inactive, the period that follows one ending at current_end and return it,
+    or None if it already exists or its dates can't follow on. Until roll_over_period_instance
+    activates it, resolve_active_period serves it once current_end has passed."""
+    with transaction.atomic():
+        org_advisory_lock(period_setting.org_id)
+        if PeriodInstance.objects.filter(period_setting=period_setting, end_date__gt=current_end).exists():
+            return None
+
+        boundary = current_end + timedelta(microseconds=1)
+        start_date = calculate_period_start_date(period_setting, boundary)
+        due = period_setting.get_next_due_date(from_date=start_date)
+        if not due:
+            raise ValueError("Could not calculate end date for period")
+        end_date = period_end_of_day(due, getattr(period_setting.org, 'timezone', 'UTC'))
+        if not start_date <= boundary <= end_date:
+            # Left to roll_over_period_instance at the boundary
+            return None
+        return PeriodInstance.objects.create(
+            period_setting=period_setting,
+            start_date=start_date,
+            end_date=end_date,
+            is_active=False,
+        )
+
+def past_period_instance(period_setting, session_time):
+    """The setting's instance covering a session_time before its active period, created
+    inactive if no instance covers it yet. Call inside the org's advisory lock."""
+    instance = PeriodInstance.objects.filter(
+        period_setting=period_setting,
+        start_date__lte=session_time,
+        end_date__gte=session_time,
+    ).order_by('-start_date').first()
+    if instance:
         return instance
-        
-    except PeriodSetting.DoesNotExist:
-        return None 
+
+    start_date = calculate_period_start_date(period_setting, session_time)
+    due = period_setting.get_next_due_date(from_date=start_date)
+    if not due:
+        raise ValueError("Could not calculate end date for period")
+    instance = PeriodInstance.objects.create(
+        period_setting=period_setting,
+        start_date=start_date,
+        end_date=period_end_of_day(due, getattr(period_setting.org, 'timezone', 'UTC')),
+        is_active=False,
+    )
+    backfill_sessions_for_instance(instance)
+    return instance
+
+def reattach_sessions_to_instance(period_instance):
+    """Attach the org sessions within a newly created instance's range to it: untracked
+    ones and ones left on an instance it replaces (one starting no earlier, e.g. a
+    deactivated copy of the same period). Rebuilds every rollup that gained or lost hours.
+    Earlier periods keep their sessions where the ranges touch."""
+    sessions = Session.objects.filter(
+        models.Q(period_instance__isnull=True)
+        | models.Q(period_instance__start_date__gte=period_instance.start_date),
+        org=period_instance.period_setting.org,
+        start_time__gte=period_instance.start_date,
+        start_time__lte=period_instance.end_date,
+    ).exclude(period_instance=period_instance)
+    previous_ids = set(
+        sessions.filter(period_instance__isnull=False).values_list('period_instance_id', flat=True).distinct()
+    )
+    if sessions.update(period_instance=period_instance):
+        rebuild_period_hours([period_instance.id, *previous_ids])
+
+def realign_sessions_for_instance(period_instance):
+    """After an instance's dates change, move its sessions now outside the range to the
+    setting's earliest other instance covering them (or leave them untracked), attach the
+    org sessions now inside it as reattach_sessions_to_instance does, and rebuild every
+    rollup that gained or lost hours."""
+    with transaction.atomic():
+        leaving = Session.objects.filter(period_instance=period_instance).exclude(
+            start_time__gte=period_instance.start_date,
+            start_time__lte=period_instance.end_date,
+        )
+        leaving_ids = list(leaving.values_list('id', flat=True))
+        if leaving_ids:
+            covering = PeriodInstance.objects.filter(
+                period_setting_id=period_instance.period_setting_id,
+                start_date__lte=models.OuterRef('start_time'),
+                end_date__gte=models.OuterRef('start_time'),
+            ).exclude(id=period_instance.id).order_by('start_date').values('id')[:1]
+            Session.objects.filter(id__in=leaving_ids).update(period_instance=models.Subquery(covering))
+            rebuild_period_hours([
+                period_instance.id,
+                *Session.objects.filter(id__in=leaving_ids, period_instance__isnull=False)
+                .values_list('period_instance_id', flat=True).distinct(),
+            ])
+        reattach_sessions_to_instance(period_instance)
 
 def backfill_sessions_for_instance(period_instance):
     """Set period_instance FK on any org sessions that fall within this period's date range
     but were created before period tracking existed (period_instance=null)."""
-    Session.objects.filter(
+    updated = Session.objects.filter(
         org=period_instance.period_setting.org,
         start_time__gte=period_instance.start_date,
         start_time__lte=period_instance.end_date,
         period_instance__isnull=True,
     ).update(period_instance=period_instance)
+    if updated:
+        rebuild_period_hours([period_instance.id])
+
+
+def build_period_instances(period_setting, current_time):
+    """Return unsaved PeriodInstances from the setting's start date through the period
+    containing current_time (which is active), or just the first period if it starts later."""
+    org_tz = getattr(period_setting.org, 'timezone', 'UTC')
+    # Normalize to midnight UTC — strips local-time offset from the frontend ISO string
+    inst_start = period_setting.start_date.replace(hour=0, minute=0, second=0, microsecond=0)
+    instances = []
+    while True:
+        due = period_setting.get_next_due_date(from_date=inst_start)
+        if not due:
+            break
+        inst_end = period_end_of_day(due, org_tz)
+        is_current = inst_start > current_time or inst_end >= current_time
+        instances.append(PeriodInstance(
+            period_setting=period_setting,
+            start_date=inst_start,
+            end_date=inst_end,
+            is_active=is_current,
+        ))
+        if is_current:
+            break
+        inst_start = due + timedelta(days=1)
+    return instances
+
+
+def backfill_sessions_for_instances(period_setting, instances):
+    """Set period_instance on the org's untracked sessions within any of the saved instances
+    with a single UPDATE. Where instances overlap the earliest one wins, matching
+    backfill_sessions_for_instance applied in order."""
+    if not instances:
+        return
+    matching_instance = PeriodInstance.objects.filter(
+        id__in=[instance.id for instance in instances],
+        start_date__lte=models.OuterRef('start_time'),
+        end_date__gte=models.OuterRef('start_time'),
+    ).order_by('start_date').values('id')[:1]
+    updated = Session.objects.filter(
+        org=period_setting.org,
+        start_time__gte=min(instance.start_date for instance in instances),
+        start_time__lte=max(instance.end_date for instance in instances),
+        period_instance__isnull=True,
+    ).update(period_instance=models.Subquery(matching_instance))
+    if updated:
+        rebuild_period_hours([instance.id for instance in instances])
+
+
+def record_session_hours(session, previous_hours=None):
+    """
+    Apply a change in one session's completed hours to the user's UserPeriodHours rollup.
+
+    Call in the same transaction as the session write. `previous_hours` is the session's
+    hours before the write (None for a session that was open or newly created).
+    """
+    if not session.period_instance_id:
+        return
+    new_hours = session.hours
+    if new_hours is None and previous_hours is None:
+        return
+    if new_hours is None:
+        # Hours were removed; last_session_at can't be unwound incrementally
+        refresh_user_period_hours(session.user_id, session.period_instance_id)
+        return
+
+    hours_delta = new_hours - (previous_hours or 0.0)
+    count_delta = 0 if previous_hours is not None else 1
+
+    with transaction.atomic():
+        rollup, created = UserPeriodHours.objects.select_for_update().get_or_create(
+            user_id=session.user_id,
+            period_instance_id=session.period_instance_id,
+            defaults={
+                'total_hours': new_hours,
+                'session_count': 1,
+                'last_session_at': session.start_time,
+            },
+        )
+        if created:
+            return
+        rollup.total_hours += hours_delta
+        rollup.session_count += count_delta
+        if rollup.last_session_at is None or session.start_time > rollup.last_session_at:
+            rollup.last_session_at = session.start_time
+        rollup.save(update_fields=['total_hours', 'session_count', 'last_session_at'])
+
+
+def _period_hours_totals(sessions):
+    return sessions.filter(
+        period_instance__isnull=False,
+        hours__isnull=False,
+    ).values('user_id', 'period_instance_id').annotate(
+        total=models.Sum('hours'),
+        count=models.Count('id'),
+        last=models.Max('start_time'),
+    ).order_by()
+
+
+def refresh_user_period_hours(user_id, period_instance_id):
+    """Recompute a single user's rollup row for a period from their sessions."""
+    with transaction.atomic():
+        UserPeriodHours.objects.filter(user_id=user_id, period_instance_id=period_instance_id).delete()
+        row = next(iter(_period_hours_totals(
+            Session.objects.filter(user_id=user_id, period_instance_id=period_instance_id)
+        )), None)
+        if row:
+            UserPeriodHours.objects.create(
+                user_id=user_id,
+                period_instance_id=period_instance_id,
+                total_hours=row['total'],
+                session_count=row['count'],
+                last_session_at=row['last'],
+            )
+
+
+def rebuild_period_hours(period_instance_ids=None):
+    """
+    Rebuild UserPeriodHours rows from sessions with one grouped aggregate.
+
+    Limited to the given period instances, or every instance when None.
+    Returns the number of rollup rows written.
+    """
+    sessions = Session.objects.all()
+    rollups = UserPeriodHours.objects.all()
+    if period_instance_ids is not None:
+        sessions = sessions.filter(period_instance_id__in=period_instance_ids)
+        rollups = rollups.filter(period_instance_id__in=period_instance_ids)
+
+    with transaction.atomic():
+        rollups.delete()
+        created = UserPeriodHours.objects.bulk_create([
+            UserPeriodHours(
+                user_id=row['user_id'],
+                period_instance_id=row['period_instance_id'],
+                total_hours=row['total'],
+                session_count=row['count'],
+                last_session_at=row['last'],
+            )
+            for row in _period_hours_totals(sessions).iterator()
+        ], batch_size=1000)
+    return len(created)
+
+
+def period_hours_drift():
+    """
+    Compare UserPeriodHours against a fresh aggregate over sessions.
+
+    Returns a list of (user_id, period_instance_id, stored_hours, actual_hours) for every
+    rollup row that is missing, stale or should not exist.
+    """
+    stored = {
+        (row.user_id, row.period_instance_id): row
+        for row in UserPeriodHours.objects.all().iterator()
+    }
+    drift = []
+    for row in _period_hours_totals(Session.objects.all()).iterator():
+        key = (row['user_id'], row['period_instance_id'])
+        rollup = stored.pop(key, None)
+        if (
+            rollup is None
+            or abs(rollup.total_hours - row['total']) > 1e-6
+            or rollup.session_count != row['count']
+            or rollup.last_session_at != row['last']
+        ):
+            drift.append((*key, rollup.total_hours if rollup else None, row['total']))
+    for key, rollup in stored.items():
+        drift.append((*key, rollup.total_hours, None))
+    return drift
 
 
 def calculate_user_hours(user, period_instance=None):
@@ -155,21 +536,131 @@ def calculate_user_hours(user, period_instance=None):
     Returns:
         float: Total hours completed
     """
+    # Period totals come from the UserPeriodHours rollup (sessions predating period
+    # tracking are attached to their instance by backfill_sessions_for_instance)
+    if period_instance:
+        total_hours = UserPeriodHours.objects.filter(
+            user=user,
+            period_instance=period_instance,
+        ).values_list('total_hours', flat=True).first()
+        return total_hours or 0.0
+
     # Start with sessions that have hours recorded (completed sessions)
     query = Session.objects.filter(user=user, hours__isnull=False)
     
-    # Filter by period date range (not FK — existing sessions predate period tracking and have period_instance=null)
-    if period_instance:
-        query = query.filter(
-            start_time__gte=period_instance.start_date,
-            start_time__lte=period_instance.end_date,
-        )
-    
     # Sum the hours
     total_hours = query.aggregate(total=models.Sum('hours'))['total'] or 0.0
     
     return total_hours 
 
+def open_session_for(user, for_update=False):
+    """Return the user's in-progress session (hours not set yet), or None.
+
+    Matches the one_open_session_per_user partial index, so the cost does not grow with
+    the user's session history. Pass for_update inside a transaction to lock the row.
+    """
+    sessions = Session.objects.filter(user=user, hours__isnull=True).select_related('location')
+    if for_update:
+        sessions = sessions.select_for_update(of=('self',))
+    return sessions.first()
+
+def org_members_with_hours(org, period_instance=None):
+    """
+    Return the members of an org annotated with `total_hours`, computed in a single
+    grouped query instead of one calculate_user_hours() aggregate per member.
+
+    Uses the same rules as calculate_user_hours: the UserPeriodHours rollup when a
+    period instance is given, otherwise all completed sessions. Group and last location
+    are joined in so serializing the result does not issue per-member queries.
+    """
+    if period_instance:
+        hours = models.Sum(
+            'period_hours__total_hours',
+            filter=models.Q(period_hours__period_instance=period_instance),
+        )
+    else:
+        hours = models.Sum('sessions__hours', filter=models.Q(sessions__hours__isnull=False))
+
+    return User.objects.filter(org=org).select_related('group', 'last_location').annotate(
+        total_hours=Coalesce(hours, models.Value(0.0))
+    ).order_by('id')
+
+def active_period_instances(current_time, org_ids=None):
+    """The under-way active period instance of each org, keyed by org id, from one query."""
+    instances = PeriodInstance.objects.filter(
+        is_active=True,
+        period_setting__is_active=True,
+        start_date__lte=current_time,
+        end_date__gt=current_time,
+    ).select_related('period_setting__org')
+    if org_ids is not None:
+        instances = instances.filter(period_setting__org_id__in=org_ids)
+    return {instance.period_setting.org_id: instance for instance in instances}
+
+def period_hours_by_member(instances_by_org, *fields):
+    """
+    (id, org_id, *fields, total_hours) for every member of the orgs in instances_by_org,
+    with hours for their org's instance taken from the UserPeriodHours rollup. One grouped
+    query covers every org, however many members they have.
+    """
+    instance_ids = [instance.id for instance in instances_by_org.values()]
+    return User.objects.filter(org_id__in=instances_by_org).annotate(
+        total_hours=Coalesce(
+            models.Sum('period_hours__total_hours', filter=models.Q(period_hours__period_instance_id__in=instance_ids)),
+            models.Value(0.0),
+        ),
+    ).values_list('id', 'org_id', *fields, 'total_hours').order_by()
+
+def members_behind_pace(current_time, threshold=0.5, min_elapsed=0.25):
+    """
+    Return (user_id, period_instance, hours, expected_hours) for every member who is behind
+    pace in an active period: expected_hours is required_hours times the fraction of the
+    period elapsed, and a member is behind below threshold x expected_hours.
+
+    Periods less than min_elapsed through are skipped. Hours for every member of every
+    org come from one grouped query over the UserPeriodHours rollup.
+    """
+    instances = {}
+    expected = {}
+    for org_id, instance in active_period_instances(current_time).items():
+        elapsed = (current_time - instance.start_date) / (instance.end_date - instance.start_date)
+        if elapsed < min_elapsed:
+            continue
+        instances[org_id] = instance
+        expected[instance.id] = instance.period_setting.required_hours * elapsed
+    if not instances:
+        return []
+
+    behind = []
+    for user_id, org_id, hours in period_hours_by_member(instances):
+        instance = instances[org_id]
+        if hours < threshold * expected[instance.id]:
+            behind.append((user_id, instance, hours, expected[instance.id]))
+    return behind
+
+def org_period_standings(instances_by_org):
+    """
+    Leaderboard rows for the active period of every org in instances_by_org, keyed by
+    org id and sorted by hours, from a single grouped query across all orgs.
+    """
+    standings = {org_id: [] for org_id in instances_by_org}
+    members = period_hours_by_member(instances_by_org, 'first_name', 'last_name', 'email', 'is_staff')
+    for user_id, org_id, first_name, last_name, email, is_staff, hours in members:
+        required_hours = instances_by_org[org_id].period_setting.required_hours
+        standings[org_id].append({
+            'id': user_id,
+            'name': f"{first_name} {last_name}".strip() or email,
+            'email': email,
+            'is_staff': is_staff,
+            'hours': hours,
+            'met_requirement': hours >= required_hours,
+        })
+    for rows in standings.values():
+        rows.sort(key=lambda row: (-row['hours'], row['name']))
+        for rank, row in enumerate(rows, start=1):
+            row['rank'] = rank
+    return standings
+
 def send_push_notification(token_list, title, body, data=None):
     """
     Utility function to send push notifications to a list of Expo push tokens
@@ -181,7 +672,8 @@ def send_push_notification(token_list, title, body, data=None):
         data (dict, optional): Additional data to send with the notification
     
     Returns:
-        dict: Response from Expo push service
+        dict: {"data": [one Expo ticket per token]}, plus "error" describing any failure and
+        "transport_failed": True when some messages never reached Expo and should be sent again
     """
     if not token_list:
         return {"error": "No tokens provided"}
@@ -191,7 +683,6 @@ def send_push_notification(token_list, title, body, data=None):
     
     # Prepare notification payload
     message = {
-        'to': token_list,
         'title': title,
         'body': body,
         'sound': 'default',
@@ -201,73 +692,230 @@ def send_push_notification(token_list, title, body, data=None):
         message['data'] = data
     
     try:
-        response = requests.post(
-            'https://exp.host/--/api/v2/push/send',
-            data=json.dumps(message),
-            headers={
-                'Content-Type': 'application/json',
-                'Accept': 'application/json',
-                'Accept-Encoding': 'gzip, deflate'
-            }
-        )
-        
-        return response.json()
+        tickets = send_push_messages([{**message, 'to': token} for token in token_list])
     except Exception as e:
-        return {"error": str(e)}
+        return {"error": str(e), "transport_failed": True}
+
+    result = {"data": tickets}
+    failed = [ticket for ticket in tickets if transport_failed(ticket)]
+    if failed:
+        result["error"] = f"{len(failed)} of {len(tickets)} messages could not be sent: {failed[0]['message']}"
+        result["transport_failed"] = True
+    return result
+
+# User preference column consulted for each notification_type
+NOTIFICATION_PREFERENCE_FIELDS = {
+    'org_starts_studying': 'notify_org_starts_studying',
+    'user_leaves_zone': 'notify_user_leaves_zone',
+    'study_deadline_approaching': 'notify_study_deadline_approaching',
+}
 
 def should_notify_user(user, notification_type):
     """
     Checks if a user should receive a notification of the given type based on their settings.
     notification_type: str, one of 'org_starts_studying', 'user_leaves_zone', 'study_deadline_approaching'
     """
-    if notification_type == 'org_starts_studying':
-        return getattr(user, 'notify_org_starts_studying', True)
-    elif notification_type == 'user_leaves_zone':
-        return getattr(user, 'notify_user_leaves_zone', True)
-    elif notification_type == 'study_deadline_approaching':
-        return getattr(user, 'notify_study_deadline_approaching', True)
-    return True
+    field = NOTIFICATION_PREFERENCE_FIELDS.get(notification_type)
+    return getattr(user, field, True) if field else True
+
+def notification_audience_tokens(notification_type=None, org_id=None, user_ids=None, exclude_user_ids=None):
+    """
+    Active push tokens of the users who should get a notification, resolved in one query.
+
+    Recipients are the members of org_id and/or the users in user_ids, minus exclude_user_ids
+    (the members whose actions are being announced) and anyone who turned notification_type off.
+    """
+    from .models import NotificationToken
+
+    tokens = NotificationToken.objects.filter(is_active=True)
+    if org_id is not None:
+        tokens = tokens.filter(user__org_id=org_id)
+    if user_ids is not None:
+        tokens = tokens.filter(user_id__in=user_ids)
+    field = NOTIFICATION_PREFERENCE_FIELDS.get(notification_type)
+    if field:
+        tokens = tokens.filter(**{f'user__{field}': True})
+    if exclude_user_ids:
+        tokens = tokens.exclude(user_id__in=exclude_user_ids)
+    return list(tokens.values_list('token', flat=True))
 
 def send_notification_to_users(user_ids, title, body, data=None, notification_type=None):
     """
     Sends notifications to specified users, respecting their notification settings if notification_type is provided.
     """
-    from .models import NotificationToken, User
-    
-    if notification_type:
-        users = User.objects.filter(id__in=user_ids)
-        filtered_ids = [u.id for u in users if should_notify_user(u, notification_type)]
-    else:
-        filtered_ids = user_ids
-    if not filtered_ids:
-        return {"warning": "No valid user IDs provided or no users found with the specified IDs, this could be from notification settings"}
-    tokens = NotificationToken.objects.filter(
-        user__id__in=filtered_ids,
-        is_active=True
-    ).values_list('token', flat=True)
-    token_list = list(tokens)
+    if not user_ids:
+        return {"warning": "No valid user IDs provided"}
+    token_list = notification_audience_tokens(notification_type, user_ids=user_ids)
     if not token_list:
-        return {"error": "No active tokens found for the specified users"}
+        return {"error": "No active tokens found for the specified users, this could be from notification settings"}
     return send_push_notification(token_list, title, body, data)
 
 
-def send_notification_to_org(org_id, title, body, data=None, notification_type=None):
+def send_notification_to_org(org_id, title, body, data=None, notification_type=None, exclude_user_ids=None):
     """
-    Sends notifications to all active users in an organization, respecting their notification settings if notification_type is provided.
+    Sends notifications to all users in an organization except exclude_user_ids, respecting their notification settings if notification_type is provided.
     """
-    from .models import NotificationToken, User
-    
-    if notification_type:
-        users = User.objects.filter(org_id=org_id)
-        filtered_ids = [u.id for u in users if should_notify_user(u, notification_type)]
-    else:
-        filtered_ids = list(User.objects.filter(org_id=org_id).values_list('id', flat=True))
-
-    tokens = NotificationToken.objects.filter(
-        user__id__in=filtered_ids,
-        is_active=True
-    ).values_list('token', flat=True)
-    token_list = list(tokens)
+    token_list = notification_audience_tokens(notification_type, org_id=org_id, exclude_user_ids=exclude_user_ids)
     if not token_list:
         return {"error": "No active tokens found for the specified organization"}
-    return send_push_notification(token_list, title, body, data)
\ No newline at end of file
+    return send_push_notification(token_list, title, body, data)
+
+
+def queue_notification_to_users(user_ids, title, body, data=None, notification_type=None):
+    """
+    Queue a notification to specific users for the process_notifications worker.
+    Call inside the transaction that makes the change it announces.
+    """
+    return QueuedNotification.objects.create(
+        user_ids=list(user_ids),
+        title=title,
+        body=body,
+        data=data,
+        notification_type=notification_type or '',
+    )
+
+
+def queue_notification_to_org(org_id, title, body, data=None, notification_type=None, exclude_user_id=None):
+    """Queue a notification to every member of an org but exclude_user_id; see queue_notification_to_users."""
+    return QueuedNotification.objects.create(
+        org_id=org_id,
+        actor_id=exclude_user_id,
+        title=title,
+        body=body,
+        data=data,
+        notification_type=notification_type or '',
+    )
+
+
+# Org notifications of these types are held for NOTIFICATION_COALESCE_SECONDS and
+# sent as one digest per org, so a study hall opening doesn't fire one push per member
+COALESCED_NOTIFICATION_TYPES = {'org_starts_studying'}
+
+
+def format_studying_digest(names, location_name=None):
+    """'Alex, Sam and 12 others are studying at Library' for a burst of clock-ins."""
+    if len(names) == 1:
+        who = names[0]
+    elif len(names) <= 3:
+        who = f"{', '.join(names[:-1])} and {names[-1]}"
+    else:
+        who = f"{names[0]}, {names[1]} and {len(names) - 2} others"
+    verb = 'is' if len(names) == 1 else 'are'
+    if location_name:
+        return f"{who} {verb} studying at {location_name}"
+    return f"{who} {verb} studying"
+
+
+def build_coalesced_notification(notifications):
+    """Title, body and data for one digest covering a group of queued org notifications."""
+    if len(notifications) == 1:
+        notification = notifications[0]
+        return notification.title, notification.body, notification.data
+
+    # One name per member, in the order they clocked in
+    members = {}
+    for notification in notifications:
+        data = notification.data or {}
+        members.setdefault(notification.actor_id or data.get('user_id'), data.get('user_name') or 'Someone')
+    locations = {(notification.data or {}).get('location') for notification in notifications}
+    location_name = locations.pop() if len(locations) == 1 else None
+    names = list(members.values())
+
+    title = "Someone Started Studying!" if len(names) == 1 else f"{len(names)} Members Started Studying!"
+    data = {
+        "type": "user_studying",
+        "user_ids": [user_id for user_id in members if user_id],
+        "user_names": names,
+        "location": location_name,
+    }
+    return title, f"{format_studying_digest(names, location_name)}.", data
+
+
+def flush_coalesced_notifications(max_attempts=5, window=None):
+    """
+    Send a digest for every org whose oldest pending coalesced notification has waited
+    the coalescing window, and return how many queued rows it covered.
+
+    Pending rows are locked with SKIP LOCKED, so a group is only flushed by the worker
+    holding all of its rows; groups still inside the window are left for a later poll.
+    """
+    if window is None:
+        window = settings.NOTIFICATION_COALESCE_SECONDS
+    cutoff = timezone.now() - timedelta(seconds=window)
+    with transaction.atomic():
+        pending = QueuedNotification.objects.select_for_update(skip_locked=True).filter(
+            sent_at__isnull=True,
+            attempts__lt=max_attempts,
+            org__isnull=False,
+            notification_type__in=COALESCED_NOTIFICATION_TYPES,
+        ).order_by('created_at', 'id')
+        groups = {}
+        for notification in pending:
+            groups.setdefault((notification.org_id, notification.notification_type), []).append(notification)
+
+        flushed = []
+        for (org_id, notification_type), notifications in groups.items():
+            if notifications[0].created_at > cutoff:
+                continue
+            title, body, data = build_coalesced_notification(notifications)
+            actor_ids = {notification.actor_id for notification in notifications if notification.actor_id}
+            try:
+                result = send_notification_to_org(
+                    org_id, title, body, data=data, notification_type=notification_type,
+                    exclude_user_ids=actor_ids,
+                )
+                error = str(result.get('error', '')) if isinstance(result, dict) else ''
+                # Messages that never reached Expo keep the digest pending for a retry
+                sent_at = None if isinstance(result, dict) and result.get('transport_failed') else timezone.now()
+            except Exception as e:
+                error, sent_at = str(e), None
+            for notification in notifications:
+                notification.attempts += 1
+                notification.sent_at = sent_at
+                notification.last_error = error
+            flushed.extend(notifications)
+        QueuedNotification.objects.bulk_update(flushed, ['attempts', 'sent_at', 'last_error'])
+    return len(flushed)
+
+
+def process_queued_notifications(batch_size=100, max_attempts=5):
+    """
+    Send one batch of queued notifications, oldest first, and return how many were handled.
+
+    Rows are locked with SKIP LOCKED so several workers can drain the queue together.
+    A notification that raises or never reaches Expo is retried on a later batch until max_attempts.
+    Coalesced org notifications are left to flush_coalesced_notifications.
+    """
+    flushed = flush_coalesced_notifications(max_attempts)
+    with transaction.atomic():
+        batch = list(
+            QueuedNotification.objects.select_for_update(skip_locked=True).filter(
+                sent_at__isnull=True,
+                attempts__lt=max_attempts,
+            ).exclude(
+                org__isnull=False,
+                notification_type__in=COALESCED_NOTIFICATION_TYPES,
+            ).order_by('created_at', 'id')[:batch_size]
+        )
+        for notification in batch:
+            notification.attempts += 1
+            try:
+                if notification.org_id:
+                    result = send_notification_to_org(
+                        notification.org_id, notification.title, notification.body,
+                        data=notification.data, notification_type=notification.notification_type or None,
+                        exclude_user_ids=[notification.actor_id] if notification.actor_id else None,
+                    )
+                else:
+                    result = send_notification_to_users(
+                        notification.user_ids, notification.title, notification.body,
+                        data=notification.data, notification_type=notification.notification_type or None,
+                    )
+            except Exception as e:
+                notification.last_error = str(e)
+                continue
+            notification.last_error = str(result.get('error', '')) if isinstance(result, dict) else ''
+            if not (isinstance(result, dict) and result.get('transport_failed')):
+                notification.sent_at = timezone.now()
+        QueuedNotification.objects.bulk_update(batch, ['attempts', 'sent_at', 'last_error'])
+    return flushed + len(batch)
@@ -5,6 +5,7 @@ from rest_framework.response import Response
 from rest_framework.decorators import api_view, action
 
 from rest_framework.views import APIView
+from rest_framework.utils.encoders import JSONEncoder
 from rest_framework.generics import CreateAPIView, ListCreateAPIView, ListAPIView, DestroyAPIView, UpdateAPIView, RetrieveUpdateDestroyAPIView, RetrieveAPIView
 
 from rest_framework.authtoken.models import Token
@@ -14,16 +15,15 @@ from rest_framework.permissions import AllowAny, IsAuthenticated, BasePermission
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
-from .models import User, Org, OrgSettings, Session, Location, PeriodSetting, PeriodInstance, NotificationToken, Group, EmailVerificationToken
+from .models import User, Org, OrgSettings, Session, Location, PeriodSetting, PeriodInstance, NotificationToken, Group, EmailVerificationToken, UserPeriodHours, BillingEvent, JobCheckpoint
 
-from django.http import Http404 
+from django.http import Http404, StreamingHttpResponse
 from django.conf import settings
-from django.db import transaction
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef, Prefetch, Q
 from django.utils import timezone
 
 from datetime import datetime, timedelta, timezone as datetime_timezone
-import json
-import requests
 import uuid
 import secrets
 import stripe
@@ -32,7 +32,8 @@ import boto3
 from botocore.config import Config
 from botocore.exceptions import ClientError
 
-from .utils import get_or_create_period_instance, send_notification_to_users, send_notification_to_org, backfill_sessions_for_instance, period_end_of_day
+from .utils import send_push_notification, get_or_create_period_instance, queue_notification_to_users, queue_notification_to_org, build_period_instances, backfill_sessions_for_instances, record_session_hours, refresh_user_period_hours, resolve_active_period, invalidate_active_period, org_advisory_lock, open_session_for
+from .cache import bump_org_data_version
 
 
 def create_email_verification_token(user):
@@ -61,6 +62,7 @@ def configure_stripe():
     if not settings.STRIPE_API_KEY:
         raise exceptions.APIException(detail="Stripe is not configured")
     stripe.api_key = settings.STRIPE_API_KEY
+    stripe.api_base = settings.STRIPE_API_BASE or stripe.DEFAULT_API_BASE
     stripe.api_version = "2026-05-27.dahlia"
 
 
@@ -183,7 +185,16 @@ REVENUECAT_ACCESS_STATUSES = {
 
 
 def org_has_stripe_access(org):
-    return org.stripe_subscription_status in {'active', 'trialing'}
+    status_value = org.stripe_subscription_status
+    if status_value not in {'active', 'trialing'}:
+        return False
+    # Stripe ends these on its own schedule; don't wait for a webhook that may never come
+    now = timezone.now()
+    if status_value == 'trialing' and org.trial_ends_at and org.trial_ends_at <= now:
+        return False
+    if org.stripe_cancel_at_period_end and org.stripe_current_period_end and org.stripe_current_period_end <= now:
+        return False
+    return True
 
 
 def org_has_revenuecat_access(org):
@@ -201,7 +212,7 @@ def update_org_premium_state(org, update_fields):
         update_fields.append('is_premium')
 
 
-def sync_org_subscription(
+def apply_org_subscription(
     org,
     subscription_id=None,
     customer_id=None,
@@ -211,6 +222,7 @@ def sync_org_subscription(
     current_period_end=None,
     cancel_at_period_end=None,
 ):
+    """Set the given Stripe billing fields on org without saving; returns the changed field names."""
     update_fields = []
 
     if subscription_id and org.stripe_subscription_id != subscription_id:
@@ -242,22 +254,29 @@ def sync_org_subscription(
         update_fields.append('stripe_cancel_at_period_end')
 
     update_org_premium_state(org, update_fields)
+    return update_fields
+
 
+def sync_org_subscription(org, **subscription_fields):
+    update_fields = apply_org_subscription(org, **subscription_fields)
     if update_fields:
         org.save(update_fields=update_fields)
 
 
+def stripe_subscription_fields(subscription, customer_id=None):
+    return {
+        'subscription_id': stripe_get(subscription, 'id'),
+        'customer_id': customer_id or stripe_id(stripe_get(subscription, 'customer')),
+        'status_value': stripe_get(subscription, 'status', ''),
+        'trial_started_at': stripe_timestamp_to_datetime(stripe_get(subscription, 'trial_start')),
+        'trial_ends_at': stripe_timestamp_to_datetime(stripe_get(subscription, 'trial_end')),
+        'current_period_end': stripe_timestamp_to_datetime(stripe_subscription_current_period_end(subscription)),
+        'cancel_at_period_end': bool(stripe_get(subscription, 'cancel_at_period_end', False)),
+    }
+
+
 def sync_org_from_stripe_subscription(org, subscription, customer_id=None):
-    sync_org_subscription(
-        org,
-        subscription_id=stripe_get(subscription, 'id'),
-        customer_id=customer_id or stripe_get(subscription, 'customer'),
-        status_value=stripe_get(subscription, 'status', ''),
-        trial_started_at=stripe_timestamp_to_datetime(stripe_get(subscription, 'trial_start')),
-        trial_ends_at=stripe_timestamp_to_datetime(stripe_get(subscription, 'trial_end')),
-        current_period_end=stripe_timestamp_to_datetime(stripe_subscription_current_period_end(subscription)),
-        cancel_at_period_end=bool(stripe_get(subscription, 'cancel_at_period_end', False)),
-    )
+    sync_org_subscription(org, **stripe_subscription_fields(subscription, customer_id=customer_id))
 
 
 def org_for_stripe_billing_event(subscription_id=None, customer_id=None, metadata=None):
@@ -284,11 +303,8 @@ def sync_org_from_stripe_invoice(invoice):
     if not org or not subscription_id:
         return
 
-    try:
-        subscription = stripe.Subscription.retrieve(subscription_id)
-    except stripe.error.StripeError:
-        return
-
+    # StripeError propagates so process_billing_events records the failure and retries
+    subscription = stripe.Subscription.retrieve(subscription_id)
     sync_org_from_stripe_subscription(
         org,
         subscription,
@@ -296,6 +312,255 @@ def sync_org_from_stripe_invoice(invoice):
     )
 
 
+STRIPE_CHECKOUT_EVENT_TYPES = {'checkout.session.completed', 'checkout.session.async_payment_succeeded'}
+
+STRIPE_SUBSCRIPTION_EVENT_TYPES = {
+    'customer.subscription.created',
+    'customer.subscription.updated',
+    'customer.subscription.deleted',
+    'customer.subscription.paused',
+    'customer.subscription.pending_update_applied',
+    'customer.subscription.pending_update_expired',
+    'customer.subscription.resumed',
+    'customer.subscription.trial_will_end',
+}
+
+STRIPE_INVOICE_EVENT_TYPES = {
+    'invoice.paid',
+    'invoice.payment_succeeded',
+    'invoice.payment_failed',
+    'invoice.marked_uncollectible',
+    'invoice.voided',
+}
+
+STRIPE_HANDLED_EVENT_TYPES = STRIPE_CHECKOUT_EVENT_TYPES | STRIPE_SUBSCRIPTION_EVENT_TYPES | STRIPE_INVOICE_EVENT_TYPES
+
+
+def org_for_stripe_event(event_type, event_object):
+    """The org a Stripe event belongs to, from local data only (no Stripe API calls)."""
+    if event_type in STRIPE_CHECKOUT_EVENT_TYPES:
+        org_id = stripe_nested_get(event_object, ('metadata', 'org_id')) or stripe_get(event_object, 'client_reference_id')
+        try:
+            return Org.objects.filter(id=org_id).first() if org_id else None
+        except (TypeError, ValueError):
+            return None
+    if event_type in STRIPE_SUBSCRIPTION_EVENT_TYPES:
+        return org_for_stripe_billing_event(
+            subscription_id=stripe_get(event_object, 'id'),
+            customer_id=stripe_id(stripe_get(event_object, 'customer')),
+            metadata=stripe_get(event_object, 'metadata', {}),
+        )
+    if event_type in STRIPE_INVOICE_EVENT_TYPES:
+        return org_for_stripe_billing_event(
+            subscription_id=stripe_invoice_subscription_id(event_object),
+            customer_id=stripe_get(event_object, 'customer'),
+            metadata=stripe_invoice_metadata(event_object),
+        )
+    return None
+
+
+def apply_stripe_event(event):
+    """
+    Sync org billing state from one Stripe webhook event. Stripe API errors are raised,
+    not swallowed, so the event stays pending and is retried.
+    """
+    event_type = stripe_get(event, 'type')
+    event_object = stripe_nested_get(event, ('data', 'object'), {})
+
+    if event_type in STRIPE_CHECKOUT_EVENT_TYPES:
+        org_id = stripe_nested_get(event_object, ('metadata', 'org_id')) or stripe_get(event_object, 'client_reference_id')
+        if org_id:
+            try:
+                org = Org.objects.get(id=org_id)
+            except Org.DoesNotExist:
+                org = None
+
+            if org:
+                subscription_id = stripe_id(stripe_get(event_object, 'subscription'))
+                subscription = None
+                if subscription_id:
+                    subscription = stripe.Subscription.retrieve(subscription_id)
+
+                if subscription:
+                    sync_org_from_stripe_subscription(
+                        org,
+                        subscription,
+                        customer_id=stripe_id(stripe_get(event_object, 'customer')),
+                    )
+                else:
+                    sync_org_subscription(
+                        org,
+                        subscription_id=subscription_id,
+                        customer_id=stripe_id(stripe_get(event_object, 'customer')),
+                        status_value='trialing',
+                    )
+
+    elif event_type in STRIPE_SUBSCRIPTION_EVENT_TYPES:
+        subscription_id = stripe_get(event_object, 'id')
+        customer_id = stripe_id(stripe_get(event_object, 'customer'))
+        org = org_for_stripe_billing_event(
+            subscription_id=subscription_id,
+            customer_id=customer_id,
+            metadata=stripe_get(event_object, 'metadata', {}),
+        )
+
+        if org:
+            sync_org_from_stripe_subscription(
+                org,
+                customer_id=customer_id,
+                subscription=event_object,
+            )
+
+    elif event_type in STRIPE_INVOICE_EVENT_TYPES:
+        sync_org_from_stripe_invoice(event_object)
+
+
+def process_billing_events(batch_size=100, max_attempts=5):
+    """
+    Apply one batch of pending Stripe events and return how many were applied.
+
+    Events are taken in Stripe's creation order. An event is skipped while its org has an
+    earlier pending event, so each org's events apply strictly in order even with several
+    workers (rows are locked with SKIP LOCKED); a failing event holds back its org's later
+    events until it succeeds or reaches max_attempts.
+    """
+    earlier_pending = BillingEvent.objects.filter(
+        org=OuterRef('org'),
+        processed_at__isnull=True,
+        attempts__lt=max_attempts,
+    ).filter(
+        Q(stripe_created__lt=OuterRef('stripe_created'))
+        | Q(stripe_created=OuterRef('stripe_created'), id__lt=OuterRef('id'))
+    )
+    # Worker processes never verify a webhook signature, which is otherwise what sets the key
+    configure_stripe()
+    with transaction.atomic():
+        batch = list(
+            BillingEvent.objects.select_for_update(skip_locked=True).filter(
+                processed_at__isnull=True,
+                attempts__lt=max_attempts,
+            ).exclude(Exists(earlier_pending)).order_by('stripe_created', 'id')[:batch_size]
+        )
+        for billing_event in batch:
+            billing_event.attempts += 1
+            try:
+                with transaction.atomic():
+                    apply_stripe_event(billing_event.payload)
+            except Exception as e:
+                billing_event.last_error = str(e)
+                continue
+            billing_event.processed_at = timezone.now()
+            billing_event.last_error = ''
+        BillingEvent.objects.bulk_update(batch, ['attempts', 'processed_at', 'last_error'])
+    return sum(1 for billing_event in batch if billing_event.processed_at)
+
+
+def reconcile_stripe_subscriptions(subscriptions, dry_run=False, batch_size=500):
+    """
+    Bring every org in line with a full listing of Stripe subscriptions in one pass.
+
+    Subscriptions are indexed by id, customer and metadata org_id, then matched to
+    orgs by their stored subscription id, stored customer id or own id, in that order.
+    Stripe lists newest first, so a customer's most recent subscription wins. Changed
+    orgs are written with bulk_update. Returns (subscriptions, orgs matched, orgs updated).
+    """
+    by_subscription = {}
+    by_customer = {}
+    by_org_id = {}
+    for subscription in subscriptions:
+        fields = stripe_subscription_fields(subscription)
+        by_subscription[fields['subscription_id']] = fields
+        if fields['customer_id']:
+            by_customer.setdefault(fields['customer_id'], fields)
+        org_id = stripe_nested_get(subscription, ('metadata', 'org_id'))
+        if org_id and str(org_id).isdigit():
+            by_org_id.setdefault(int(org_id), fields)
+
+    orgs = list(Org.objects.filter(
+        Q(stripe_subscription_id__isnull=False)
+        | Q(stripe_customer_id__isnull=False)
+        | Q(id__in=by_org_id)
+    ))
+    # Billing ids are unique per org; never hand one org's subscription to another
+    owner_by_subscription = {org.stripe_subscription_id: org.id for org in orgs if org.stripe_subscription_id}
+    owner_by_customer = {org.stripe_customer_id: org.id for org in orgs if org.stripe_customer_id}
+
+    matched = 0
+    changed = []
+    changed_fields = set()
+    for org in orgs:
+        fields = (
+            by_subscription.get(org.stripe_subscription_id)
+            or by_customer.get(org.stripe_customer_id)
+            or by_org_id.get(org.id)
+        )
+        if fields is None:
+            continue
+        if owner_by_subscription.get(fields['subscription_id'], org.id) != org.id:
+            continue
+        if owner_by_customer.get(fields['customer_id'], org.id) != org.id:
+            continue
+        matched += 1
+        update_fields = apply_org_subscription(org, **fields)
+        if update_fields:
+            changed.append(org)
+            changed_fields.update(update_fields)
+
+    if changed and not dry_run:
+        with transaction.atomic():
+            Org.objects.bulk_update(changed, sorted(changed_fields), batch_size=batch_size)
+            # bulk_update skips the post_save signal that invalidates cached org payloads
+            for org in changed:
+                bump_org_data_version(org.id)
+    return len(by_subscription), matched, len(changed)
+
+
+PREMIUM_SWEEP_JOB = 'sweep_premium_expiry'
+PREMIUM_EXPIRY_FIELDS = ('revenuecat_entitlement_expires_at', 'stripe_current_period_end', 'trial_ends_at')
+
+
+def sweep_premium_expiry(batch_size=500):
+    """
+    Recompute is_premium for orgs whose RevenueCat entitlement, Stripe period end or
+    trial end has passed since the previous sweep, saving changes with bulk_update.
+    Passing those dates revokes access for an expired entitlement, a 'trialing'
+    subscription past trial_ends_at, or one cancelling at a passed period end.
+
+    Each expiry column is range-scanned on its own index. The first sweep covers
+    everything already expired; expiries written in the past are handled by the
+    webhook or sync that writes them. Returns (orgs checked, orgs changed).
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        checkpoint = JobCheckpoint.objects.select_for_update().filter(name=PREMIUM_SWEEP_JOB).first()
+        passed = Q()
+        for field in PREMIUM_EXPIRY_FIELDS:
+            window = Q(**{f'{field}__lte': now})
+            if checkpoint:
+                window &= Q(**{f'{field}__gt': checkpoint.last_run_at})
+            passed |= window
+        orgs = list(Org.objects.select_for_update().filter(passed))
+
+        changed = []
+        for org in orgs:
+            update_fields = []
+            update_org_premium_state(org, update_fields)
+            if update_fields:
+                changed.append(org)
+        if changed:
+            Org.objects.bulk_update(changed, ['is_premium'], batch_size=batch_size)
+            # bulk_update skips the post_save signal that invalidates cached org payloads
+            for org in changed:
+                bump_org_data_version(org.id)
+
+        if checkpoint:
+            checkpoint.last_run_at = now
+            checkpoint.save(update_fields=['last_run_at'])
+        else:
+            JobCheckpoint.objects.create(name=PREMIUM_SWEEP_JOB, last_run_at=now)
+    return len(orgs), len(changed)
+
+
 def revenuecat_uuid_values(values):
     identifiers = []
     for value in values:
@@ -497,8 +762,12 @@ class OrgReportView(APIView):
     """
     View for admin users to retrieve comprehensive organization report data.
     Provides data for the organization as a whole and individual users' study progress.
+
+    Pass ``?stream=1`` to stream the same JSON document user by user instead of
+    building it in memory, for orgs with long session histories.
     """
     permission_classes = (IsAdminUser,)
+    stream_chunk_size = 2000
     
     def get(self, request, format=None):
         admin_user = request.user
@@ -511,15 +780,13 @@ class OrgReportView(APIView):
             )
         
         # 1. Get all users in the admin's organization
-        users = User.objects.filter(org=org)
-        user_data = []
+        users = User.objects.filter(org=org).select_related('group', 'last_location').order_by('id')
         
         # 2. Get the current period setting and instances
-        try:
-            active_period_setting = PeriodSetting.objects.get(org=org, is_active=True)
+        active_period_setting, _ = resolve_active_period(org.id)
+        if active_period_setting:
             period_setting_data = PeriodSettingSerializer(active_period_setting).data
-        except PeriodSetting.DoesNotExist:
-            active_period_setting = None
+        else:
             period_setting_data = None
         
         # 3. Get all period instances for the organization
@@ -527,63 +794,117 @@ class OrgReportView(APIView):
         if active_period_setting:
             # Ensure current period instance exists
             current_time = timezone.now()
-            get_or_create_period_instance(admin_user, current_time)
+            current_instance = get_or_create_period_instance(admin_user, current_time)
             
-            # Get all period instances
-            period_instances = PeriodInstance.objects.filter(
+            # Get all period instances, but not a next period prepared ahead of its start
+            period_instances = list(PeriodInstance.objects.filter(
                 period_setting__org=org
-            ).order_by('-start_date')
+            ).exclude(is_active=False, start_date__gt=current_time).order_by('-start_date'))
             period_instances_data = PeriodInstanceSerializer(period_instances, many=True).data
         else:
+            current_instance = None
             period_instances_data = []
         
-        # 4. Get data for each user, including their sessions
-        for user in users:
-            user_info = UserSerializer(user).data
-            
-            # Add group information
-            if user.group:
-                user_info['group'] = {
-                    'id': user.group.id,
-                    'name': user.group.name
-                }
-            else:
-                user_info['group'] = None
-            
-            # Get all sessions for this user
-            sessions = Session.objects.filter(user=user).select_related(
-                'location', 'period_instance'
-            ).order_by('-start_time')
-            sessions_data = SessionSerializer(sessions, many=True).data
-            
-            # Calculate total hours for current period (if exists)
-            current_period_hours = 0
-            if period_instances and period_instances.filter(is_active=True).exists():
-                active_period = period_instances.get(is_active=True)
-                current_period_sessions = sessions.filter(period_instance=active_period)
-                for session in current_period_sessions:
-                    if session.hours is not None:
-                        current_period_hours += session.hours
-            
-            # Add user sessions and calculated data
-            user_info['sessions'] = sessions_data
-            user_info['current_period_hours'] = current_period_hours
-            
-            user_data.append(user_info)
+        # Current-period hours come from the rollup in one query
+        active_period = next(
+            (instance for instance in period_instances if current_instance and instance.id == current_instance.id), None
+        )
+        current_period_hours_by_user = {}
+        if active_period:
+            current_period_hours_by_user = dict(
+                UserPeriodHours.objects.filter(
+                    period_instance=active_period
+                ).values_list('user_id', 'total_hours')
+            )
         
-        # 5. Get all locations for this organization
+        # 4. Get all locations for this organization
         locations = Location.objects.filter(org=org)
         locations_data = LocationSerializer(locations, many=True).data
         
-        # Assemble the final response
-        return Response({
+        report = {
             'org_id': org.id,
             'org_name': org.name,
             'active_period_setting': period_setting_data,
             'period_instances': period_instances_data,
-            'users': user_data,
+            'users': [],
             'locations': locations_data
-        })
+        }
+        sessions = Session.objects.filter(user__org=org).select_related('period_instance')
+        
+        if request.query_params.get('stream') in ('1', 'true'):
+            return StreamingHttpResponse(
+                self.stream_report(report, users, sessions, current_period_hours_by_user),
+                content_type='application/json',
+            )
+        
+        # 5. Get data for each user from a fixed number of queries: every org
+        # session is loaded once and bucketed per user
+        sessions_by_user = {}
+        for session in sessions.order_by('-start_time'):
+            sessions_by_user.setdefault(session.user_id, []).append(session)
+        
+        # Share one S3 client across every user's profile picture URL
+        user_context = {}
+        for user in users:
+            report['users'].append(self.serialize_user(
+                user,
+                sessions_by_user.get(user.id, []),
+                current_period_hours_by_user.get(user.id, 0),
+                user_context,
+            ))
+        
+        # Assemble the final response
+        return Response(report)
+
+    def serialize_user(self, user, sessions, current_period_hours, context):
+        user_info = UserSerializer(user, context=context).data
+        
+        # Add group information
+        if user.group:
+            user_info['group'] = {
+                'id': user.group.id,
+                'name': user.group.name
+            }
+        else:
+            user_info['group'] = None
+        
+        # Add user sessions and calculated data
+        user_info['sessions'] = SessionSerializer(sessions, many=True).data
+        user_info['current_period_hours'] = current_period_hours
+        return user_info
+
+    def stream_report(self, report, users, sessions, current_period_hours_by_user):
+        """
+        Yield the report JSON piece by piece. Users and sessions are read with
+        chunked cursors in user order and merged, so only one user's sessions
+        are held in memory at a time.
+        """
+        # Match JSONRenderer's compact output
+        encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+        head = {key: value for key, value in report.items() if key not in ('users', 'locations')}
+        # Splice the users array in at its usual position, before locations
+        yield encoder.encode(head)[:-1] + ',"users":['
+        
+        user_context = {}
+        session_iter = sessions.order_by('user_id', '-start_time').iterator(chunk_size=self.stream_chunk_size)
+        pending = next(session_iter, None)
+        for index, user in enumerate(users.iterator(chunk_size=self.stream_chunk_size)):
+            user_sessions = []
+            # Skip sessions whose user is not in the user cursor (e.g. joined the org mid-stream)
+            while pending is not None and pending.user_id < user.id:
+                pending = next(session_iter, None)
+            while pending is not None and pending.user_id == user.id:
+                user_sessions.append(pending)
+                pending = next(session_iter, None)
+            user_info = self.serialize_user(
+                user,
+                user_sessions,
+                current_period_hours_by_user.get(user.id, 0),
+                user_context,
+            )
+            yield (',' if index else '') + encoder.encode(user_info)
+        
+        yield '],"locations":' + encoder.encode(report['locations']) + '}'
 
 class PeriodSettingViewSet(viewsets.ModelViewSet):
     permission_classes = (IsAdminUser,)
@@ -592,47 +913,26 @@ class PeriodSettingViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         return PeriodSetting.objects.filter(org=self.request.user.org)
 
+    @transaction.atomic
     def perform_create(self, serializer):
+        # Keep concurrent clock-ins from rolling over a period mid-replacement
+        org_advisory_lock(self.request.user.org_id)
+
         # Delete all old period settings for this org (cascades to their instances).
         # Session.period_instance is SET_NULL so study sessions are preserved.
         PeriodSetting.objects.filter(org=self.request.user.org).delete()
 
         period_setting = serializer.save(org=self.request.user.org, is_active=True)
 
-        current_time = timezone.now()
-        org_tz = getattr(period_setting.org, 'timezone', 'UTC')
-        # Normalize to midnight UTC — strips local-time offset from the frontend ISO string
-        inst_start = period_setting.start_date.replace(hour=0, minute=0, second=0, microsecond=0)
-
-        if inst_start > current_time:
-            # Future start date: create just the first period as active
-            due = period_setting.get_next_due_date(from_date=inst_start)
-            if due:
-                instance = PeriodInstance.objects.create(
-                    period_setting=period_setting,
-                    start_date=inst_start,
-                    end_date=period_end_of_day(due, org_tz),
-                    is_active=True,
-                )
-                backfill_sessions_for_instance(instance)
-        else:
-            # Past/current start date: backfill all historical periods (inactive) + current (active)
-            while True:
-                due = period_setting.get_next_due_date(from_date=inst_start)
-                if not due:
-                    break
-                inst_end = period_end_of_day(due, org_tz)
-                is_current = inst_end >= current_time
-                instance = PeriodInstance.objects.create(
-                    period_setting=period_setting,
-                    start_date=inst_start,
-                    end_date=inst_end,
-                    is_active=is_current,
-                )
-                backfill_sessions_for_instance(instance)
-                if is_current:
-                    break
-                inst_start = due + timedelta(days=1)
+        # Generate every historical period (inactive) plus the current one (active) in
+        # memory, then insert them and attach untracked sessions in bulk
+        instances = PeriodInstance.objects.bulk_create(
+            build_period_instances(period_setting, timezone.now())
+        )
+        backfill_sessions_for_instances(period_setting, instances)
+        # bulk_create and queryset updates skip the signals that invalidate cached org data
+        bump_org_data_version(period_setting.org_id)
+        invalidate_active_period(period_setting.org_id)
 
 class PeriodInstanceViewSet(viewsets.ModelViewSet):
     permission_classes = (IsAdminUser,)
@@ -644,16 +944,13 @@ class UserDashboard(RetrieveAPIView):
     serializer_class = UserDashboardSerializer
 
     def get_object(self):
+        # Org-wide data is served from the org dashboard cache, so only prefetch this user's rows
         return User.objects.select_related(
             'org',
-            'last_location'
+            'last_location',
+            'group'
         ).prefetch_related(
-            'sessions',
-            'org__locations',
-            'org__users',
-            'org__users__last_location',
-            'org__period_settings',
-            'org__settings'
+            Prefetch('sessions', queryset=Session.objects.select_related('period_instance'))
         ).get(id=self.request.user.id)
 
 class GetLocation(RetrieveAPIView):
@@ -704,8 +1001,11 @@ class ClockOut(APIView):
             if parsed and parsed < current_time:
                 current_time = parsed
 
-        last_session = Session.objects.filter(user=current_user, hours__isnull=True).last()
-        if last_session and not last_session.hours:
+        with transaction.atomic():
+            # Lock the open session so a double-tap can't close (and count) it twice
+            last_session = open_session_for(current_user, for_update=True)
+            if not last_session:
+                raise exceptions.ValidationError(detail="You are not clocked in")
             start_time = last_session.start_time
             # Clamp end_time to be no earlier than start_time
             if current_time < start_time:
@@ -714,20 +1014,19 @@ class ClockOut(APIView):
             hours = (current_time - start_time).total_seconds() / 3600
             last_session.hours = hours
             last_session.save()
+            record_session_hours(last_session)
             current_user.live = False
             current_user.save()
 
-            #Send Notification to user
+            #Send Notification to user once the session is committed
             location_name = last_session.location.name if last_session.location else "your study location"
-            send_notification_to_users([current_user.id], "Clocked Out", f"Your study session at {location_name} has been ended", notification_type='user_leaves_zone')
+            queue_notification_to_users([current_user.id], "Clocked Out", f"Your study session at {location_name} has been ended", notification_type='user_leaves_zone')
 
-            return Response({
-                "detail": "Successfully clocked out.",
-                "start_time": last_session.start_time,
-                "hours": hours
-            }, status=status.HTTP_200_OK)
-        else:
-            raise exceptions.ValidationError(detail="You are not clocked in")
+        return Response({
+            "detail": "Successfully clocked out.",
+            "start_time": last_session.start_time,
+            "hours": hours
+        }, status=status.HTTP_200_OK)
 
 class ClockIn(APIView):
     permission_classes = (IsAuthenticated,)
@@ -771,41 +1070,50 @@ class ClockIn(APIView):
                     detail=f"You must be inside {location.name} to clock in"
                 )
         
-        last_session = Session.objects.filter(user=current_user, hours__isnull=True).last()
-        if last_session and not last_session.hours:
+        if open_session_for(current_user):
             raise exceptions.ValidationError(detail="Already clocked in")
         
-        # Get or create period instance
-        period_instance = get_or_create_period_instance(current_user, current_time)
+        # Get or create period instance; fresh, since the session row will point at it
+        period_instance = get_or_create_period_instance(current_user, current_time, fresh=True)
         
-        session = Session.objects.create(
-            start_time = current_time,
-            user = current_user,
-            org = org,
-            location = location,
-            period_instance = period_instance,
-            #BEFORE PIC, AFTER PIC LATER
-        )
-
-        current_user.live = True
-        current_user.last_location = location
-        current_user.save()
-
-        # Notify all users in the org except the one who just clocked in
         location_name = location.name if location else "an unverified location"
         user_name = f"{current_user.first_name} {current_user.last_name}".strip()
-        send_notification_to_org(
-            org_id=org.id,
-            title="Someone Started Studying!",
-            body=f"{user_name} is now studying at {location_name}.",
-            data={
-                "type": "user_studying",
-                "user_id": current_user.id,
-                "user_name": user_name,
-                "location": location_name
-            },
-            notification_type='org_starts_studying'
-        )
+        try:
+            with transaction.atomic():
+                session = Session.objects.create(
+                    start_time = current_time,
+                    user = current_user,
+                    org = org,
+                    location = location,
+                    period_instance = period_instance,
+                    #BEFORE PIC, AFTER PIC LATER
+                )
+
+                current_user.live = True
+                current_user.last_location = location
+                current_user.save()
+
+                # Notify all users in the org except the one who just clocked in;
+                # the worker sends it, so clock-in never waits on Expo
+                queue_notification_to_org(
+                    org_id=org.id,
+                    title="Someone Started Studying!",
+                    body=f"{user_name} is now studying at {location_name}.",
+                    data={
+                        "type": "user_studying",
+                        "user_id": current_user.id,
+                        "user_name": user_name,
+                        "location": location_name
+                    },
+                    notification_type='org_starts_studying',
+                    exclude_user_id=current_user.id,
+                )
+        except IntegrityError:
+            # A concurrent clock-in won the one_open_session_per_user constraint; any
+            # other integrity error is a real failure
+            if not open_session_for(current_user):
+                raise
+            raise exceptions.ValidationError(detail="Already clocked in")
 
         return Response({
             "detail": "Successfully clocked in.",
@@ -847,15 +1155,17 @@ class ManualSessionView(APIView):
         if parsed_start > timezone.now() + timedelta(minutes=1):
             raise exceptions.ValidationError(detail="Manual study time cannot be in the future")
 
-        period_instance = get_or_create_period_instance(current_user, parsed_start)
-        session = Session.objects.create(
-            start_time=parsed_start,
-            hours=hours,
-            user=current_user,
-            org=org,
-            location=None,
-            period_instance=period_instance,
-        )
+        period_instance = get_or_create_period_instance(current_user, parsed_start, fresh=True)
+        with transaction.atomic():
+            session = Session.objects.create(
+                start_time=parsed_start,
+                hours=hours,
+                user=current_user,
+                org=org,
+                location=None,
+                period_instance=period_instance,
+            )
+            record_session_hours(session)
         return Response(SessionSerializer(session).data, status=status.HTTP_201_CREATED)
         
 
@@ -1370,39 +1680,19 @@ class SendNotificationView(APIView):
                 status=status.HTTP_404_NOT_FOUND
             )
             
-        # Prepare notification data
-        notification_data = {
-            'to': token_strings,
-            'title': title,
-            'body': body,
-            'data': data,
-            'sound': 'default',
-        }
-        
         # Send to Expo Push API
-        try:
-            response = requests.post(
-                'https://exp.host/--/api/v2/push/send',
-                data=json.dumps(notification_data),
-                headers={
-                    'Content-Type': 'application/json',
-                    'Accept': 'application/json',
-                    'Accept-Encoding': 'gzip, deflate'
-                }
-            )
-            
-            expo_response = response.json()
-            
-            return Response({
-                "detail": f"Notification sent to {len(token_strings)} devices",
-                "expo_response": expo_response
-            }, status=status.HTTP_200_OK)
-            
-        except Exception as e:
+        expo_response = send_push_notification(token_strings, title, body, data)
+        if expo_response.get('transport_failed'):
             return Response({
                 "detail": "Failed to send notification",
-                "error": str(e)
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+                "error": expo_response["error"],
+                "expo_response": expo_response
+            }, status=status.HTTP_502_BAD_GATEWAY)
+
+        return Response({
+            "detail": f"Notification sent to {len(token_strings)} devices",
+            "expo_response": expo_response
+        }, status=status.HTTP_200_OK)
 
 class AdminSessionView(RetrieveUpdateDestroyAPIView):
     """
@@ -1458,12 +1748,12 @@ class AdminSessionView(RetrieveUpdateDestroyAPIView):
         # If we're setting hours for an in-progress session, update user's live status
         if session.hours is None and hours_value is not None:
             user = session.user
-            user.live = False
+            user.live = open_session_for(user) is not None
             user.save()
             
             # Optional: Send notification to user about admin ending their session
             try:
-                send_notification_to_users(
+                queue_notification_to_users(
                     [user.id], 
                     "Session Ended", 
                     f"Your study session at {session.location.name} has been ended by an admin"
@@ -1483,7 +1773,7 @@ class AdminSessionView(RetrieveUpdateDestroyAPIView):
             
             # Optional: Send notification to user about admin deleting their session
             try:
-                send_notification_to_users(
+                queue_notification_to_users(
                     [user.id], 
                     "Session Deleted", 
                     f"Your study session at {instance.location.name} has been deleted by an admin"
@@ -1492,16 +1782,24 @@ class AdminSessionView(RetrieveUpdateDestroyAPIView):
                 # Log error but don't block the deletion
                 print(f"Error sending notification: {str(e)}")
                 
-        instance.delete()
+        with transaction.atomic():
+            user_id, period_instance_id = instance.user_id, instance.period_instance_id
+            had_hours = instance.hours is not None
+            instance.delete()
+            if had_hours and period_instance_id:
+                refresh_user_period_hours(user_id, period_instance_id)
     
     def perform_update(self, serializer):
-        serializer.save()
+        previous_hours = serializer.instance.hours
+        with transaction.atomic():
+            serializer.save()
+            record_session_hours(serializer.instance, previous_hours=previous_hours)
         
         # Send notification for regular updates (already handled for in-progress sessions in update method)
         session = serializer.instance
         if session.hours is not None:
             try:
-                send_notification_to_users(
+                queue_notification_to_users(
                     [session.user.id], 
                     "Session Updated", 
                     f"Your study session at {session.location.name} has been updated by an admin"
@@ -1886,7 +2184,8 @@ class BillingSubscriptionCancelView(APIView):
 
 class StripeWebhookView(APIView):
     """
-    Receives Stripe billing events and keeps organization premium state in sync.
+    Receives Stripe billing events and records them in the BillingEvent ledger;
+    process_billing_events applies them to organization premium state.
     """
     permission_classes = (AllowAny,)
     authentication_classes = ()
@@ -1907,73 +2206,27 @@ class StripeWebhookView(APIView):
         except stripe.SignatureVerificationError:
             return Response({"detail": "Invalid signature"}, status=status.HTTP_400_BAD_REQUEST)
 
+        event_id = stripe_get(event, 'id')
         event_type = stripe_get(event, 'type')
-        event_object = stripe_nested_get(event, ('data', 'object'), {})
-
-        if event_type in {'checkout.session.completed', 'checkout.session.async_payment_succeeded'}:
-            org_id = stripe_nested_get(event_object, ('metadata', 'org_id')) or stripe_get(event_object, 'client_reference_id')
-            if org_id:
-                try:
-                    org = Org.objects.get(id=org_id)
-                except Org.DoesNotExist:
-                    org = None
-
-                if org:
-                    subscription_id = stripe_id(stripe_get(event_object, 'subscription'))
-                    subscription = None
-                    if subscription_id:
-                        try:
-                            subscription = stripe.Subscription.retrieve(subscription_id)
-                        except stripe.error.StripeError:
-                            subscription = None
-
-                    if subscription:
-                        sync_org_from_stripe_subscription(
-                            org,
-                            subscription,
-                            customer_id=stripe_id(stripe_get(event_object, 'customer')),
-                        )
-                    else:
-                        sync_org_subscription(
-                            org,
-                            subscription_id=subscription_id,
-                            customer_id=stripe_id(stripe_get(event_object, 'customer')),
-                            status_value='trialing',
-                        )
-
-        elif event_type in {
-            'customer.subscription.created',
-            'customer.subscription.updated',
-            'customer.subscription.deleted',
-            'customer.subscription.paused',
-            'customer.subscription.pending_update_applied',
-            'customer.subscription.pending_update_expired',
-            'customer.subscription.resumed',
-            'customer.subscription.trial_will_end',
-        }:
-            subscription_id = stripe_get(event_object, 'id')
-            customer_id = stripe_id(stripe_get(event_object, 'customer'))
-            org = org_for_stripe_billing_event(
-                subscription_id=subscription_id,
-                customer_id=customer_id,
-                metadata=stripe_get(event_object, 'metadata', {}),
-            )
+        if not event_id:
+            return Response({"detail": "Invalid payload"}, status=status.HTTP_400_BAD_REQUEST)
+        if event_type not in STRIPE_HANDLED_EVENT_TYPES:
+            return Response({"received": True, "ignored": True}, status=status.HTTP_200_OK)
 
-            if org:
-                sync_org_from_stripe_subscription(
-                    org,
-                    customer_id=customer_id,
-                    subscription=event_object,
+        # Record and acknowledge; process_billing_events applies it. The unique event id
+        # turns Stripe redeliveries into a no-op insert.
+        event_data = event.to_dict() if hasattr(event, 'to_dict') else event
+        try:
+            with transaction.atomic():
+                BillingEvent.objects.create(
+                    stripe_event_id=event_id,
+                    event_type=event_type,
+                    org=org_for_stripe_event(event_type, stripe_nested_get(event_data, ('data', 'object'), {})),
+                    stripe_created=stripe_timestamp_to_datetime(stripe_get(event, 'created')) or timezone.now(),
+                    payload=event_data,
                 )
-
-        elif event_type in {
-            'invoice.paid',
-            'invoice.payment_succeeded',
-            'invoice.payment_failed',
-            'invoice.marked_uncollectible',
-            'invoice.voided',
-        }:
-            sync_org_from_stripe_invoice(event_object)
+        except IntegrityError:
+            return Response({"received": True, "duplicate": True}, status=status.HTTP_200_OK)
 
         return Response({"received": True}, status=status.HTTP_200_OK)
 
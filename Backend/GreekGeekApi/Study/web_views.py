@@ -4,12 +4,14 @@ from django.core.validators import validate_email
 from django.http import FileResponse
 from django.http import Http404
 from django.shortcuts import render
+from django.urls import reverse
 from django.views.generic import TemplateView
 from django.contrib.auth.decorators import login_required
 from django.utils.decorators import method_decorator
 from django.http import JsonResponse
 from rest_framework_simplejwt.tokens import RefreshToken
 
+from .cache import cached_page
 from .models import EmailVerificationToken
 
 SUPPORT_ARTICLES = [
@@ -268,6 +270,7 @@ class DashboardPageView(TemplateView):
     """Organization admin dashboard view"""
     template_name = 'dashboard.html'
 
+@cached_page
 def landing_page(request):
     """Landing page function-based view"""
     return render(request, 'landing.html')
@@ -341,14 +344,17 @@ def verify_email_page(request, token):
 
     return render(request, 'verify-email.html', context)
 
+@cached_page
 def privacy_page(request):
     """Privacy policy page."""
     return render(request, 'privacy.html')
 
+@cached_page
 def terms_page(request):
     """Terms of service page."""
     return render(request, 'terms.html')
 
+@cached_page
 def cookies_page(request):
     """Cookie policy page."""
     return render(request, 'cookies.html')
@@ -415,10 +421,12 @@ def contact_page(request):
 
     return render(request, 'contact.html', context)
 
+@cached_page
 def compare_index(request):
     """SEO comparison hub for study-hour tracking alternatives."""
     return render(request, 'compare/index.html', {'pages': COMPARISON_PAGES})
 
+@cached_page
 def compare_page(request, slug):
     """Product comparison detail page."""
     page = COMPARISON_PAGES_BY_SLUG.get(slug)
@@ -430,10 +438,12 @@ def compare_page(request, slug):
         'related_pages': related_pages,
     })
 
+@cached_page
 def support_index(request):
     """Support hub with SEO-focused app help articles."""
     return render(request, 'support/index.html', {'articles': SUPPORT_ARTICLES})
 
+@cached_page
 def support_article(request, slug):
     """Support article detail page."""
     article = SUPPORT_ARTICLES_BY_SLUG.get(slug)
@@ -444,3 +454,16 @@ def support_article(request, slug):
         'article': article,
         'related_articles': related_articles,
     })
+
+def prerendered_page_paths():
+    """URL paths of every public page that prerender_site writes out and lists in sitemap.xml."""
+    return [
+        reverse('landing-page'),
+        reverse('privacy-page'),
+        reverse('terms-page'),
+        reverse('cookies-page'),
+        reverse('compare-index'),
+        *(reverse('compare-page', args=[page['slug']]) for page in COMPARISON_PAGES),
+        reverse('support-index'),
+        *(reverse('support-article', args=[article['slug']]) for article in SUPPORT_ARTICLES),
+    ]
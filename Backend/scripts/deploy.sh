@@ -20,6 +20,7 @@ do
     exit 1
   }
 done
+python3 manage.py prerender_site
 python3 manage.py migrate --noinput
 sudo -n systemctl restart gunicorn
 sudo -n systemctl restart nginx